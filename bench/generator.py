@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# Synthetic drawio-style SVG diagrams, with their mxfile (for benchmarks)
+# usage: python3 -m bench.generator SIZE OUTPUT [--mix rect=4,label=4,...] [--seed N] [--no-mxfile] [--uncompressed]
+import sys
+import zlib
+import base64
+import random
+import struct
+import argparse
+import urllib.parse
+from xml.sax.saxutils import escape
+
+#################################
+# GENERATOR: grid of drawio cells, each one converted by drawio into 1 or 2 svg elements
+#################################
+# - rect:      vertex without label                => <rect>
+# - label:     vertex with an html label           => <rect> + <switch><foreignObject> (html) + <text>
+# - path:      edge with a long chain of lines     => <path d="M L L ...">
+# - quadratic: curved edge                         => <path d="M Q Q ...">
+# - image:     vertex with an embedded png         => <image xlink:href="data:image/png;base64,...">
+# The mxfile (compressed as drawio does by default) is stored in the `content` attribute of the root, the cells
+# are in the drawing order of the svg: the conversion can align them (see MxGraph.annotate).
+
+MIX = {'rect': 4, 'label': 4, 'path': 2, 'quadratic': 1, 'image': 1}
+SIZES = {'1k': 1000, '10k': 10000, '100k': 100000, '1m': 1000000}
+PATH_LENGTH = 24 # segments of the generated edges
+IMAGES = 4 # distinct embedded images (drawio diagrams usually reuse a few icons)
+
+CELL_WIDTH = 160
+CELL_HEIGHT = 100
+
+def parseSize(spec):
+  # 1k, 10k, 100k, 1m or any number of cells
+  return SIZES[spec.lower()] if spec.lower() in SIZES else int(spec)
+
+def parseMix(spec):
+  # rect=4,label=4,path=2,quadratic=1,image=1 (missing kinds are not generated)
+  mix = {}
+  for item in spec.split(','):
+    (kind, _, weight) = item.partition('=')
+    if kind not in MIX:
+      raise ValueError("unknown kind of cell: {} (expected one of {})".format(kind, ', '.join(MIX)))
+    mix[kind] = float(weight) if weight else 1.0
+  return mix
+
+def getPng(rgb):
+  # valid 1x1 png of the given color
+  def chunk(tag, data):
+    return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data))
+  header = struct.pack('>IIBBBBB', 1, 1, 8, 2, 0, 0, 0)
+  return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(b'\x00' + bytes(rgb)))
+    + chunk(b'IEND', b''))
+
+def n(value):
+  # drawio coordinates: at most 2 decimals
+  return '{:.2f}'.format(value).rstrip('0').rstrip('.')
+
+def iterCells(cells, mix, seed, pathLength=PATH_LENGTH):
+  """ Yields (index, kind, x, y, data) for each cell, identical for a given seed
+  data: fill & stroke colors (rect, label), points (path, quadratic) or image index
+  """
+  rnd = random.Random(seed)
+  palette = ['#{:06x}'.format(rnd.randrange(1 << 24)) for _ in range(16)]
+  kinds = list(mix)
+  weights = [mix[kind] for kind in kinds]
+  columns = max(1, int(cells ** 0.5))
+  for index in range(cells):
+    kind = rnd.choices(kinds, weights)[0]
+    x = (index % columns) * CELL_WIDTH + 20
+    y = (index // columns) * CELL_HEIGHT + 20
+    match kind:
+      case 'rect' | 'label':
+        data = (rnd.choice(palette), rnd.choice(palette))
+      case 'path' | 'quadratic':
+        count = pathLength + 1 if kind == 'path' else 2 * pathLength + 1
+        data = [(x + rnd.uniform(0, 120), y + rnd.uniform(0, 60)) for _ in range(count)]
+        data = (rnd.choice(palette), data)
+      case 'image':
+        data = rnd.randrange(IMAGES)
+    yield (index, kind, x, y, data)
+
+def getLabel(index):
+  return "Node {}<br>cell".format(index) if index % 4 == 0 else "Node {}".format(index)
+
+def getStyle(kind, data, images):
+  match kind:
+    case 'rect' | 'label':
+      return "rounded=0;whiteSpace=wrap;html=1;fillColor={};strokeColor={};".format(*data)
+    case 'path':
+      return "endArrow=none;html=1;strokeColor={};".format(data[0])
+    case 'quadratic':
+      return "endArrow=none;html=1;curved=1;strokeColor={};".format(data[0])
+    case 'image':
+      return "shape=image;html=1;imageAspect=0;aspect=fixed;image=data:image/png,{};".format(images[data])
+
+def getMxCell(cell, images):
+  (index, kind, x, y, data) = cell
+  style = escape(getStyle(kind, data, images), {'"': '&quot;'})
+  if kind in ('path', 'quadratic'):
+    points = data[1]
+    inner = ''.join('<mxPoint x="{}" y="{}"/>'.format(n(px), n(py)) for (px, py) in points[1:-1])
+    return ('<mxCell id="c{}" style="{}" edge="1" parent="1"><mxGeometry width="50" height="50" relative="1" as="geometry">'
+      '<mxPoint x="{}" y="{}" as="sourcePoint"/><mxPoint x="{}" y="{}" as="targetPoint"/><Array as="points">{}</Array>'
+      '</mxGeometry></mxCell>').format(index, style, n(points[0][0]), n(points[0][1]), n(points[-1][0]), n(points[-1][1]), inner)
+  (width, height) = (60, 60) if kind == 'image' else (120, 60)
+  value = escape(getLabel(index), {'"': '&quot;'}) if kind == 'label' else ''
+  return ('<mxCell id="c{}" value="{}" style="{}" vertex="1" parent="1">'
+    '<mxGeometry x="{}" y="{}" width="{}" height="{}" as="geometry"/></mxCell>').format(index, value, style, x, y, width, height)
+
+def iterModel(cells, mix, seed, images):
+  yield '<mxGraphModel dx="1000" dy="1000" grid="1" gridSize="10"><root><mxCell id="0"/><mxCell id="1" parent="0"/>'
+  for cell in iterCells(cells, mix, seed):
+    yield getMxCell(cell, images)
+  yield '</root></mxGraphModel>'
+
+def getSvgElement(cell, images):
+  (index, kind, x, y, data) = cell
+  match kind:
+    case 'rect':
+      return '<rect x="{}" y="{}" width="120" height="60" fill="{}" stroke="{}" pointer-events="all"/>'.format(x, y, *data)
+    case 'label':
+      label = getLabel(index).replace('<br>', '<br />')
+      text = escape(label.split('<br')[0])
+      return ('<rect x="{x}" y="{y}" width="120" height="60" fill="{fill}" stroke="{stroke}" pointer-events="all"/>'
+        '<g transform="translate(-0.5 -0.5)"><switch><foreignObject pointer-events="none" width="100%" height="100%" '
+        'requiredFeatures="http://www.w3.org/TR/SVG11/feature#Extensibility" style="overflow: visible; text-align: left;">'
+        '<div xmlns="http://www.w3.org/1999/xhtml" style="display: flex; align-items: unsafe center; justify-content: unsafe center; '
+        'width: 118px; height: 1px; padding-top: {top}px; margin-left: {left}px;"><div data-drawio-colors="color: rgb(0, 0, 0); " '
+        'style="box-sizing: border-box; font-size: 0px; text-align: center;"><div style="display: inline-block; font-size: 12px; '
+        'font-family: Helvetica; color: rgb(0, 0, 0); line-height: 1.2; pointer-events: all; white-space: normal; '
+        'overflow-wrap: normal;">{label}</div></div></div></foreignObject><text x="{cx}" y="{ty}" fill="rgb(0, 0, 0)" '
+        'font-family="Helvetica" font-size="12px" text-anchor="middle">{text}</text></switch></g>').format(
+          x=x, y=y, fill=data[0], stroke=data[1], top=y + 30, left=x + 1, label=label, cx=x + 60, ty=y + 34, text=text)
+    case 'path':
+      (stroke, points) = data
+      d = 'M {} {} '.format(n(points[0][0]), n(points[0][1])) + ' '.join('L {} {}'.format(n(px), n(py)) for (px, py) in points[1:])
+      return '<path d="{}" fill="none" stroke="{}" stroke-miterlimit="10" pointer-events="stroke"/>'.format(d, stroke)
+    case 'quadratic':
+      (stroke, points) = data
+      d = ['M {} {}'.format(n(points[0][0]), n(points[0][1]))]
+      for i in range(1, len(points) - 1, 2):
+        d.append('Q {} {} {} {}'.format(n(points[i][0]), n(points[i][1]), n(points[i + 1][0]), n(points[i + 1][1])))
+      return '<path d="{}" fill="none" stroke="{}" stroke-miterlimit="10" pointer-events="stroke"/>'.format(' '.join(d), stroke)
+    case 'image':
+      return ('<image x="{}" y="{}" width="60" height="60" xlink:href="data:image/png;base64,{}" '
+        'preserveAspectRatio="none"/>').format(x, y, images[data])
+
+def generate(out, cells, mix=MIX, seed=0, mxfile=True, compressed=True):
+  """ Writes a synthetic drawio svg of the given number of cells to the text file object out
+  The svg and the mxfile are generated on the fly (the whole diagram is never kept in memory)
+  """
+  rnd = random.Random(seed)
+  images = [base64.b64encode(getPng([rnd.randrange(256) for _ in range(3)])).decode() for _ in range(IMAGES)]
+  columns = max(1, int(cells ** 0.5))
+  width = columns * CELL_WIDTH + 40
+  height = ((cells - 1) // columns + 1) * CELL_HEIGHT + 40
+
+  out.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<!DOCTYPE svg PUBLIC "-//W3C//DTD SVG 1.1//EN" "http://www.w3.org/Graphics/SVG/1.1/DTD/svg11.dtd">\n'
+    '<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" version="1.1" '
+    'width="{w}px" height="{h}px" viewBox="-0.5 -0.5 {w} {h}"'.format(w=width, h=height))
+  if mxfile:
+    out.write(' content="' + escape('<mxfile host="svg2tikz-bench"><diagram id="bench" name="Page-1">', {'"': '&quot;'}))
+    if compressed:
+      # drawio: base64 of the raw deflate of the url-encoded model
+      deflate = zlib.compressobj(9, zlib.DEFLATED, -15)
+      payload = []
+      for chunk in iterModel(cells, mix, seed, images):
+        payload.append(deflate.compress(urllib.parse.quote(chunk, safe="~()*!.'").encode()))
+      payload.append(deflate.flush())
+      out.write(base64.b64encode(b''.join(payload)).decode())
+    else:
+      out.write('\n')
+      for chunk in iterModel(cells, mix, seed, images):
+        out.write(escape(chunk, {'"': '&quot;'}))
+    out.write(escape('</diagram></mxfile>') + '"')
+  out.write('><defs/><g>')
+  for cell in iterCells(cells, mix, seed):
+    out.write(getSvgElement(cell, images))
+  out.write('</g><switch><g requiredFeatures="http://www.w3.org/TR/SVG11/feature#Extensibility"/>'
+    '<a transform="translate(0,-5)" xlink:href="https://www.diagrams.net/doc/faq/svg-export-text-problems" target="_blank">'
+    '<text text-anchor="middle" font-size="10px" x="50%" y="100%">Text is not SVG - cannot display</text></a></switch></svg>\n')
+
+def main():
+  parser = argparse.ArgumentParser(prog='bench.generator', description='Generate a synthetic drawio svg')
+  parser.add_argument('size', help='number of cells (or 1k, 10k, 100k, 1m)')
+  parser.add_argument('output')
+  parser.add_argument('--mix', default=None, help='weights of the kinds of cells, e.g. rect=4,label=4,path=2,quadratic=1,image=1')
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--no-mxfile', action='store_true')
+  parser.add_argument('--uncompressed', action='store_true')
+  args = parser.parse_args()
+
+  with open(args.output, 'w') as file:
+    generate(file, parseSize(args.size), parseMix(args.mix) if args.mix else MIX, args.seed, not args.no_mxfile, not args.uncompressed)
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# Microbenchmark of the svg path scanner (lib/pathparser.py)
+# usage: python3 -m bench.path_scanner [segments] [repeat]
+import os
+import sys
+import time
+import random
+import yaml
+
+import lib
+from lib import context,vector
+from lib.pathparser import scanPath
+from lib.svgparser import cmdToPath
+
+def drawioPath(segments, rnd):
+  # absolute commands separated by spaces, as produced by drawio
+  res = ["M {} {}".format(rnd.randint(0, 1000), rnd.randint(0, 1000))]
+  for index in range(segments):
+    match index % 4:
+      case 0 | 1:
+        res.append("L {} {}".format(round(rnd.uniform(0, 1000), 2), round(rnd.uniform(0, 1000), 2)))
+      case 2:
+        res.append("C {} {} {} {} {} {}".format(*[round(rnd.uniform(0, 1000), 2) for _ in range(6)]))
+      case 3:
+        res.append("Q {} {} {} {}".format(*[round(rnd.uniform(0, 1000), 2) for _ in range(4)]))
+  return " ".join(res)
+
+def compactPath(segments, rnd):
+  # relative & packed syntax, implicit repetitions, all commands
+  res = ["m{},{}".format(rnd.randint(0, 1000), rnd.randint(0, 1000))]
+  for index in range(segments):
+    match index % 8:
+      case 0:
+        res.append("l{}-{}".format(rnd.randint(1, 9), rnd.randint(1, 9)))
+      case 1:
+        res.append(" .5.5") # implicit relative line, packed numbers
+      case 2:
+        res.append("h{}".format(rnd.randint(-9, 9)))
+      case 3:
+        res.append("v{}e-1".format(rnd.randint(-9, 9)))
+      case 4:
+        res.append("c1,2 3,4 5,6s1 2 3 4")
+      case 5:
+        res.append("q1-1 2 0t2 0")
+      case 6:
+        res.append("a5 5 0 0110 10")
+      case 7:
+        res.append("z")
+  return "".join(res)
+
+# previous char-by-char tokenizer (token dicts), kept here as reference
+def legacyTokenize(txt):
+  tokens = []
+  buffer = ''
+  for char in txt:
+    if char.isspace():
+      if buffer:
+        tokens += [{'type': 'number', 'value': float(e)} for e in buffer.split(',')]
+        buffer = ''
+    elif char.isalpha():
+      tokens.append({'type': 'cmd', 'value': char})
+    else:
+      buffer += char
+  if buffer:
+    tokens += [{'type': 'number', 'value': float(e)} for e in buffer.split(',')]
+  return tokens
+
+def measure(name, fn, txt, segments, repeat):
+  best = None
+  for _ in range(repeat):
+    start = time.perf_counter()
+    fn(txt)
+    elapsed = time.perf_counter() - start
+    best = elapsed if best is None else min(best, elapsed)
+  print("{:<28} {:>8.1f} ms {:>10.0f} segments/s {:>8.2f} MB/s".format(
+    name, best * 1000, segments / best, len(txt) / best / (1024.0 * 1024.0)))
+
+def main():
+  segments = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+  repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+  rnd = random.Random(0)
+  drawio = drawioPath(segments, rnd)
+  compact = compactPath(segments, rnd)
+  print("{} segments ; drawio path: {:.1f} MB ; compact path: {:.1f} MB".format(
+    segments, len(drawio) / (1024.0 * 1024.0), len(compact) / (1024.0 * 1024.0)))
+
+  measure("legacy tokenizer (drawio)", legacyTokenize, drawio, segments, repeat)
+  measure("scanPath (drawio)", lambda txt: list(scanPath(txt)), drawio, segments, repeat)
+  with open(os.path.join(os.path.dirname(lib.__file__), "config_default.yml")) as file:
+    conf = yaml.safe_load(file)
+  measure("cmdToPath (drawio)", lambda txt: cmdToPath(scanPath(txt), conf), drawio, segments, repeat)
+  (path, _) = cmdToPath(scanPath(drawio), conf)
+  with context.Context(conf).use():
+    vector.ENABLED = False
+    measure("PathData.toTikz (drawio)", lambda txt: path.toTikz(), drawio, segments, repeat)
+    if vector.numpy is not None:
+      vector.ENABLED = True
+      measure("PathData.toTikz numpy (drawio)", lambda txt: path.toTikz(), drawio, segments, repeat)
+  measure("scanPath (compact)", lambda txt: list(scanPath(txt)), compact, segments, repeat)
+
+if __name__ == "__main__":
+  main()
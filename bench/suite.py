@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# Benchmark suite: conversion stages of synthetic diagrams at scale (see bench/generator.py)
+# usage: python3 -m bench.suite [--sizes 1k,10k,100k] [--json FILE] [--baseline FILE] [--config FILE]
+#   --json stores the results, which can then be given as --baseline of a later run (exit code 1 on regression)
+import io
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import resource
+import tempfile
+import contextlib
+import multiprocessing
+import xml.etree.ElementTree as xml
+from concurrent.futures import ProcessPoolExecutor
+
+import lib
+from lib import context,pipeline,batch,emitter,svgparser,vector
+from lib.common import openAtomic
+from lib.config import App
+from lib.mxparser import MxGraph
+from lib.htmlparser import processHTML
+from lib.pathparser import scanPath
+from lib.svgparser import cmdToPath
+from bench import generator
+
+SVG_PATH = '{http://www.w3.org/2000/svg}path'
+SVG_SWITCH = '{http://www.w3.org/2000/svg}switch'
+SVG_FOREIGN = '{http://www.w3.org/2000/svg}foreignObject'
+
+# the default config of the tree, wherever it is run from
+App.DEFAULT_CONF = os.path.join(os.path.dirname(lib.__file__), 'config_default.yml')
+
+def getInput(workdir, size, mix, seed):
+  # generated once per set of parameters
+  name = "bench-{}-{}-{}.svg".format(size, seed, '_'.join('{}{:g}'.format(k, mix[k]) for k in sorted(mix)))
+  path = os.path.join(workdir, name)
+  if not os.path.exists(path):
+    print("[INFO] Generating {}".format(path))
+    with openAtomic(path) as file:
+      generator.generate(file, generator.parseSize(size), mix, seed)
+  return path
+
+def getConf(path, workdir, configFile=None):
+  conf = App.build(configFile, {'OUTPUT_DIR': os.path.join(workdir, 'out')})
+  return App.build(overrides=batch.getOverrides(path, conf), base=conf)
+
+def best(fn, repeat):
+  # best time of repeat runs, with the result of the last one
+  elapsed = None
+  for _ in range(repeat):
+    start = time.perf_counter()
+    res = fn()
+    duration = time.perf_counter() - start
+    elapsed = duration if elapsed is None else min(elapsed, duration)
+  return (elapsed, res)
+
+def timeStages(path, conf, repeat):
+  """ Times each stage separately, on the inputs produced by the previous stages
+  """
+  stages = {}
+  tree = xml.parse(path)
+  root = tree.getroot()
+  paths = [elem.attrib['d'] for elem in root[1].iter(SVG_PATH)]
+  labels = [switch[0] for switch in root[1].iter(SVG_SWITCH) if len(switch) and switch[0].tag == SVG_FOREIGN]
+
+  with context.Context(conf).use(), contextlib.redirect_stdout(io.StringIO()):
+    (stages['scanPath'], commands) = best(lambda: [list(scanPath(d)) for d in paths], repeat)
+    (stages['cmdToPath'], _) = best(lambda: [cmdToPath(iter(c), conf) for c in commands], repeat)
+    (stages['processHTML'], _) = best(lambda: [processHTML(label[0], [label.attrib]) for label in labels], repeat)
+    if 'content' in root.attrib:
+      (stages['mxfile decode'], diagram) = best(lambda: MxGraph.getEmbeddedDrawDiagram(root.attrib['content']), repeat)
+      def parse():
+        mxgraph = MxGraph()
+        mxgraph.parseMxDiagram(diagram)
+        return mxgraph
+      (stages['parseMxDiagram'], mxgraph) = best(parse, repeat)
+    (stages['processGroup'], ir) = best(lambda: svgparser.processGroup(root[1]), repeat)
+    if 'content' in root.attrib:
+      (stages['annotate'], _) = best(lambda: mxgraph.annotate(ir), repeat)
+    (stages['emitTikz'], _) = best(lambda: emitter.emitTikz(ir), repeat)
+  return stages
+
+def runConversion(conf):
+  # in a fresh process: the peak memory is the one of this conversion only
+  with contextlib.redirect_stdout(io.StringIO()):
+    start = time.perf_counter()
+    pipeline.convert(ctx=context.Context(conf))
+    elapsed = time.perf_counter() - start
+  # kilobytes on linux, bytes on macos
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  return (elapsed, peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0)
+
+def runEndToEnd(conf, repeat):
+  elapsed = []
+  for _ in range(repeat):
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+      elapsed.append(pool.submit(runConversion, conf).result())
+  return (min(e[0] for e in elapsed), max(e[1] for e in elapsed))
+
+def runSuite(sizes, mix, seed, workdir, configFile=None, repeat=1):
+  results = {}
+  for size in sizes:
+    path = getInput(workdir, size, mix, seed)
+    conf = getConf(path, workdir, configFile)
+    print("[INFO] Benchmark of {} cells ({:.1f} MB)".format(size, os.path.getsize(path) / (1024.0 * 1024.0)))
+    stages = timeStages(path, conf, repeat)
+    (stages['end to end'], peak) = runEndToEnd(conf, repeat)
+    results[size] = {
+      'cells': generator.parseSize(size),
+      'bytes': os.path.getsize(path),
+      'seconds': stages,
+      'peak_rss_mb': peak
+    }
+    for (stage, seconds) in stages.items():
+      print("  {:<16} {:>10.3f} s".format(stage, seconds))
+    print("  {:<16} {:>10.1f} MB".format('peak memory', peak))
+  return results
+
+def compare(results, baseline, tolerance):
+  """ Prints the ratio of each measure to the baseline, returns the regressions (ratio above 1 + tolerance)
+  """
+  regressions = []
+  for (size, res) in results.items():
+    if size not in baseline['results']:
+      continue
+    old = baseline['results'][size]
+    measures = [(stage, res['seconds'][stage], old['seconds'].get(stage)) for stage in res['seconds']]
+    measures.append(('peak memory', res['peak_rss_mb'], old.get('peak_rss_mb')))
+    print("[INFO] {} cells, compared to the baseline:".format(size))
+    for (name, value, reference) in measures:
+      if not reference:
+        continue
+      ratio = value / reference
+      regression = ratio > 1 + tolerance
+      if regression:
+        regressions.append((size, name, ratio))
+      print("  {:<16} {:>8.2f}x{}".format(name, ratio, "  REGRESSION" if regression else ""))
+  return regressions
+
+def main():
+  parser = argparse.ArgumentParser(prog='bench.suite', description='Benchmark the conversion of synthetic diagrams')
+  parser.add_argument('--sizes', default='1k,10k,100k', help='numbers of cells, comma separated (1k, 10k, 100k, 1m or any number)')
+  parser.add_argument('--mix', default=None, help='weights of the kinds of cells, e.g. rect=4,label=4,path=2,quadratic=1,image=1')
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--repeat', type=int, default=1, help='runs of each measure (the best time is kept)')
+  parser.add_argument('--config', default=None, help='config file of the conversions (input and output are set by the suite)')
+  parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'svg2tikz-bench'),
+    help='directory of the generated diagrams (kept across runs) and of the outputs')
+  parser.add_argument('--json', default=None, metavar='FILE', help='store the results')
+  parser.add_argument('--baseline', default=None, metavar='FILE', help='results of a previous run to compare with')
+  parser.add_argument('--tolerance', type=float, default=0.15, help='relative slowdown reported as a regression')
+  args = parser.parse_args()
+
+  os.makedirs(args.workdir, exist_ok=True)
+  mix = generator.parseMix(args.mix) if args.mix else generator.MIX
+  results = runSuite(args.sizes.split(','), mix, args.seed, args.workdir, args.config, args.repeat)
+  data = {
+    'meta': {
+      'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+      'python': platform.python_version(),
+      'platform': platform.platform(),
+      'numpy': vector.numpy is not None,
+      'mix': mix,
+      'seed': args.seed,
+      'repeat': args.repeat
+    },
+    'results': results
+  }
+  if args.json:
+    with open(args.json, 'w') as file:
+      json.dump(data, file, indent=2)
+    print("[INFO] Results stored in {}".format(args.json))
+
+  if args.baseline:
+    with open(args.baseline) as file:
+      baseline = json.load(file)
+    regressions = compare(results, baseline, args.tolerance)
+    for (size, name, ratio) in regressions:
+      print("[WARN] {} of {} cells: {:.2f}x the baseline".format(name, size, ratio))
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+  main()
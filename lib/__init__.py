@@ -1 +1 @@
-__all__ = ["common", "defs", "config", "colors", "font", "svgparser", "mxparser", "htmlparser"]
\ No newline at end of file
+__all__ = ["common", "defs", "context", "profiling", "diagnostics", "config", "colors", "font", "asar", "pathparser", "vector", "pathdata", "bounds", "instancing", "svgparser", "alignment", "mxfile", "mxparser", "htmlparser", "fragments", "layers", "pipeline", "batch", "watch", "daemon", "client", "api"]
\ No newline at end of file
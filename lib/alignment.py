@@ -0,0 +1,180 @@
+import math
+from collections import Counter
+
+from .bounds import getNodeBox,inflate
+
+#################################
+# SPATIAL ALIGNMENT: mxgraph cells matched with the IR nodes by position (ALIGNMENT: spatial)
+#################################
+# Each drawn IR node gets the bounding box of its geometry, each visible leaf cell the box of its mxGeometry
+# (vertices) or of its points and terminals (edges), shifted by the offset of the svg export. The cells are stored
+# in a uniform grid: a node gets the cell which fits it best among the ones it overlaps, the drawing order of drawio
+# (the nodes of a cell are consecutive) only breaks the ties. A wrong match stays local, whereas a wrong length
+# guessed by the sequential alignment (see MxGraph.annotate) shifts all the following cells.
+# The boxes of the nodes are the ones of the emitted geometry (see bounds.getNodeBox).
+
+TOLERANCE = 2.0       # svg units added around all the boxes (stroke widths, rounding of the export)
+LABEL_MARGIN = 40.0   # extent of the labels placed outside of their vertex (labelPosition, verticalLabelPosition)
+ORDER_WEIGHT = 0.05   # score lost per cell of distance to the cell of the previous node
+BACKWARD_WEIGHT = 4   # going back to a previous cell is less likely than skipping cells without svg node
+MAX_SAME_SIZE = 8     # cells of a given size voting for the offset of the export (common sizes are ambiguous)
+MIN_BUCKET = 20.0     # svg units: lower bound of the size of the buckets (median size of the cells)
+MIN_MATCHED = 0.9     # share of the nodes matched by position below which the alignment is reported as weak
+
+class Grid(object):
+  # uniform grid of boxes (x1, y1, x2, y2): each item is stored in all the buckets its box overlaps
+
+  def __init__(self, size):
+    self.size = size
+    self.buckets = {}
+
+  def getBuckets(self, box):
+    s = self.size
+    for i in range(math.floor(box[0] / s), math.floor(box[2] / s) + 1):
+      for j in range(math.floor(box[1] / s), math.floor(box[3] / s) + 1):
+        yield (i, j)
+
+  def insert(self, box, item):
+    for key in self.getBuckets(box):
+      self.buckets.setdefault(key, []).append(item)
+
+  def query(self, box):
+    res = set()
+    for key in self.getBuckets(box):
+      res.update(self.buckets.get(key, ()))
+    return res
+
+def getPoint(point, origin):
+  return (origin[0] + float(point['x']), origin[1] + float(point['y']))
+
+def getVertexBox(mxNode, origin):
+  geometry = mxNode['geometry']
+  (x, y) = getPoint(geometry['pos'], origin) if 'pos' in geometry else origin
+  (w, h) = (float(geometry.get('width', 0)), float(geometry.get('height', 0)))
+  box = [x, y, x + w, y + h]
+  style = mxNode['style']
+  rotation = math.radians(float(style.get('rotation', 0) or 0))
+  if rotation:
+    # bounding box of the rotated shape (around its center)
+    (cx, cy) = (x + w / 2, y + h / 2)
+    hw = (abs(w * math.cos(rotation)) + abs(h * math.sin(rotation))) / 2
+    hh = (abs(w * math.sin(rotation)) + abs(h * math.cos(rotation))) / 2
+    box = [cx - hw, cy - hh, cx + hw, cy + hh]
+  match style.get('verticalLabelPosition'):
+    case 'bottom':
+      box[3] += LABEL_MARGIN
+    case 'top':
+      box[1] -= LABEL_MARGIN
+  match style.get('labelPosition'):
+    case 'right':
+      box[2] += LABEL_MARGIN
+    case 'left':
+      box[0] -= LABEL_MARGIN
+  return tuple(box)
+
+def getCellBoxes(mxgraph):
+  """ Absolute box of each cell of mxgraph.lst in mxgraph coordinates (None when unknown)
+  """
+  cells = {mxNode['id']: mxNode for mxNode in mxgraph.lst}
+  origins = {}
+
+  def getOrigin(cellId):
+    # geometries are relative to the parent group
+    if cellId not in origins:
+      mxNode = cells.get(cellId)
+      origin = (0.0, 0.0)
+      if mxNode is not None and mxNode['type'] == 'group':
+        parent = getOrigin(mxNode['parent'])
+        origin = getPoint(mxNode['geometry']['pos'], parent) if 'pos' in mxNode['geometry'] else parent
+      origins[cellId] = origin
+    return origins[cellId]
+
+  boxes = {}
+  # vertices first: edges use the centers of their terminals
+  for mxNode in mxgraph.lst:
+    if mxNode['type'] == 'leaf' and 'edge' not in mxNode:
+      boxes[mxNode['id']] = getVertexBox(mxNode, getOrigin(mxNode['parent']))
+  for mxNode in mxgraph.lst:
+    if mxNode['type'] == 'leaf' and 'edge' in mxNode:
+      geometry = mxNode['geometry']
+      origin = getOrigin(mxNode['parent'])
+      points = [getPoint(geometry[key], origin) for key in ('sourcePoint', 'targetPoint') if key in geometry]
+      points.extend(getPoint(point, origin) for point in geometry.get('control', []))
+      for terminal in mxNode['edge'].values():
+        box = boxes.get(terminal)
+        if box is not None:
+          points.append(((box[0] + box[2]) / 2, (box[1] + box[3]) / 2))
+      if points:
+        xs = [p[0] for p in points]
+        ys = [p[1] for p in points]
+        boxes[mxNode['id']] = (min(xs), min(ys), max(xs), max(ys))
+  return [boxes.get(mxNode['id']) for mxNode in mxgraph.lst]
+
+def estimateOffset(cellBoxes, nodeBoxes):
+  """ Translation of the svg export (svg = mxgraph + offset), voted by the vertices and the IR nodes of equal size
+  """
+  sizes = {}
+  for box in cellBoxes:
+    if box is not None and box[2] > box[0] and box[3] > box[1]:
+      sizes.setdefault((round(box[2] - box[0], 1), round(box[3] - box[1], 1)), []).append(box)
+  votes = Counter()
+  for box in nodeBoxes:
+    if box is None:
+      continue
+    same = sizes.get((round(box[2] - box[0], 1), round(box[3] - box[1], 1)), ())
+    if len(same) <= MAX_SAME_SIZE:
+      votes.update((round(box[0] - cell[0], 1), round(box[1] - cell[1], 1)) for cell in same)
+  return votes.most_common(1)[0][0] if votes else (0.0, 0.0)
+
+def getFit(node, cell):
+  # intersection over union: 1 for identical boxes, close to 0 for a label in its shape (the order decides)
+  width = min(node[2], cell[2]) - max(node[0], cell[0])
+  height = min(node[3], cell[3]) - max(node[1], cell[1])
+  if width <= 0 or height <= 0:
+    return 0
+  inter = width * height
+  return inter / ((node[2] - node[0]) * (node[3] - node[1]) + (cell[2] - cell[0]) * (cell[3] - cell[1]) - inter)
+
+def align(mxgraph, svg):
+  """ Assigns an index of mxgraph.lst to each drawn node of svg (IR), returns (assignments, matched by position, offset)
+  assignments: list of (index of the IR node, index of the cell)
+  """
+  leaves = [index for (index, mxNode) in enumerate(mxgraph.lst) if mxNode['type'] == 'leaf' and mxNode['visible']]
+  nodes = [(index, getNodeBox(item['tikz'])) for (index, item) in enumerate(svg) if item['tikz']['draw']]
+  if not leaves:
+    return ([], 0, (0.0, 0.0))
+  allBoxes = getCellBoxes(mxgraph)
+  offset = estimateOffset([allBoxes[index] for index in leaves], [box for (_, box) in nodes])
+
+  # position in leaves => inflated box in svg coordinates
+  boxes = {}
+  for (position, index) in enumerate(leaves):
+    box = allBoxes[index]
+    if box is not None:
+      boxes[position] = inflate((box[0] + offset[0], box[1] + offset[1], box[2] + offset[0], box[3] + offset[1]), TOLERANCE)
+  sizes = sorted(max(box[2] - box[0], box[3] - box[1]) for box in boxes.values())
+  grid = Grid(max(sizes[len(sizes) // 2], MIN_BUCKET) if sizes else MIN_BUCKET)
+  for (position, box) in boxes.items():
+    grid.insert(box, position)
+
+  assignments = []
+  matched = 0
+  cursor = 0
+  for (index, box) in nodes:
+    best = None
+    if box is not None and boxes:
+      box = inflate(box, TOLERANCE)
+      for position in grid.query(box):
+        fit = getFit(box, boxes[position])
+        if fit <= 0:
+          continue
+        distance = position - cursor if position >= cursor else BACKWARD_WEIGHT * (cursor - position)
+        score = fit - ORDER_WEIGHT * distance
+        if best is None or score > best[0] or (score == best[0] and position < best[1]):
+          best = (score, position)
+    if best is not None:
+      cursor = best[1]
+      matched += 1
+    # otherwise (no overlapping cell): part of the cell of the previous node
+    assignments.append((index, leaves[cursor]))
+  return (assignments, matched, offset)
@@ -0,0 +1,35 @@
+import io
+
+from . import pipeline,batch,context
+from .config import App
+
+#################################
+# API: reentrant conversion, usable from several threads of the same process
+#################################
+# Each call builds its own config (the config of App is not used nor modified) and runs in its own
+# context.Context: registries (colors, resources, fragment cache, image jobs) are not shared between calls.
+# Example:
+#   from lib import api
+#   tex = api.convert('figures/topology.svg', {'STANDALONE_TEX': True})
+
+def getConf(source, config=None):
+  # config: config file (yaml) or dict of overrides of the default config
+  if isinstance(config, dict):
+    conf = App.build(overrides=config)
+  else:
+    conf = App.build(config)
+  # input and output files named after the source, as in batch mode
+  return App.build(overrides=batch.getOverrides(source, conf), base=conf)
+
+def convert(source, config=None, output=None):
+  """ Converts the drawio svg file source, returns the tex
+  output: optional output file (path), or file object receiving the tex (the tex is then not returned)
+  """
+  conf = getConf(source, config)
+  if isinstance(output, str):
+    conf['OUTPUT_FILE'] = output
+    pipeline.convert(ctx=context.Context(conf))
+    return None
+  res = output if output is not None else io.StringIO()
+  pipeline.convert(res, ctx=context.Context(conf))
+  return res.getvalue() if output is None else None
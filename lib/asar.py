@@ -0,0 +1,71 @@
+import os
+import json
+import mmap
+import struct
+import threading
+
+from .common import *
+
+#################################
+# ASAR archives (electron, e.g. drawio app.asar): in-process extraction of embedded resources
+#################################
+# Format:
+# - header size pickle: uint32 payload size (4) ; uint32 size of the header pickle
+# - header pickle: uint32 payload size ; uint32 json length ; json string (padded to 4 bytes)
+# - file contents, at the offsets given by the json header (relative to the end of the header pickle)
+# Files marked as `unpacked` are stored next to the archive, in <archive>.unpacked/
+
+class AsarArchive(object):
+
+  def __init__(self, path):
+    self.path = path
+    with open(path, 'rb') as file:
+      # the mapping remains valid after closing the file
+      self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    (_, headerSize) = struct.unpack_from('<II', self.data, 0)
+    (_, jsonSize) = struct.unpack_from('<II', self.data, 8)
+    header = json.loads(bytes(self.data[16:16 + jsonSize]))
+    self.base = 8 + headerSize
+    self.index = {} # member path => json entry (offset & size)
+    self.links = {} # member path => link target
+    self.indexDir(header, '')
+
+  def indexDir(self, node, prefix):
+    for name in node['files']:
+      entry = node['files'][name]
+      member = prefix + name
+      if 'files' in entry:
+        self.indexDir(entry, member + '/')
+      elif 'link' in entry:
+        self.links[member] = entry['link']
+      else:
+        self.index[member] = entry
+
+  def read(self, member):
+    # zero-copy view on the mapped archive (except for unpacked files)
+    member = member.strip('/')
+    depth = 0
+    while member in self.links and depth < 32:
+      member = self.links[member]
+      depth += 1
+    if not member in self.index:
+      raise KeyError("{} not found in {}".format(member, self.path))
+
+    entry = self.index[member]
+    if entry.get('unpacked', False):
+      with open(self.path + '.unpacked/' + member, 'rb') as file:
+        return file.read()
+    start = self.base + int(entry['offset'])
+    return memoryview(self.data)[start:start + entry['size']]
+
+  def extract(self, member, dest):
+    writeAtomic(dest, self.read(member), 'wb')
+
+# each archive is indexed only once per process
+ARCHIVES = {}
+ARCHIVES_LOCK = threading.Lock() # extractions are run by concurrent image jobs
+def getArchive(path):
+  with ARCHIVES_LOCK:
+    if not path in ARCHIVES:
+      ARCHIVES[path] = AsarArchive(path)
+    return ARCHIVES[path]
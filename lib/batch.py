@@ -0,0 +1,175 @@
+import os
+import re
+import glob
+import time
+import fnmatch
+import traceback
+import xml.etree.ElementTree as xml
+from concurrent.futures import ProcessPoolExecutor
+
+from . import pipeline
+from .config import App
+from . import mxfile
+
+#################################
+# BATCH: conversion of a whole directory with a pool of worker processes
+#################################
+# Each worker loads the config once, then only applies per-file overrides:
+# - input/output file names (outputs are named after the input in OUTPUT_DIR)
+# - BATCH_OVERRIDES entries whose pattern matches the input file name
+
+BASE_CONF = None # loaded once per worker
+
+def listInputs(pattern):
+  if os.path.isdir(pattern):
+    files = glob.glob(os.path.join(pattern, '*.svg'))
+  else:
+    files = glob.glob(pattern)
+  # largest files first: the longest conversions do not end up alone at the end of the batch
+  return sorted(files, key=os.path.getsize, reverse=True)
+
+def getOverrides(path, conf):
+  filename = os.path.basename(path)
+  rawfilename = filename[0:-(len(filename.split('.')[-1])+1)]
+  overrides = {
+    'INPUT_DIR': os.path.dirname(path) or '.',
+    'INPUT_FILENAME': filename,
+    'OUTPUT_FILENAME': rawfilename + '.tex'
+  }
+  specific = conf['BATCH_OVERRIDES'] if conf.get('BATCH_OVERRIDES') else {}
+  for pattern in specific:
+    if fnmatch.fnmatch(filename, pattern):
+      overrides |= specific[pattern]
+  return overrides
+
+def initWorker(configFile, overrides=None):
+  global BASE_CONF
+  App.loadConf(configFile, overrides)
+  BASE_CONF = App.snapshot()
+
+def runConversion(overrides):
+  # conversion with the base config of the worker updated with the overrides, returns the error if any
+  try:
+    App.restore(BASE_CONF)
+    App.loadConf(overrides=overrides)
+    pipeline.convert()
+  except Exception as e:
+    traceback.print_exc()
+    return "{}: {}".format(type(e).__name__, e)
+  return None
+
+def convertFile(path):
+  start = time.perf_counter()
+  error = runConversion(getOverrides(path, BASE_CONF))
+  return (path, os.path.getsize(path), time.perf_counter() - start, error)
+
+def getCollisions(files, conf):
+  # outputs are named after the input file name only: inputs of different directories may share an output
+  outputs = {}
+  for path in files:
+    overrides = getOverrides(path, conf)
+    output = os.path.join(overrides.get('OUTPUT_DIR', conf['OUTPUT_DIR']), overrides['OUTPUT_FILENAME'])
+    outputs.setdefault(os.path.normpath(output), []).append(path)
+  return {output: paths for (output, paths) in outputs.items() if len(paths) > 1}
+
+def runBatch(pattern, configFile=None, jobs=None, overrides=None):
+  """ Converts all the svg files matching pattern, overrides (e.g. CROP, PAGE) apply to all of them
+  Returns the failures, nothing is converted if several inputs would be written to the same output
+  """
+  files = listInputs(pattern)
+  if not files:
+    print("[ERROR] No input file matching {}".format(pattern))
+    return [pattern]
+  conf = App.build(configFile, overrides)
+  if conf['PAGE'] == 'all':
+    print("[ERROR] One output per page (PAGE: all) is not supported in batch mode")
+    return [pattern]
+  collisions = getCollisions(files, conf)
+  for (output, paths) in collisions.items():
+    print("[ERROR] Inputs written to the same output {}: {}".format(output, ', '.join(paths)))
+  if collisions:
+    return [path for paths in collisions.values() for path in paths]
+
+  print("[INFO] Batch conversion of {} files".format(len(files)))
+  start = time.perf_counter()
+  with ProcessPoolExecutor(max_workers=jobs, initializer=initWorker, initargs=(configFile, overrides)) as pool:
+    # map submits in order: largest files are scheduled first
+    results = list(pool.map(convertFile, files))
+  elapsed = time.perf_counter() - start
+
+  failures = [r for r in results if r[3]]
+  size = sum(r[1] for r in results) / (1024.0 * 1024.0)
+  print("[INFO] Batch summary: {}/{} files converted, {:.1f} MB in {:.2f}s ({:.2f} files/s, {:.2f} MB/s)".format(
+    len(results) - len(failures), len(results), size, elapsed, len(results) / elapsed, size / elapsed))
+  for (path, _, duration, error) in failures:
+    print("[ERROR] {} failed after {:.2f}s: {}".format(path, duration, error))
+  return failures
+
+#################################
+# PAGES: one conversion per page of the drawio diagram (PAGE: all)
+#################################
+# The svg is converted once per page, each output aligned with its own page (names, overlays, layers).
+# Pages are listed without being decoded (see mxfile.scanPages): each worker only decodes its own page.
+
+PAGE_NAME = re.compile(r"[^A-Za-z0-9_-]+")
+
+def getPages(path):
+  # pages of the drawio diagram of the svg: only the root element is read, its content is scanned but not decoded
+  for (_, root) in xml.iterparse(path, events=('start',)):
+    content = root.attrib.get('content')
+    return mxfile.scanPages(content) if content else []
+  return []
+
+def checkPage(path, spec):
+  """ True if spec selects a page of the drawio diagram of the svg (or if it has no diagram), prints the error otherwise
+  """
+  pages = getPages(path)
+  if not pages or any(mxfile.isSelected(page, spec) for page in pages):
+    return True
+  print("[ERROR] Unknown page {} of {}, available pages: {}".format(spec, path, mxfile.getPageNames(pages)))
+  return False
+
+def getPageOverrides(conf, pages):
+  raw = conf['OUTPUT_FILENAME'][0:-(len(conf['OUTPUT_FILENAME'].split('.')[-1])+1)]
+  names = [PAGE_NAME.sub('_', page['name']) for page in pages]
+  res = []
+  for (page, name) in zip(pages, names):
+    if names.count(name) > 1:
+      name = "{}_{}".format(name, page['index'] + 1)
+    # side files of the pages are converted in parallel: named after the page as well
+    res.append({
+      'PAGE': str(page['index'] + 1),
+      'OUTPUT_FILENAME': "{}-{}.tex".format(raw, name),
+      'SIDE_FILES_NAME': "{}-{}".format(conf['SIDE_FILES_RAW'], name)
+    })
+  return res
+
+def convertPage(overrides):
+  start = time.perf_counter()
+  error = runConversion(overrides)
+  return (overrides['OUTPUT_FILENAME'], time.perf_counter() - start, error)
+
+def runPages(configFile=None, jobs=None, overrides=None, conf=None):
+  """ Converts the configured svg once per page of its drawio diagram, pages are decoded & converted in parallel
+  Outputs are named after OUTPUT_FILENAME and the page names, returns the failures
+  conf: config already loaded from configFile and overrides (built otherwise), the workers load their own
+  """
+  if conf is None:
+    conf = App.build(configFile, overrides)
+  pages = getPages(conf['INPUT_FILE'])
+  if not pages:
+    print("[ERROR] No drawio diagram in {}".format(conf['INPUT_FILE']))
+    return [conf['INPUT_FILE']]
+
+  print("[INFO] Conversion of {} pages: {}".format(len(pages), ', '.join(page['name'] for page in pages)))
+  start = time.perf_counter()
+  workers = min(jobs or os.cpu_count() or 1, len(pages))
+  with ProcessPoolExecutor(max_workers=workers, initializer=initWorker, initargs=(configFile, overrides)) as pool:
+    results = list(pool.map(convertPage, getPageOverrides(conf, pages)))
+
+  failures = [r for r in results if r[2]]
+  print("[INFO] Pages summary: {}/{} pages converted in {:.2f}s".format(
+    len(results) - len(failures), len(results), time.perf_counter() - start))
+  for (output, duration, error) in failures:
+    print("[ERROR] {} failed after {:.2f}s: {}".format(output, duration, error))
+  return failures
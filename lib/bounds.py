@@ -0,0 +1,143 @@
+import re
+import math
+
+from .common import *
+from .pathdata import PathData
+
+#################################
+# BOUNDING BOXES of the IR nodes, CROPPING of the figure to a region (CROP, CROP_LAYER)
+#################################
+# Boxes (x1, y1, x2, y2) are in svg units (y axis downwards) and follow the emitted geometry: the rotations applied
+# at emission (see emitter.getOpts) are taken into account, shifts are not emitted. Cropping drops the nodes outside
+# of the region before the emission, and the picture gets an explicit bounding box (clipped to the region): TeX
+# neither draws the dropped nodes nor computes the bounding box from all the paths.
+
+PARSE_WIDTH = re.compile(r'[\d.]+')
+
+def getRotationMatrix(angle, cx, cy):
+  # tikz rotation (degrees, counterclockwise) around (cx, cy) in svg units, as an svg matrix(a b c d e f)
+  a = math.radians(-angle)
+  (cos, sin) = (math.cos(a), math.sin(a))
+  return (cos, sin, -sin, cos, cx - cx * cos + cy * sin, cy - cx * sin - cy * cos)
+
+def transformPoint(matrix, x, y):
+  (m0, m1, m2, m3, m4, m5) = matrix # svg matrix(a b c d e f), f is the number formatter of common
+  return (m0 * x + m2 * y + m4, m1 * x + m3 * y + m5)
+
+def transformBox(box, matrix):
+  # box of the transformed corners (exact for rectangles)
+  corners = [transformPoint(matrix, x, y) for x in (box[0], box[2]) for y in (box[1], box[3])]
+  return (min(p[0] for p in corners), min(p[1] for p in corners), max(p[0] for p in corners), max(p[1] for p in corners))
+
+def inflate(box, margin):
+  return (box[0] - margin, box[1] - margin, box[2] + margin, box[3] + margin)
+
+def intersects(box, other):
+  return box[0] <= other[2] and other[0] <= box[2] and box[1] <= other[3] and other[1] <= box[3]
+
+def unionBox(boxes):
+  boxes = [box for box in boxes if box is not None]
+  if not boxes:
+    return None
+  return (min(b[0] for b in boxes), min(b[1] for b in boxes), max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+def getLineWidth(tikz):
+  width = tikz['opts'].get('line width')
+  if tikz['cmd'] not in ('draw', 'filldraw') or not width:
+    return 0
+  number = PARSE_WIDTH.match(str(width))
+  return float(number.group(0)) if number else 0
+
+def getNodeBox(tikz):
+  """ Bounding box of an IR node, None if it has no geometry
+  Computed from the numeric geometry of the node (PathData or tikz['geometry'], see svgparser), never from the tikz text:
+  - paths: exact, extrema of the curves included
+  - rectangles, ellipses and images: exact (rounded corners never enlarge a rectangle)
+  - text: anchor only, the extent of the text is only known by TeX
+  Half of the line width is added to the stroked nodes.
+  """
+  path = tikz['path']
+  geometry = tikz.get('geometry')
+  transforms = tikz.get('transforms') or {}
+  matrix = None
+  if tikz['cmd'] != 'node' and 'rotation' in transforms:
+    matrix = getRotationMatrix(*transforms['rotation'])
+
+  if isinstance(path, PathData):
+    box = path.bounds(matrix)
+  elif geometry is None:
+    return None
+  else:
+    match geometry[0]:
+      case 'rect':
+        box = geometry[1:]
+        if matrix is not None:
+          box = transformBox(box, matrix)
+      case 'ellipse':
+        (x, y, rx, ry) = geometry[1:]
+        if matrix is not None:
+          # rotated ellipse: extent of its axes
+          (x, y) = transformPoint(matrix, x, y)
+          (cos, sin) = (matrix[0], matrix[1])
+          (rx, ry) = (math.hypot(rx * cos, ry * sin), math.hypot(rx * sin, ry * cos))
+        box = (x - rx, y - ry, x + rx, y + ry)
+      case 'image':
+        # node at the center of the picture, rotated around it
+        (x, y, w, h) = geometry[1:]
+        box = (x - w / 2, y - h / 2, x + w / 2, y + h / 2)
+        if 'rotate' in transforms:
+          box = transformBox(box, getRotationMatrix(float(transforms['rotate']), x, y))
+      case 'anchor':
+        (x, y) = geometry[1:]
+        box = (x, y, x, y)
+      case others:
+        return None
+  if box is None:
+    return None
+  width = getLineWidth(tikz)
+  return inflate(box, width / 2) if width else box
+
+def getFigureBox(ir):
+  return unionBox(getNodeBox(node['tikz']) for node in ir if node['tikz']['draw'])
+
+def getViewBox(rootAttrib):
+  # svg viewBox (or size) of the figure, None if unknown
+  if 'viewBox' in rootAttrib:
+    (x, y, width, height) = [getNiceNumber(v) for v in rootAttrib['viewBox'].replace(',', ' ').split()]
+  elif 'width' in rootAttrib and 'height' in rootAttrib:
+    (x, y) = (0, 0)
+    width = getNiceNumber(rootAttrib['width'].replace('px', ''))
+    height = getNiceNumber(rootAttrib['height'].replace('px', ''))
+  else:
+    return None
+  return (x, y, x + width, y + height)
+
+def getBoundingBox(box, clip=False):
+  # tikz commands fixing the bounding box of the picture (y axis inverted), optionally clipped to it
+  rect = "({},{}) rectangle ({},{})".format(f(box[0]), f(0 - box[1]), f(box[2]), f(0 - box[3]))
+  res = "\\useasboundingbox {};".format(rect)
+  if clip:
+    res += "\n\\clip {};".format(rect)
+  return res
+
+#################################
+# CROPPING
+#################################
+def parseRegion(spec):
+  """ "x,y,w,h" (svg units) => box, ValueError if malformed
+  """
+  values = [float(v) for v in spec.split(',')]
+  if len(values) != 4 or values[2] <= 0 or values[3] <= 0:
+    raise ValueError("Expected x,y,w,h with a positive size: {}".format(spec))
+  (x, y, w, h) = values
+  return (x, y, x + w, y + h)
+
+def crop(ir, region):
+  """ Returns the nodes of the IR overlapping the region (nodes without geometry are kept), in the drawing order
+  """
+  res = []
+  for node in ir:
+    box = getNodeBox(node['tikz']) if node['tikz']['draw'] else None
+    if box is None or intersects(box, region):
+      res.append(node)
+  return res
@@ -0,0 +1,48 @@
+import os
+import json
+import socket
+import tempfile
+
+#################################
+# DAEMON PROTOCOL (client side): standard library only, to keep the client start-up cheap
+#################################
+# One JSON object per line, each request gets a single response line on the same connection:
+# - {"input": path, "config": path|null, "overrides": {KEY: value}, "output": path|null, "stdout": bool}
+#   => {"ok": bool, "tex": str|null (with stdout), "output": path|null (file written), "log": str, "error": str|null,
+#       "duration": seconds}
+#   the tex is written to output if given, returned with stdout, written to OUTPUT_FILE of the config otherwise
+#   (OUTPUT_DIR, named after the input)
+# - {"cmd": "ping"} => {"ok": true} ; {"cmd": "shutdown"} => {"ok": true} (the daemon stops after the response)
+# Paths are resolved by the daemon: they are sent as absolute paths.
+
+def getDefaultSocket():
+  directory = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+  return os.path.join(directory, "svg2tikz-{}.sock".format(os.getuid()))
+
+def request(socketPath, message):
+  with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+    sock.connect(socketPath)
+    with sock.makefile('rwb') as stream:
+      stream.write(json.dumps(message).encode() + b'\n')
+      stream.flush()
+      line = stream.readline()
+  if not line:
+    raise ConnectionError("no response from the daemon on {}".format(socketPath))
+  return json.loads(line)
+
+def getJob(inputFile, configFile=None, overrides=None, outputFile=None, stdout=False):
+  return {
+    'input': os.path.abspath(inputFile),
+    'config': os.path.abspath(configFile) if configFile else None,
+    'overrides': overrides or {},
+    'output': os.path.abspath(outputFile) if outputFile else None,
+    'stdout': stdout
+  }
+
+def parseOverride(definition):
+  # KEY=VALUE, the value is parsed as JSON when possible (numbers, true/false, lists...)
+  (key, _, value) = definition.partition('=')
+  try:
+    return (key, json.loads(value))
+  except ValueError:
+    return (key, value)
@@ -1,5 +1,5 @@
 import re
-from . import common
+from . import common,context,diagnostics
 
 COLOR_RGB_REG = re.compile(r"\s*[rR][gG][bB]\(\s*([0-9]{1,3})\s*,\s*([0-9]{1,3})\s*,\s*([0-9]{1,3})\s*\)\s*")
 ColorDict={}
@@ -43,6 +43,33 @@ ColorDict['#5f5f5f'] = { 'name': 'ugaLightGrey', 'custom': True, 'used': False}
 ColorDict['#959595'] = { 'name': 'ugaLightGrey2', 'custom': True, 'used': False}
 
 # ColorDict[""]
+DEFAULT_COLORS = set(ColorDict)
+context.SHARED.colors = ColorDict # registry of the calls made outside of a conversion
+
+def newRegistry():
+  return {key: dict(entry, used=False) for (key, entry) in ColorDict.items() if key in DEFAULT_COLORS}
+
+def getRegistry():
+  # registry of the current conversion (see context.Context), created on first use
+  ctx = context.get()
+  if ctx.colors is None:
+    ctx.colors = newRegistry()
+  return ctx.colors
+
+def resetColors():
+  # required between conversions of different files sharing the same registry
+  registry = getRegistry()
+  for key in list(registry):
+    if key in DEFAULT_COLORS:
+      registry[key]['used'] = False
+    else:
+      del registry[key]
+
+def releaseColors():
+  # warm registry (watch mode): names are kept across conversions, only the usage is reset
+  for entry in getRegistry().values():
+    entry['used'] = False
+
 def getColor(colorString):
   if colorString[0] == '#':
     hexColor=colorString.lower()
@@ -53,23 +80,31 @@ def getColor(colorString):
       for c in m.groups(): # not including complete match 0
         hexColor += '{:02X}'.format(common.getNiceNumber(c))
     else:
-      print("Unable to parse color {}, defaulting to black".format(colorString))
+      diagnostics.warn('color', "Unable to parse color {}, defaulting to black", colorString)
       hexColor = "#000000"
     hexColor = hexColor.lower()
+  return useColor(hexColor)
+
+def useColor(hexColor):
   # storage based on hexColor in all cases because simpler to use as a key
-  if hexColor in ColorDict:
-    ColorDict[hexColor]['used'] = True
-    return ColorDict[hexColor]['name']
+  ctx = context.get()
+  registry = getRegistry()
+  if hexColor in registry:
+    registry[hexColor]['used'] = True
+    name = registry[hexColor]['name']
   else:
-    cid = len(ColorDict)
+    cid = len(registry)
     name = 'svg2tikz_c{}'.format(cid)
-    ColorDict[hexColor] = {'name': name, 'custom': True, 'used': True}
-    return name
+    registry[hexColor] = {'name': name, 'custom': True, 'used': True}
+  for recorder in ctx.recorders:
+    recorder.append((hexColor, name))
+  return name
 
 def getColorDefs():
   res = []
-  for key in ColorDict:
-    elt = ColorDict[key]
+  registry = getRegistry()
+  for key in registry:
+    elt = registry[key]
     if elt['used'] and elt['custom']:
       r = int(key[1:3], 16)
       g = int(key[3:5], 16)
@@ -1,3 +1,7 @@
+import os
+import contextlib
+import threading
+
 # custom format for nice number display, see below, neither .2f nor .3g are corresponding to the need 
 # https://stackoverflow.com/questions/2389846/python-decimals-format
 def f(x):
@@ -8,3 +12,34 @@ def getNiceNumber(string):
     return int(string) # avoid ugly .0 everywhere in the result
   except:
     return float(string) # might still raise an exception but would be for good reasons: unparsable number
+
+# hidden sibling of the given path, unique per process & thread, keeping the extension (required by some converters)
+def tmpPath(path):
+  (head, tail) = os.path.split(path)
+  return os.path.join(head, ".{}_{}.{}".format(os.getpid(), threading.get_ident(), tail))
+
+# readers (and concurrent writers in batch mode) never see partially written files
+@contextlib.contextmanager
+def openAtomic(path, mode='w', buffering=-1):
+  tmp = tmpPath(path)
+  try:
+    with open(tmp, mode, buffering) as file:
+      yield file
+  except BaseException:
+    if os.path.exists(tmp):
+      os.remove(tmp)
+    raise
+  os.replace(tmp, path)
+
+def writeAtomic(path, data, mode='w'):
+  with openAtomic(path, mode) as file:
+    file.write(data)
+
+# unchanged files keep their modification time (make & latex builds are not triggered again)
+def writeIfChanged(path, data):
+  if os.path.exists(path):
+    with open(path, 'r') as file:
+      if file.read() == data:
+        return False
+  writeAtomic(path, data)
+  return True
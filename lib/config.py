@@ -1,10 +1,13 @@
 #!/usr/bin/env python3
 
 import os
+import copy
 import yaml
 
 import collections.abc
 
+from . import context
+
 class App:
   CURRENT_DIR="/Users/jbruant/syncOut/fpga-cifre/docs/slides/figures/svg2tikz/lib"
   DEFAULT_CONF = CURRENT_DIR + "/config_default.yml"
@@ -23,36 +26,69 @@ class App:
       return d
 
   @staticmethod
-  def __update(conf):
-    App.__update_rec(App.__conf, conf)
+  def __derive(conf):
+    conf['INPUT_FILE'] = conf['INPUT_DIR'] + "/" + conf['INPUT_FILENAME']
+    conf['OUTPUT_DEP_DIR'] = conf['OUTPUT_DIR'] + "/" + conf['DEP_DIR']
+    conf['OUTPUT_FILE'] = conf['OUTPUT_DIR'] + "/" + conf['OUTPUT_FILENAME']
 
+    os.makedirs(conf['OUTPUT_DEP_DIR'], exist_ok = True)
+    conf['INPUT_FILENAME_RAW'] = conf['INPUT_FILENAME'][0:-(len(conf['INPUT_FILENAME'].split('.')[-1])+1)]
+    conf['SIDE_FILES_RAW'] = conf.get('SIDE_FILES_NAME') or conf['INPUT_FILENAME_RAW']
 
   @staticmethod
-  def loadConf(configFile=None):
-    if not App.__conf:
+  def build(configFile=None, overrides=None, base=None):
+    """ Returns a new config: base (default config if None) updated with the config file and the overrides
+    The config of App is left untouched (see loadConf), e.g. for concurrent conversions (see api.convert)
+    """
+    if base:
+      conf = copy.deepcopy(base)
+    else:
       # first load the default and then override with new values
       with open(App.DEFAULT_CONF, 'r') as file:
-        App.__conf = yaml.safe_load(file)
-    
+        conf = yaml.safe_load(file)
+
     # update conf with new values 
     if configFile:
       print("Loading config file from {}".format(configFile))
       with open(configFile, 'r') as file:
-        App.__update(yaml.safe_load(file))
-    
-    App.__conf['INPUT_FILE'] = App.__conf['INPUT_DIR'] + "/" + App.__conf['INPUT_FILENAME']
-    App.__conf['OUTPUT_DEP_DIR'] = App.__conf['OUTPUT_DIR'] + "/" + App.__conf['DEP_DIR']
-    App.__conf['OUTPUT_FILE'] = App.__conf['OUTPUT_DIR'] + "/" + App.__conf['OUTPUT_FILENAME']
-
-    os.makedirs(App.__conf['OUTPUT_DEP_DIR'], exist_ok = True)
-    App.__conf['INPUT_FILENAME_RAW'] = App.__conf['INPUT_FILENAME'][0:-(len(App.__conf['INPUT_FILENAME'].split('.')[-1])+1)]
+        App.__update_rec(conf, yaml.safe_load(file))
+
+    # programmatic overrides (batch mode), applied last
+    if overrides:
+      App.__update_rec(conf, overrides)
+
+    App.__derive(conf)
+    return conf
+
+  @staticmethod
+  def loadConf(configFile=None, overrides=None):
+    App.__conf = App.build(configFile, overrides, App.__conf)
+
+  # snapshot/restore allow several conversions with different overrides in the same process
+  @staticmethod
+  def snapshot():
+    return copy.deepcopy(App.__conf)
+
+  @staticmethod
+  def restore(conf):
+    App.__conf = copy.deepcopy(conf)
+
+  # next load starts again from the default config (e.g. config file modified in watch mode)
+  @staticmethod
+  def reset():
+    App.__conf = None
   
   @staticmethod
   def outputFile(ext):
-    return App.__conf['OUTPUT_DIR'] + "/" + App.__conf['INPUT_FILENAME_RAW'] + '.' + ext
+    conf = App.config()
+    return conf['OUTPUT_DIR'] + "/" + conf['SIDE_FILES_RAW'] + '.' + ext
 
   @staticmethod
   def config():
+    # read-only snapshot of the running conversion (see context.Context), or the config of the process
+    ctx = context.CURRENT.get()
+    if ctx is not None:
+      return ctx.conf
     if not App.__conf:
       App.loadConf()
     return App.__conf
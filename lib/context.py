@@ -0,0 +1,50 @@
+import copy
+import types
+import contextlib
+import contextvars
+
+#################################
+# CONVERSION CONTEXT: config snapshot and registries of a single conversion
+#################################
+# The context of the running conversion is held by a context variable: conversions run on different threads
+# (or interleaved in the same thread) do not share any state. Worker threads do not inherit the context
+# variables: jobs of a conversion must be started with Context.submit.
+# Calls made outside of any conversion (e.g. benchmarks of a single stage) use the process-wide SHARED context,
+# whose config is the one of App (see config.App.config).
+
+CURRENT = contextvars.ContextVar('svg2tikz_context', default=None)
+
+class Context(object):
+
+  def __init__(self, conf):
+    # read-only snapshot: the config of the caller can be changed during the conversion (watch mode, daemon)
+    self.conf = types.MappingProxyType(copy.deepcopy(dict(conf))) if conf is not None else None
+    self.colors = None     # hex color => {name, custom, used}, see colors.getRegistry
+    self.recorders = []    # lists collecting (hexColor, name) of each getColor call, see fragments.FragmentCache
+    self.resources = {}    # sha1 of the resource link => include path, see svgparser.processImage
+    self.embedded = set()  # digests of the embedded images of the conversion (never evicted)
+    self.labels = None     # htmlparser.DrawHTMLConverter of the html labels, see htmlparser.getConverter
+    self.fragments = None  # optional fragments.FragmentCache
+    self.imageJobs = None  # ThreadPoolExecutor of the external image conversions, see svgparser.startImageJobs
+    self.pendingJobs = []
+    self.profile = None    # optional profiling.Profile
+    self.diagnostics = None # diagnostics.Diagnostics, set by the pipeline
+
+  @contextlib.contextmanager
+  def use(self):
+    token = CURRENT.set(self)
+    try:
+      yield self
+    finally:
+      CURRENT.reset(token)
+
+  def submit(self, executor, job, *args):
+    # the job runs in a copy of the current context (with this conversion as current one)
+    with self.use():
+      return executor.submit(contextvars.copy_context().run, job, *args)
+
+SHARED = Context(None)
+
+def get():
+  ctx = CURRENT.get()
+  return SHARED if ctx is None else ctx
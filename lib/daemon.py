@@ -0,0 +1,143 @@
+import io
+import os
+import json
+import stat
+import time
+import socket
+import threading
+import traceback
+import contextlib
+import socketserver
+from concurrent.futures import ProcessPoolExecutor
+
+from . import pipeline,fragments,batch
+from .common import *
+from .config import App
+
+#################################
+# DAEMON: conversion jobs received on a unix socket, run by a pool of warm worker processes
+#################################
+# Protocol: see client.py. Each worker keeps its loaded config files (reloaded when modified) and an in-memory
+# fragment cache per input file (persisted as well if FRAGMENT_CACHE is set). Embedded images are shared on disk.
+
+DAEMON_CONFIG = None # worker: config file of the daemon, used by jobs without config
+CONFIGS = {} # worker: config file => (stamp, config snapshot)
+CACHES = {} # worker: input file => fragments.FragmentCache
+
+def getBaseConf(configFile):
+  stamp = os.stat(configFile).st_mtime_ns if configFile else None
+  if configFile not in CONFIGS or CONFIGS[configFile][0] != stamp:
+    App.reset()
+    App.loadConf(configFile)
+    CONFIGS[configFile] = (stamp, App.snapshot())
+  return CONFIGS[configFile][1]
+
+def initWorker(configFile):
+  global DAEMON_CONFIG
+  DAEMON_CONFIG = configFile
+  getBaseConf(configFile)
+
+def getCache(conf):
+  # renewed when the config changes (the cache is salted with it)
+  path = pipeline.getFragmentCachePath(conf) if conf['FRAGMENT_CACHE'] else None
+  cache = CACHES.get(conf['INPUT_FILE'])
+  if cache is None or cache.path != path or cache.salt != fragments.getSalt(conf):
+    cache = CACHES[conf['INPUT_FILE']] = fragments.FragmentCache(path, conf)
+  cache.nextRun()
+  return cache
+
+def runJob(job):
+  start = time.perf_counter()
+  log = io.StringIO()
+  res = {'ok': True, 'tex': None, 'output': None, 'error': None}
+  with contextlib.redirect_stdout(log):
+    try:
+      base = getBaseConf(job.get('config') or DAEMON_CONFIG)
+      App.restore(base)
+      App.loadConf(overrides=batch.getOverrides(job['input'], base) | (job.get('overrides') or {}))
+      conf = App.config()
+      if job.get('stdout'):
+        output = io.StringIO()
+        pipeline.convert(output, getCache(conf))
+        res['tex'] = output.getvalue()
+      else:
+        # given output file, OUTPUT_FILE of the config (named after the input) by default
+        if job.get('output'):
+          conf['OUTPUT_FILE'] = job['output']
+        pipeline.convert(cache=getCache(conf))
+        res['output'] = conf['OUTPUT_FILE']
+    except Exception as e:
+      traceback.print_exc(file=log)
+      res['ok'] = False
+      res['error'] = "{}: {}".format(type(e).__name__, e)
+  res['log'] = log.getvalue()
+  res['duration'] = time.perf_counter() - start
+  return res
+
+class JobHandler(socketserver.StreamRequestHandler):
+
+  def handle(self):
+    for line in self.rfile:
+      try:
+        message = json.loads(line)
+      except ValueError as e:
+        self.reply({'ok': False, 'error': "Invalid request: {}".format(e)})
+        continue
+      match message.get('cmd', 'convert'):
+        case 'ping':
+          self.reply({'ok': True})
+        case 'shutdown':
+          self.reply({'ok': True})
+          # shutdown() waits for serve_forever: called from another thread
+          threading.Thread(target=self.server.shutdown).start()
+          return
+        case 'convert':
+          if not message.get('input'):
+            self.reply({'ok': False, 'error': "Missing input file"})
+            continue
+          res = self.server.pool.submit(runJob, message).result()
+          print("[{}] {} ({:.2f}s)".format("INFO" if res['ok'] else "ERROR", message['input'], res['duration']))
+          self.reply(res)
+        case others:
+          self.reply({'ok': False, 'error': "Unknown command: {}".format(others)})
+
+  def reply(self, res):
+    self.wfile.write(json.dumps(res).encode() + b'\n')
+    self.wfile.flush()
+
+class JobServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+  daemon_threads = True
+
+def isServing(socketPath):
+  # True if something accepts connections on the socket
+  with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+    try:
+      sock.connect(socketPath)
+    except (ConnectionRefusedError, FileNotFoundError):
+      return False
+  return True
+
+def serve(socketPath, configFile=None, jobs=None):
+  """ Serves the jobs until a shutdown request (or Ctrl-C), returns False if the socket cannot be used
+  A socket left by a previous daemon is replaced, a running daemon is never taken over.
+  """
+  if os.path.lexists(socketPath):
+    if not stat.S_ISSOCK(os.lstat(socketPath).st_mode):
+      print("[ERROR] {} exists and is not a socket".format(socketPath))
+      return False
+    if isServing(socketPath):
+      print("[ERROR] A daemon is already running on {} (svg2tikzc.py --shutdown to stop it)".format(socketPath))
+      return False
+    os.remove(socketPath) # stale, left by a previous daemon
+  with ProcessPoolExecutor(max_workers=jobs, initializer=initWorker, initargs=(configFile,)) as pool:
+    with JobServer(socketPath, JobHandler) as server:
+      server.pool = pool
+      print("[INFO] Listening on {} (Ctrl-C to stop)".format(socketPath))
+      try:
+        server.serve_forever()
+      except KeyboardInterrupt:
+        pass
+      finally:
+        os.remove(socketPath)
+  print("[INFO] Daemon stopped")
+  return True
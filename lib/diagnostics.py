@@ -0,0 +1,102 @@
+import json
+import threading
+
+from . import context
+
+#################################
+# DIAGNOSTICS: messages of the conversion, aggregated by category and key
+#################################
+# Messages of the per-element code paths are reported here instead of being printed: each (category, message, args) is
+# stored once with its number of occurrences, and summarized at the end of the conversion (see printSummary).
+# The message is only formatted for its first occurrence, and a disabled level (DIAGNOSTICS_LEVEL)
+# costs a single comparison. Outside of a conversion, messages are printed immediately.
+
+DEBUG = 10
+INFO = 20
+WARN = 30
+ERROR = 40
+LEVELS = {'debug': DEBUG, 'info': INFO, 'warn': WARN, 'error': ERROR}
+LEVEL_NAMES = {value: name for (name, value) in LEVELS.items()}
+
+MAX_EXAMPLES = 5 # distinct messages listed per category in the summary
+
+class Diagnostics(object):
+
+  def __init__(self, level='info', immediate=False):
+    self.level = LEVELS[level]
+    self.immediate = immediate
+    self.lock = threading.Lock() # messages of image jobs are reported from worker threads
+    self.entries = {}    # (category, pattern, args) => [level, message, count]
+    self.categories = {} # category => [level, distinct keys, count]
+
+  def add(self, level, category, message, args):
+    if self.immediate:
+      print("[{}] {}".format(LEVEL_NAMES[level].upper(), message.format(*args)))
+      return
+    # distinct messages of a category may share their args: the pattern is part of the key
+    try:
+      key = (category, message, args)
+      hash(key)
+    except TypeError:
+      key = (category, message, repr(args))
+    with self.lock:
+      summary = self.categories.setdefault(category, [level, 0, 0])
+      summary[0] = max(summary[0], level)
+      summary[2] += 1
+      entry = self.entries.get(key)
+      if entry is not None:
+        entry[0] = max(entry[0], level)
+        entry[2] += 1
+        return
+      self.entries[key] = [level, message.format(*args), 1]
+      summary[1] += 1
+
+  def getReport(self):
+    res = {}
+    for ((category, _, _), (level, message, count)) in self.entries.items():
+      summary = self.categories[category]
+      item = res.setdefault(category, {'level': LEVEL_NAMES[summary[0]], 'distinct': summary[1], 'count': summary[2], 'messages': []})
+      item['messages'].append({'level': LEVEL_NAMES[level], 'message': message, 'count': count})
+    return res
+
+  def writeReport(self, path):
+    with open(path, 'w') as file:
+      json.dump(self.getReport(), file, indent=2)
+
+  def printSummary(self, level=DEBUG, file=None):
+    # most severe categories first, then by number of occurrences
+    categories = sorted(self.categories.items(), key=lambda item: (-item[1][0], -item[1][2]))
+    for (category, (maxLevel, distinct, count)) in categories:
+      if maxLevel < level:
+        continue
+      print("[{}] {}: {} occurrences ({} distinct)".format(LEVEL_NAMES[maxLevel].upper(), category, count, distinct), file=file)
+      messages = [entry for ((name, _, _), entry) in self.entries.items() if name == category]
+      messages.sort(key=lambda entry: (-entry[0], -entry[2]))
+      for (_, message, occurrences) in messages[:MAX_EXAMPLES]:
+        print("  {}{}".format(message, " (x{})".format(occurrences) if occurrences > 1 else ""), file=file)
+      if len(messages) > MAX_EXAMPLES:
+        print("  ... {} more".format(len(messages) - MAX_EXAMPLES), file=file)
+
+SHARED = Diagnostics(immediate=True)
+
+def getDiagnostics():
+  ctx = context.get()
+  return ctx.diagnostics if ctx.diagnostics is not None else SHARED
+
+def report(level, category, message, args):
+  diagnostics = getDiagnostics()
+  if level >= diagnostics.level:
+    diagnostics.add(level, category, message, args)
+
+# message: str.format pattern of the args, both are the key of the message within its category
+def debug(category, message, *args):
+  report(DEBUG, category, message, args)
+
+def info(category, message, *args):
+  report(INFO, category, message, args)
+
+def warn(category, message, *args):
+  report(WARN, category, message, args)
+
+def error(category, message, *args):
+  report(ERROR, category, message, args)
@@ -1,3 +1,6 @@
+from .pathdata import PathData,formatPaths,pathToTikz
+from .instancing import findInstances,placePics
+
 # expected return format of svgparser
 # NB: a better structure would separate svg parsing & conversion but it is not required here
 # we only separate final emission to allow insertion of information from mxgraph
@@ -12,7 +15,8 @@ IR_FMT = [
         'draw': True, # False to preserve empty containers in the IR
         'cmd': 'str', 
         'opts': {'key': 'value'}, 
-        'path': 'str', 
+        'path': 'str', # or pathdata.PathData (formatted at emission)
+        'geometry': ('kind', 'numbers'), # numeric geometry of str paths (svg units), see bounds.getNodeBox
         # to allow syntax such as `if node['tikz']['content']:` (tri-state)
         'content': {
           'txt': 'str', 
@@ -22,7 +26,8 @@ IR_FMT = [
         'extra': ['str', 'str'], # extra tikz command such as debug points
         'transforms': {} # svg transforms to be applied to a dedicated surrounding scope
       },
-    'svg': {'tag': 'str', 'attrib': {'key': 'value'}}
+    'svg': {'tag': 'str', 'attrib': {'key': 'value'}},
+    'fragment': 'str' # key in the fragment cache (only for cached elements)
   },
   {}, # ad noseam ...
   ]
@@ -30,43 +35,116 @@ IR_FMT = [
 def processOpts(opts):
   res = []
   for opt in opts:
-    res.append("{}={}".format(opt, opts[opt]))
+    if opts[opt] is None: # style or flag without value
+      res.append(opt)
+    else:
+      res.append("{}={}".format(opt, opts[opt]))
   return ','.join(res)
 
+# options specific to each node, kept out of the generated styles
+NODE_OPTS = ('name', 'visible on', 'rotate', 'rotate around')
 
-def emitTikz(ir):
-  res = []
+def internStyles(ir):
+  """ Replaces the option sets shared by several nodes with generated styles (svg2tikz_s<N>)
+  Returns the \\tikzset definitions of the styles, to be emitted before the picture
+  """
+  users = {} # shared options => [(node, node specific options)]
   for node in ir:
-    tikz = node['tikz']
-    if tikz['draw']:
-      content = ''
-      if 'content' in tikz and tikz['content']:
-        content = '{' + tikz['content']['value'] + '}'
-      
-      specs=""
-      if 'cell' in node:
-        tikz['opts']['name'] = node['cell']['name']
-        if node['cell']['overlays'] != "":
-          tikz['opts']['visible on'] = node['cell']['overlays']
-
-      if 'transforms' in tikz and tikz['transforms']:
-        #FIXME: rotate does not apply to scope: 
-        # https://tex.stackexchange.com/questions/310398/rotating-scope-in-tikz
-        # should instead be applied to the node directly => no need for additional scope
-        # res.append("\\begin{{scope}}[{}]".format(processOpts(tikz['transforms'])))
-        for k in tikz['transforms']:
-          if (k == 'rotate' and tikz['cmd'] == "node") or (k == 'rotate around' and tikz['cmd'] != 'node'):
-            tikz['opts'][k] = tikz['transforms'][k]
-
-      opts = processOpts(tikz['opts'])
-      main = "\\{}[{}] {} {};".format(tikz['cmd'], opts, tikz['path'], content)
-      
-      
-      res.append(main)
-      if 'extra' in tikz and tikz['extra']:
-        res += tikz['extra']
-
-      # if 'transforms' in tikz and tikz['transforms']:
-      #   res.append("\\end{scope}")
-
-  return "\n".join(res)
\ No newline at end of file
+    if not node['tikz']['draw']:
+      continue
+    opts = getOpts(node)
+    shared = processOpts({k: opts[k] for k in opts if k not in NODE_OPTS})
+    if shared:
+      users.setdefault(shared, []).append((node, {k: opts[k] for k in opts if k in NODE_OPTS}))
+
+  res = []
+  for (shared, nodes) in users.items():
+    if len(nodes) < 2:
+      continue
+    name = "svg2tikz_s{}".format(len(res))
+    res.append("\\tikzset{{{}/.style={{{}}}}}".format(name, shared))
+    for (node, specific) in nodes:
+      node['tikz']['opts'] = {name: None, **specific}
+  return res
+
+
+def getOpts(node):
+  # options of the draw command, completed with mxgraph infos & transforms
+  tikz = node['tikz']
+  if 'cell' in node:
+    tikz['opts']['name'] = node['cell']['name']
+    if node['cell']['overlays'] != "":
+      tikz['opts']['visible on'] = node['cell']['overlays']
+
+  if 'transforms' in tikz and tikz['transforms']:
+    #FIXME: rotate does not apply to scope: 
+    # https://tex.stackexchange.com/questions/310398/rotating-scope-in-tikz
+    # should instead be applied to the node directly => no need for additional scope
+    # res.append("\\begin{{scope}}[{}]".format(processOpts(tikz['transforms'])))
+    for k in tikz['transforms']:
+      if (k == 'rotate' and tikz['cmd'] == "node") or (k == 'rotate around' and tikz['cmd'] != 'node'):
+        tikz['opts'][k] = tikz['transforms'][k]
+  return tikz['opts']
+
+def emitNode(node, formatted=None):
+  res = []
+  tikz = node['tikz']
+  if tikz['draw']:
+    content = ''
+    if 'content' in tikz and tikz['content']:
+      content = '{' + tikz['content']['value'] + '}'
+    
+    specs=""
+    opts = processOpts(getOpts(node))
+    main = "\\{}[{}] {} {};".format(tikz['cmd'], opts, pathToTikz(tikz['path'], formatted), content)
+    
+    
+    res.append(main)
+    if 'extra' in tikz and tikz['extra']:
+      res += tikz['extra']
+
+    # if 'transforms' in tikz and tikz['transforms']:
+    #   res.append("\\end{scope}")
+
+  return res
+
+FORMAT_WINDOW = 4096 # nodes whose paths are formatted together (bounded memory, still large enough to be vectorized)
+
+def iterTikz(ir, cache=None, instancing=False):
+  """ Generator of the tikz lines of the IR, in the drawing order
+  """
+  # repeated shapes are defined once as pics, their copies are placed in the drawing order
+  placements = {}
+  if instancing:
+    (definitions, placements) = findInstances(ir, getOpts, processOpts)
+    yield from definitions
+
+  formatted = {}
+  formattedUntil = 0
+  emit = lambda node: emitNode(node, formatted)
+
+  index = 0
+  while index < len(ir):
+    if index >= formattedUntil:
+      # the geometry of the next paths is formatted at once (vectorized when available), indexed by path object
+      paths = [node['tikz']['path'] for node in ir[index:index + FORMAT_WINDOW]
+        if node['tikz']['draw'] and isinstance(node['tikz']['path'], PathData) and id(node) not in placements]
+      formatted = dict(zip(map(id, paths), formatPaths(paths)))
+      formattedUntil = index + FORMAT_WINDOW
+
+    node = ir[index]
+    if id(node) in placements:
+      run = []
+      while index < len(ir) and id(ir[index]) in placements:
+        run.append(placements[id(ir[index])])
+        index += 1
+      yield from placePics(run)
+      continue
+    if cache is not None and 'fragment' in node:
+      yield from cache.emit(node, emit)
+    else:
+      yield from emit(node)
+    index += 1
+
+def emitTikz(ir, cache=None, instancing=False):
+  return "\n".join(iterTikz(ir, cache, instancing))
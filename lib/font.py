@@ -1,3 +1,5 @@
+from . import diagnostics
+
 
 
 # Command             10pt    11pt    12pt
@@ -82,4 +84,4 @@ FONT_WEIGHT_MAP = {
 def getFontWeightCmd(weight):
   if weight in FONT_WEIGHT_MAP:
     return FONT_WEIGHT_MAP[weight]
-  print("Unknown font-weight {}".format(weight))
\ No newline at end of file
+  diagnostics.warn('font.weight', "Unknown font-weight {}", weight)
\ No newline at end of file
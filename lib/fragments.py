@@ -0,0 +1,122 @@
+import os
+import pickle
+import hashlib
+import xml.etree.ElementTree as xml
+
+from . import colors,context
+from .common import *
+
+#################################
+# FRAGMENT CACHE: incremental reconversion of unchanged svg elements
+#################################
+# Entries are keyed by a hash of the serialized svg element and of the config keys used by its conversion.
+# Each entry stores the resulting IR and the colors it required (replayed on hits so that color defs stay complete).
+# Emitted lines are cached as well, keyed by the fragment and everything the emitter reads besides geometry.
+# Only the entries used by the current run are saved back: the cache does not grow with stale fragments.
+
+CACHE_VERSION = 3 # to be incremented whenever the conversion of a single element changes
+
+# config keys with an impact on the conversion of a single element
+CONF_KEYS = [
+  'JOIN_QQ_AS_C',
+  'QQ_AS_C_STRENGTH_PERCENT_X',
+  'QQ_AS_C_STRENGTH_PERCENT_Y',
+  'FORCE_Q_AS_C',
+  'Q_AS_C_STRENGTH_PERCENT',
+  'SIMPLIFY_TOLERANCE_PT',
+  'DISPLAY_CONTROL_POINTS',
+  'DISPLAY_TXT_ANCHOR'
+]
+
+def getSalt(conf):
+  return repr([CACHE_VERSION] + [conf[k] for k in CONF_KEYS]).encode()
+
+class FragmentCache(object):
+
+  def __init__(self, path, conf):
+    self.path = path # None: in memory only (watch mode)
+    self.salt = getSalt(conf)
+    self.entries = {}
+    self.lines = {}
+    self.usedEntries = {}
+    self.usedLines = {}
+    self.hits = 0
+    self.misses = 0
+    self.lineHits = 0
+    self.load()
+
+  def load(self):
+    if self.path is None or not os.path.exists(self.path):
+      return
+    try:
+      with open(self.path, 'rb') as file:
+        data = pickle.load(file)
+      if data['version'] == CACHE_VERSION:
+        self.entries = data['entries']
+        self.lines = data['lines']
+    except Exception as e:
+      print("[WARN] Ignoring unreadable fragment cache {}: {}".format(self.path, e))
+
+  def save(self):
+    if self.path is None:
+      return
+    data = {'version': CACHE_VERSION, 'entries': self.usedEntries, 'lines': self.usedLines}
+    writeAtomic(self.path, pickle.dumps(data, pickle.HIGHEST_PROTOCOL), 'wb')
+
+  def getKey(self, elem, group):
+    h = hashlib.sha1(self.salt)
+    if elem.tag == '{http://www.w3.org/2000/svg}text':
+      # text conversion depends on the attributes of the surrounding group
+      h.update(repr(sorted(group.attrib.items())).encode())
+    h.update(xml.tostring(elem))
+    return h.hexdigest()
+
+  def process(self, elem, group, convert):
+    key = self.getKey(elem, group)
+    if key in self.entries:
+      (entries, usedColors) = pickle.loads(self.entries[key])
+      # color names depend on the registration order: only valid if the replay gives the same names
+      if all(colors.useColor(hexColor) == name for (hexColor, name) in usedColors):
+        self.hits += 1
+        self.usedEntries[key] = self.entries[key]
+        return entries
+
+    self.misses += 1
+    recorder = []
+    recorders = context.get().recorders
+    recorders.append(recorder)
+    try:
+      entries = convert(elem, group)
+    finally:
+      recorders.remove(recorder)
+    for entry in entries:
+      entry['fragment'] = key
+    # pickled right away: the IR is modified afterwards (group transforms, mxgraph annotations)
+    self.entries[key] = self.usedEntries[key] = pickle.dumps((entries, recorder), pickle.HIGHEST_PROTOCOL)
+    return entries
+
+  def emit(self, node, emit):
+    tikz = node['tikz']
+    signature = repr((node['fragment'], node.get('cell'), tikz.get('transforms'), tikz['opts']))
+    key = hashlib.sha1(signature.encode()).hexdigest()
+    if key in self.lines:
+      self.lineHits += 1
+      lines = self.lines[key]
+    else:
+      lines = emit(node)
+      self.lines[key] = lines
+    self.usedLines[key] = lines
+    return lines
+
+  def nextRun(self):
+    # the same cache is reused by successive conversions (watch mode): only the entries of the last run are kept
+    self.entries = self.usedEntries
+    self.lines = self.usedLines
+    self.usedEntries = {}
+    self.usedLines = {}
+    self.hits = 0
+    self.misses = 0
+    self.lineHits = 0
+
+  def report(self):
+    print("[INFO] Fragment cache: {} hits, {} misses ({} emitted fragments reused)".format(self.hits, self.misses, self.lineHits))
@@ -1,16 +1,31 @@
-import xml.etree.ElementTree as xml
-from html.parser import HTMLParser
-
 from .colors import *
 from .common import *
 from .font import *
 from .config import App
+from . import context,diagnostics
 
 
 
-class DrawHTMLParser(HTMLParser):
-  __res = []
-  
+XHTML = '{http://www.w3.org/1999/xhtml}'
+
+class DrawHTMLConverter(object):
+  """ html label (foreignObject content) => (tikz text, style), walking the parsed element tree directly
+  A single converter is used for all the labels of a conversion (see getConverter), its state is reset per label.
+  """
+
+  def __init__(self):
+    self.reset()
+
+  def reset(self):
+    # state of the current label (labels of different conversions use different converters, see context.Context)
+    self.__res = []
+    self.__style = {}
+    self.__scopes = [] # inline scopes (cannot be breaked trivially to produce the expected output)
+    self.__pending_br = ""
+    self.__last_was_command = False
+    self.__current_line_max_fontsize = 12
+    self.__seen_content_since_last_div = False
+
   @staticmethod
   def get_styles(styles_str, sep=':'):
     res = {}
@@ -27,17 +42,16 @@ class DrawHTMLParser(HTMLParser):
         res[style] = True
     return res
 
-  __style = {}
   def update_style(self, attrib):
     if 'style' in attrib and 'text-align' in attrib['style']:
-      styles = DrawHTMLParser.get_styles(attrib['style'])
+      styles = DrawHTMLConverter.get_styles(attrib['style'])
       self.__style['text-align'] = styles['text-align']
 
 
     if 'style' in attrib and ('margin-left' in attrib['style'] or 'line-height' in attrib['style']):
       # then attempt to parse CSS stylesheet
       # remove trailing semicolon to avoid last empty entry after split
-      styles = DrawHTMLParser.get_styles(attrib['style'])
+      styles = DrawHTMLConverter.get_styles(attrib['style'])
       for key in styles:
         value = styles[key]
         if len(value) > 2 and value[-2:] == "px":
@@ -53,8 +67,6 @@ class DrawHTMLParser(HTMLParser):
   def handle_font(self, attrib):
     self.handle_inline(attrib)
 
-  # inline scopes (cannot be breaked trivially to produce the expected output)
-  __scopes = []
   # allowbr indicates if the scope must be closed and re-opened to handle a line break
   # header string will be appended after a line break
   def open_scope(self, pre="", header= "", fontscale=1):
@@ -69,7 +81,6 @@ class DrawHTMLParser(HTMLParser):
       if scope['pre'] != '' or scope['header'] != '':
         self.__res.append("}")
 
-  __pending_br = ""
   def check_pending_br(self):
     if self.__pending_br:
       self.__res.append(self.__pending_br)
@@ -108,12 +119,10 @@ class DrawHTMLParser(HTMLParser):
     self.__scopes.clear()
     self.__scopes += reopen_scopes
 
-  __last_was_command = False
-  __current_line_max_fontsize = 12
   def handle_inline(self, attrib, noscope = False):
 
     if 'style' in attrib:
-      attrib |= DrawHTMLParser.get_styles(attrib['style'])
+      attrib |= DrawHTMLConverter.get_styles(attrib['style'])
       del attrib['style']
     res = []
     fontscale = 1
@@ -141,7 +150,7 @@ class DrawHTMLParser(HTMLParser):
             self.__last_was_command = True
             
         case others:
-          print("TODO: unsupported attribute for inline html tag {}".format(others))
+          diagnostics.warn('html.attribute', "Unsupported attribute for inline html tag: {}", others)
     
     res = "".join(res)
     if not noscope:
@@ -178,7 +187,6 @@ class DrawHTMLParser(HTMLParser):
   def handle_span(self, attrib):
     self.handle_inline(attrib)
   
-  __seen_content_since_last_div = False
   def handle_div(self, attrib):
     if self.__seen_content_since_last_div:
       self.handle_br({})
@@ -193,46 +201,45 @@ class DrawHTMLParser(HTMLParser):
       # print(self.__style)
 
 
-  def handle_starttag(self, tag, attrs):
-    attrib = dict(attrs)
+  def handle_starttag(self, tag, attrib):
     self.check_pending_br()
     match tag:
-      case 'html:font':
+      case 'font':
         self.handle_font(attrib)
-      case 'html:br':
+      case 'br':
         self.handle_br(attrib)
-      case 'html:b':
+      case 'b':
         self.handle_b(attrib)
-      case 'html:i':
+      case 'i':
         self.handle_i(attrib)
-      case 'html:span':
+      case 'span':
         self.handle_span(attrib)
-      case 'html:div':
+      case 'div':
         self.handle_div(attrib)
-      case 'html:p':
+      case 'p':
         self.handle_p(attrib)
       case others:
-        print("TODO: Unsupported tag: {}".format(others))
+        diagnostics.warn('html.tag', "Unsupported tag: {}", others)
 
 
   def handle_endtag(self, tag):
     match tag:
-      case 'html:font':
+      case 'font':
         self.close_scope()
-      case 'html:br':
+      case 'br':
         pass
-      case 'html:b':
+      case 'b':
         self.close_scope()
-      case 'html:i':
+      case 'i':
         self.close_scope()
-      case 'html:span':
+      case 'span':
         self.close_scope()
-      case 'html:div':
+      case 'div':
         self.__pending_br = ""
-      case 'html:p':
+      case 'p':
         pass
       case others:
-        print("TODO: Unsupported tag: {}".format(others))
+        diagnostics.warn('html.tag', "Unsupported tag: {}", others)
   
   def handle_data(self, data):
     self.check_pending_br()
@@ -251,21 +258,40 @@ class DrawHTMLParser(HTMLParser):
     clean = clean.replace("#", "\\#")
     self.__res.append(clean)
 
-  def reset(self) -> None:
-    self.__res.clear()
-    self.__style.clear()
-    return super().reset()
-
   def getTikz(self):
     return (''.join(self.__res), self.__style)
 
+  def handle_element(self, elem):
+    # same events as html.parser on the serialized element: start tag, text, children and their tails, end tag
+    tag = elem.tag
+    if not isinstance(tag, str):
+      return # comments, processing instructions
+    tag = (tag[len(XHTML):] if tag.startswith(XHTML) else tag).lower()
+    self.handle_starttag(tag, dict(elem.attrib)) # copy: the handlers consume the style attribute
+    if elem.text:
+      self.handle_data(elem.text)
+    for child in elem:
+      self.handle_element(child)
+      if child.tail:
+        self.handle_data(child.tail)
+    self.handle_endtag(tag)
+
+  def convert(self, html):
+    self.reset()
+    self.handle_element(html)
+    return self.getTikz()
+
+def getConverter():
+  # converter of the current conversion, created on first use
+  ctx = context.get()
+  if ctx.labels is None:
+    ctx.labels = DrawHTMLConverter()
+  return ctx.labels
+
 def processHTML(html, attrib):
-  parser = DrawHTMLParser()
-  raw = xml.tostring(html).decode("utf-8")
   # print(attrib)
   # [{'pointer-events': 'none', 'width': '100%', 'height': '100%', 'requiredFeatures': 'http://www.w3.org/TR/SVG11/feature#Extensibility', 'style': 'overflow: visible; text-align: left;'}]
-  parser.feed(raw)
-  (txt, attr) = parser.getTikz()
+  (txt, attr) = getConverter().convert(html)
   
   # Remove trailing <br>
   split = txt.split("\\\\")
@@ -274,9 +300,7 @@ def processHTML(html, attrib):
   elif split[-1][-3:] == "em]" and split[-1][0] == '[':
     txt = txt[:-(len(split[-1])+2)]
 
-  res = processText(txt, attr)
-  parser.reset()
-  return res
+  return processText(txt, attr)
 
 
 def processText(txt, attr):
@@ -299,7 +323,7 @@ def processText(txt, attr):
       height = attr['font-size'] * attr['line-height']
       yAnchor = attr['padding-top'] + height / 2 * (1 + txt.count("\\\\") * 1.08)
   else:
-    print(attr)
+    diagnostics.debug('html.align', "Label without align-items: {}", str(attr))
   
   opts={} 
   xAnchor = attr['margin-left']
@@ -328,13 +352,14 @@ def processText(txt, attr):
         opts['anchor'] = 'east'
 
       case others:
-        print("Error unable to process text-align {}".format(others))
+        diagnostics.error('html.align', "Unable to process text-align {}", others)
   else:
     opts["line width"] = "{}pt".format(f(attr['width'])) # do NOT use \pt => destroy line break 
     opts["align"] = "center" # required for multiple lines
     xAnchor = attr['margin-left'] + attr['width'] / 2
 
   tikz['path'] = "at ({},-{})".format(f(xAnchor), f(yAnchor))
+  tikz['geometry'] = ('anchor', xAnchor, yAnchor)
   points.append("\\node[shape=circle, draw=orange, fill=orange] at ({},-{}) {{}};".format( f(xAnchor), f(yAnchor)))
 
   if 'color' in attr:
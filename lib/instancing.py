@@ -0,0 +1,99 @@
+from .common import *
+from .pathdata import PathData,MOVE
+
+#################################
+# PIC INSTANCING: shapes repeated at different offsets are defined once and placed with \pic
+#################################
+# Paths are compared with their first point as the origin (command, options and formatted relative geometry).
+# Each shape found at least MIN_COPIES times becomes a \tikzset{svg2tikz pic N/.pic={...}} definition,
+# every copy is replaced in place by a \pic (drawing order is preserved), with its own mxgraph options (INSTANCE_OPTS).
+# Consecutive placements of the same pic along a regular step are folded into a \foreach loop.
+
+INSTANCE_OPTS = ('name', 'visible on') # options specific to each copy, given to \pic
+MIN_SEGMENTS = 3 # smaller paths are not worth a definition
+MIN_COPIES = 2
+MIN_LOOP = 3 # shorter runs of regular placements are emitted one by one
+RESOLUTION = 0.005 # placements of a loop may differ by the rounding of the emitted coordinates
+
+def getPicName(index):
+  return "svg2tikz pic {}".format(index)
+
+def relativeTikz(path):
+  # tikz path relative to its first point (y axis inverted, signs are explicit as coordinates may be negative)
+  c = path.coords
+  (x0, y0) = (c[0], c[1])
+  points = ["({},{})".format(f(c[i] - x0), f(y0 - c[i + 1])) for i in range(0, len(c) - 1, 2)]
+  return path.toTikz(points)
+
+def isInstantiable(node):
+  tikz = node['tikz']
+  path = tikz.get('path')
+  return (tikz['draw'] and isinstance(path, PathData) and len(path) >= MIN_SEGMENTS and path.ops[0] == MOVE
+    and not tikz.get('content') and not tikz.get('extra') and not tikz.get('transforms'))
+
+def findInstances(ir, getOpts, processOpts):
+  """ Returns (definitions, placements)
+  - definitions: tikz lines defining the pics
+  - placements: id(node) => (pic name, x, y, instance options) for the nodes to be replaced by a pic
+  """
+  shapes = {} # (cmd, shared options, relative path) => [nodes]
+  for node in ir:
+    if not isInstantiable(node):
+      continue
+    tikz = node['tikz']
+    opts = getOpts(node)
+    shared = processOpts({k: opts[k] for k in opts if k not in INSTANCE_OPTS})
+    key = (tikz['cmd'], shared, relativeTikz(tikz['path']))
+    shapes.setdefault(key, []).append(node)
+
+  definitions = []
+  placements = {}
+  for (key, nodes) in shapes.items():
+    if len(nodes) < MIN_COPIES:
+      continue
+    (cmd, shared, body) = key
+    name = getPicName(len(definitions))
+    definitions.append("\\tikzset{{{}/.pic={{\\{}[{}] {};}}}}".format(name, cmd, shared, body))
+    for node in nodes:
+      opts = node['tikz']['opts']
+      instance = processOpts({k: opts[k] for k in INSTANCE_OPTS if k in opts})
+      c = node['tikz']['path'].coords
+      placements[id(node)] = (name, c[0], c[1], instance)
+
+  if definitions:
+    print("[INFO] Pic instancing: {} shapes defined for {} copies".format(len(definitions), len(placements)))
+  return (definitions, placements)
+
+def getLoopCoordinate(start, step):
+  if step == 0:
+    return f(start)
+  return "{{{}+\\i*{}}}".format(f(start), f(step))
+
+def placePics(placements):
+  """ \\pic commands of consecutive placements, regular sequences (same pic & options) are folded into loops
+  """
+  res = []
+  i = 0
+  while i < len(placements):
+    (name, x, y, instance) = placements[i]
+    opts = "[{}]".format(instance) if instance else ""
+    # longest regular run starting here (steps as emitted, the drift is bounded by RESOLUTION)
+    length = 1
+    if i + 1 < len(placements) and placements[i + 1][0] == name and placements[i + 1][3] == instance:
+      dx = float(f(placements[i + 1][1] - x))
+      dy = float(f(placements[i + 1][2] - y))
+      length = 2
+      while i + length < len(placements):
+        (otherName, otherX, otherY, otherInstance) = placements[i + length]
+        if (otherName != name or otherInstance != instance
+          or abs(x + length * dx - otherX) > RESOLUTION or abs(y + length * dy - otherY) > RESOLUTION):
+          break
+        length += 1
+    if length < MIN_LOOP:
+      res.append("\\pic{} at ({},-{}) {{{}}};".format(opts, f(x), f(y), name))
+      i += 1
+      continue
+    res.append("\\foreach \\i in {{0,...,{}}} {{\\pic{} at ({},{}) {{{}}};}}".format(
+      length - 1, opts, getLoopCoordinate(x, dx), getLoopCoordinate(0 - y, 0 - dy), name))
+    i += length
+  return res
@@ -0,0 +1,122 @@
+import os
+import re
+
+from . import colors,emitter,bounds
+from .common import *
+from .defs import *
+
+#################################
+# LAYER OUTPUT: one standalone picture per drawio layer, compiled separately (make -j)
+#################################
+# Each layer is written in OUTPUT_DEP_DIR as <raw>-layer-<name>.tex (stable name), a standalone document sharing
+# the bounding box of the whole figure (svg viewBox), so that the compiled layers are stacked without offsets.
+# The main output stacks the layer pdfs (with the overlay specs of each layer) and a makefile builds them:
+#   make -j -C OUTPUT_DEP_DIR -f <raw>-layers.mk
+# Files are only rewritten when their content changes: make only rebuilds the layers which changed.
+
+LAYER_NAME = re.compile(r"[^A-Za-z0-9_-]+")
+
+def getLayerFile(conf, name):
+  return "{}-layer-{}".format(conf['SIDE_FILES_RAW'], LAYER_NAME.sub('_', name))
+
+def splitLayers(ir):
+  """ Returns [(layer name, nodes)] in the drawing order
+  Nodes are assigned by mxgraph annotations, nodes without annotation follow the previous node.
+  """
+  res = {}
+  layer = 'default'
+  for node in ir:
+    if 'cell' in node and 'layer' in node['cell']:
+      layer = node['cell']['layer']
+    res.setdefault(layer, []).append(node)
+  return list(res.items())
+
+def getBoundingBox(rootAttrib):
+  # svg viewBox (or size) of the figure, in tikz coordinates (y axis inverted)
+  box = bounds.getViewBox(rootAttrib)
+  return bounds.getBoundingBox(box) if box is not None else None
+
+def getLayerBox(ir, name):
+  # extent of the nodes of the given layer, None if unknown or empty
+  for (layer, nodes) in splitLayers(ir):
+    if layer == name:
+      return bounds.getFigureBox(nodes)
+  return None
+
+def getLayerOverlays(mxgraph, name):
+  # overlay specs of the whole layer (specs of single cells cannot be applied to a compiled layer)
+  if mxgraph is None or name not in mxgraph.layers:
+    return ""
+  specs = mxgraph.groups[mxgraph.layers[name]['id']]['overlays']
+  if isinstance(specs, dict):
+    print("[WARN] Overlay specs of single cells are ignored in layer output (layer {})".format(name))
+    specs = specs['default'] if 'default' in specs else ""
+  return specs
+
+def getLayerTex(conf, nodes, bbox, styles, cache):
+  res = ['\\documentclass{standalone}', PREAMBLE]
+  # included images are relative to OUTPUT_DIR, layers are compiled in OUTPUT_DEP_DIR
+  relative = os.path.relpath(conf['OUTPUT_DIR'], conf['OUTPUT_DEP_DIR']).replace(os.sep, '/')
+  res.append("\\graphicspath{{{{{}/}}}}".format(relative))
+  res += colors.getColorDefs()
+  res += styles
+  res.append(SCALE() + BASE())
+  if bbox:
+    res.append(bbox)
+  # overlays are applied to the whole layer by the main output
+  for node in nodes:
+    if 'cell' in node and node['cell']['overlays'] != "":
+      node['cell'] = dict(node['cell'], overlays="")
+  res += emitter.iterTikz(nodes, cache, conf['PIC_INSTANCING'])
+  res.append(TIKZ_END)
+  res.append(FOOTER)
+  return '\n'.join(res)
+
+def getMakefile(conf, files):
+  return """# generated by svg2tikz, layers of {raw}: make -j -C {dir} -f {raw}-layers.mk
+PDFLATEX ?= pdflatex
+LAYERS = {pdfs}
+
+all: $(LAYERS)
+
+$(LAYERS): %.pdf: %.tex
+\t$(PDFLATEX) -interaction=batchmode -halt-on-error $<
+""".format(raw=conf['SIDE_FILES_RAW'], dir=conf['OUTPUT_DEP_DIR'], pdfs=' '.join(file + '.pdf' for file in files))
+
+def writeLayers(ir, mxgraph, rootAttrib, styles, cache, conf, bbox=None):
+  """ Writes the layer pictures and their makefile, returns the main output stacking the compiled layers
+  bbox: bounding box commands of the layers (cropped figure), the svg viewBox by default
+  """
+  bbox = bbox or getBoundingBox(rootAttrib)
+  if bbox is None:
+    print("[WARN] Unknown size of the figure, layers may not be aligned")
+
+  files = []
+  updated = 0
+  includes = []
+  for (name, nodes) in splitLayers(ir):
+    if not any(node['tikz']['draw'] for node in nodes):
+      continue
+    file = getLayerFile(conf, name)
+    files.append(file)
+    if writeIfChanged(conf['OUTPUT_DEP_DIR'] + '/' + file + '.tex', getLayerTex(conf, nodes, bbox, styles, cache)):
+      updated += 1
+    include = "\\includegraphics{{{}/{}.pdf}}".format(conf['DEP_DIR'], file)
+    specs = getLayerOverlays(mxgraph, name)
+    if specs:
+      include = "\\visible{}{{{}}}".format(specs, include)
+    includes.append(include)
+
+  writeIfChanged(conf['OUTPUT_DEP_DIR'] + '/' + conf['SIDE_FILES_RAW'] + '-layers.mk', getMakefile(conf, files))
+  print("[INFO] Layer output: {} layers ({} updated), to be compiled with: make -j -C {} -f {}-layers.mk".format(
+    len(files), updated, conf['OUTPUT_DEP_DIR'], conf['SIDE_FILES_RAW']))
+
+  # layers are stacked: all but the last one have no width
+  res = ["% layers of {} (see {}/{}-layers.mk)".format(conf['INPUT_FILENAME'], conf['DEP_DIR'], conf['SIDE_FILES_RAW'])]
+  res.append("\\begingroup%")
+  for include in includes[:-1]:
+    res.append("\\rlap{{{}}}%".format(include))
+  if includes:
+    res.append(includes[-1] + "%")
+  res.append("\\endgroup")
+  return '\n'.join(res) + '\n'
@@ -0,0 +1,208 @@
+import re
+import html
+import zlib
+import codecs
+import itertools
+import binascii
+import urllib.parse
+import xml.etree.ElementTree as xml
+
+from .common import *
+
+#################################
+# MXFILE: pages of the drawio file embedded in the svg, streaming decoder of the selected page
+#################################
+# <mxfile><diagram name="Page-1" id="...">PAYLOAD</diagram>...</mxfile> where each PAYLOAD is either the raw
+# <mxGraphModel> or its compressed form: base64(deflate(urlencode(model))). The mxfile is decoded chunk by chunk:
+# incremental unquoting, chunked base64, zlib.decompressobj and an XMLPullParser yielding the cells one by one
+# (see iterCells): neither the inflated model nor its tree are ever kept in memory.
+
+PARSE_DIAGRAM = re.compile(r'<diagram\b([^>]*?)(/?)>')
+PARSE_ATTRIB = re.compile(r'([\w:-]+)="([^"]*)"')
+DIAGRAM_END = '</diagram>'
+CHUNK_SIZE = 1 << 16
+
+def getPage(tag, index):
+  # page described by a <diagram> tag (match of PARSE_DIAGRAM)
+  attrib = {k: html.unescape(v) for (k, v) in PARSE_ATTRIB.findall(tag.group(1))}
+  return {'index': index, 'name': attrib.get('name', "Page-{}".format(index + 1)), 'id': attrib.get('id')}
+
+def isSelected(page, spec):
+  # page given by its name or its index (1 for the first page), the first page by default
+  # the first matching page is used, both when streaming (see iterPayload) and when the pages are known (see selectPage)
+  if spec is None or spec == '':
+    return page['index'] == 0
+  spec = str(spec)
+  return page['name'] == spec or (spec.isdigit() and int(spec) == page['index'] + 1)
+
+def selectPage(pages, spec=None):
+  if not pages:
+    raise ValueError("No page (diagram element) in the mxfile")
+  for page in pages:
+    if isSelected(page, spec):
+      return page
+  raise ValueError("Unknown page {} (pages: {})".format(spec, getPageNames(pages)))
+
+def getPageNames(pages):
+  return ', '.join("{} ({})".format(page['index'] + 1, page['name']) for page in pages)
+
+#################################
+# STREAMING DECODER
+#################################
+def scanPages(content):
+  """ Pages of the mxfile (quoted, as in the svg: str or stream of chunks): [{'index', 'name', 'id'}]
+  The mxfile is unquoted chunk by chunk to find the <diagram> tags, no page is decoded
+  """
+  pages = []
+  buffer = ''
+  for chunk in iterUnquoted(iterChunks(content)):
+    buffer += chunk
+    pos = 0
+    for tag in PARSE_DIAGRAM.finditer(buffer):
+      pages.append(getPage(tag, len(pages)))
+      pos = tag.end()
+    # the next tag may be split across chunks
+    start = buffer.rfind('<', pos)
+    buffer = buffer[start:] if start >= 0 else ''
+  return pages
+
+def iterChunks(content):
+  if isinstance(content, str):
+    for start in range(0, len(content), CHUNK_SIZE):
+      yield content[start:start + CHUNK_SIZE]
+  else:
+    yield from content
+
+def iterUnquoted(chunks):
+  """ urllib.parse.unquote of a stream of text or byte chunks (escapes and utf-8 sequences may be split across chunks)
+  """
+  decoder = codecs.getincrementaldecoder('utf-8')('replace')
+  tail = None
+  for chunk in chunks:
+    text = chunk if tail is None else tail + chunk
+    # incomplete escape at the end: '%' or '%X'
+    cut = text.find(b'%' if isinstance(text, bytes) else '%', max(0, len(text) - 2))
+    (text, tail) = (text[:cut], text[cut:]) if cut >= 0 else (text, text[:0])
+    if text:
+      yield decoder.decode(urllib.parse.unquote_to_bytes(text))
+  rest = decoder.decode(urllib.parse.unquote_to_bytes(tail) if tail else b'', final=True)
+  if rest:
+    yield rest
+
+def iterPayload(chunks, spec, pages):
+  """ Yields the payload of the selected page of the (unquoted) mxfile chunk by chunk
+  pages: list completed with the pages seen in the mxfile (all of them once the stream is consumed)
+  """
+  buffer = ''
+  inside = False
+  done = False
+  for chunk in chunks:
+    buffer += chunk
+    while True:
+      if inside:
+        end = buffer.find(DIAGRAM_END)
+        if end < 0:
+          # the end tag may be split across chunks
+          keep = len(buffer) - len(DIAGRAM_END) + 1
+          if keep > 0:
+            yield buffer[:keep]
+            buffer = buffer[keep:]
+          break
+        yield buffer[:end]
+        buffer = buffer[end + len(DIAGRAM_END):]
+        (inside, done) = (False, True)
+        continue
+      tag = PARSE_DIAGRAM.search(buffer)
+      if tag is None:
+        # the next tag may be split across chunks
+        start = buffer.rfind('<')
+        buffer = buffer[start:] if start >= 0 else ''
+        break
+      page = getPage(tag, len(pages))
+      pages.append(page)
+      buffer = buffer[tag.end():]
+      if not done and isSelected(page, spec):
+        done = True
+        inside = not tag.group(2) # empty page
+  if not done:
+    selectPage(pages, spec) # raises the error: no page or unknown page
+
+def iterBase64(chunks):
+  # base64 decoding of a stream of text chunks (whitespaces ignored)
+  tail = ''
+  for chunk in chunks:
+    text = tail + ''.join(chunk.split())
+    cut = len(text) - len(text) % 4
+    tail = text[cut:]
+    if cut:
+      yield binascii.a2b_base64(text[:cut])
+  if tail:
+    yield binascii.a2b_base64(tail)
+
+def iterInflated(chunks):
+  # raw deflate (no zlib header) of a stream of byte chunks
+  inflater = zlib.decompressobj(-15)
+  for chunk in chunks:
+    data = inflater.decompress(chunk)
+    if data:
+      yield data
+  data = inflater.flush()
+  if data:
+    yield data
+
+def iterModel(payload):
+  """ Text of the <mxGraphModel> of a page payload (compressed or raw), chunk by chunk ; nothing for an empty page
+  """
+  payload = iter(payload)
+  first = ''
+  for chunk in payload:
+    first += chunk
+    if first.strip():
+      break
+  if not first.strip():
+    return
+  chunks = itertools.chain([first], payload)
+  # for curious reason some newer versions does not seem to compress the diagram anymore ...?
+  if first.lstrip().startswith('<'):
+    yield from chunks
+  else:
+    yield from iterUnquoted(iterInflated(iterBase64(chunks)))
+
+def iterCells(content, page=None, xmlOutput=None, pages=None):
+  """ Yields the children of <root> (mxCell) of the selected page of the mxfile, each one released once processed
+  content: mxfile (str) or stream of chunks ; page: name or index (1 for the first one), the first page by default
+  xmlOutput: optional file receiving the decoded model (debug) ; pages: optional list completed with the pages
+  """
+  pages = [] if pages is None else pages
+  model = iterModel(iterPayload(iterUnquoted(iterChunks(content)), page, pages))
+  if xmlOutput:
+    with openAtomic(xmlOutput) as file:
+      yield from parseCells(dump(model, file))
+  else:
+    yield from parseCells(model)
+
+def dump(chunks, file):
+  for chunk in chunks:
+    file.write(chunk)
+    yield chunk
+
+def parseCells(chunks):
+  parser = xml.XMLPullParser(events=('start', 'end'))
+  depth = 0
+  root = None
+  empty = True
+  for chunk in chunks:
+    parser.feed(chunk)
+    empty = False
+    for (event, elem) in parser.read_events():
+      if event == 'start':
+        depth += 1
+        if depth == 2:
+          root = elem # <mxGraphModel><root>
+      else:
+        depth -= 1
+        if depth == 2:
+          yield elem
+          root.remove(elem)
+  if not empty:
+    parser.close()
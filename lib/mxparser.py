@@ -4,21 +4,30 @@ import base64
 import zlib
 import urllib.parse
 
-from .htmlparser import DrawHTMLParser
+from . import profiling,diagnostics,alignment,mxfile
+from .htmlparser import DrawHTMLConverter
 from .common import *
 from .config import App
 
 
 class MxGraph(object):
 
-  groups = {} # the base type
-  layers = {} # just pointer towards groups
-  leaves = {} # id to index map (avoid copy of values)
-  lst = [] # main linear storage
+  def __init__(self):
+    self.groups = {} # the base type
+    self.layers = {} # just pointer towards groups
+    self.leaves = {} # id to index map (avoid copy of values)
+    self.lst = [] # main linear storage
 
   def sanitizeTikzName(self, name):
     return name.replace('.', '_') # other to add ?
 
+  def getLayer(self, groupId):
+    # name of the layer containing the given group (or layer)
+    group = self.groups.get(groupId)
+    while group is not None and not group.get('isLayer'):
+      group = self.groups.get(group['parent'])
+    return group['name'] if group is not None else 'default'
+
   def checkPoint(self, path, x, y):
     SHIFT_Y=-170
     SHIFT_X=574
@@ -26,9 +35,44 @@ class MxGraph(object):
     print(exp_tikz)
     return exp_tikz in path
 
+  def getCell(self, mxNode):
+    # annotation of the IR nodes drawn by the given leaf
+    name = mxNode['id']
+    if 'shape' in mxNode:
+      name = mxNode['shape'] + '_' + name
+    if 'image' in mxNode['style']:
+      if mxNode['style']['image'] != False and '.' in mxNode['style']['image']:
+        filename=mxNode['style']['image'].split('/')[-1]
+        name = filename + '_' + name # FIXME: should use both name and id as separate attributes
+    return {
+      'id': mxNode['id'], 
+      'group': mxNode['parent'], 
+      'name': self.sanitizeTikzName(name),
+      'overlays': mxNode['overlays'],
+      'layer': self.getLayer(mxNode['parent'])
+    }
+
+  def annotateSpatial(self, svg):
+    (assignments, matched, offset) = alignment.align(self, svg)
+    cells = {}
+    for (svgIndex, mxNodeIndex) in assignments:
+      if mxNodeIndex not in cells:
+        cells[mxNodeIndex] = self.getCell(self.lst[mxNodeIndex])
+      svg[svgIndex]['cell'] = cells[mxNodeIndex]
+    leaves = sum(1 for mxNode in self.lst if mxNode['type'] == "leaf" and mxNode['visible'])
+    print("[INFO] Spatial alignment: offset ({}, {}), {} nodes matched by position, {} by drawing order, {} cells without node".format(
+      f(offset[0]), f(offset[1]), matched, len(assignments) - matched, leaves - len(cells)))
+    # nodes matched by drawing order only inherit the cell of the previous node: many of them hint at a wrong offset
+    if assignments and matched >= alignment.MIN_MATCHED * len(assignments):
+      print("[SUCCESS] mxgraph aligned with tikz nodes: {}/{} matched by position".format(matched, len(assignments)))
+    else:
+      print("[WARN] Weak spatial alignment: {}/{} tikz nodes matched by position, overlay specs may be wrong".format(matched, len(assignments)))
+
   def annotate(self, svg):
     print("[INFO] Starting tikz/mxgraph alignment & annotation")
     conf = App.config()
+    if conf['ALIGNMENT'] == 'spatial':
+      return self.annotateSpatial(svg)
     shapes = conf['MXGRAPH_SHAPES']
     ignore_mxtext_newlines = conf['IGNORE_MXTEXT_NEWLINES']
     max_elt_for_txt_node = conf['MAX_ELT_FOR_TXT_NODE']
@@ -48,11 +92,8 @@ class MxGraph(object):
         # basic alignment checking operations
         if 'sourcePoint' in mxNode['geometry'] and 'targetPoint' in mxNode['geometry']:
           if not 'draw' in svgNode['cmd']:
-            print("[FAILED] expected draw command for source and target points")
-            print(mxNode['geometry'])
-            print(mxNode['id'])
-            print(svgNode)
-            print("---")
+            diagnostics.error('mxgraph.alignment', "Expected draw command for source and target points of {}, got {} {}",
+              mxNode['id'], svgNode['cmd'], svgNode.get('path'))
           else:
             src = mxNode['geometry']['sourcePoint']
             target = mxNode['geometry']['targetPoint']
@@ -76,21 +117,12 @@ class MxGraph(object):
 
         # TODO: deal with shapes properly 
         # => needs further info = local dictionary (could be populated from sources of drawio itself)
-        name = mxNode['id']
         length = 1
         if 'shape' in mxNode:
-          name = mxNode['shape'] + '_' + name
           if mxNode['shape'] in shapes:
             length = shapes[mxNode['shape']] # not += but = 
           else:
-            print("Unknown shape, please extend config: "+ mxNode['shape'])
-
-        if 'image' in mxNode['style']:
-          # print(mxNode['style']['image'])
-          if mxNode['style']['image'] != False and '.' in mxNode['style']['image']:
-            filename=mxNode['style']['image'].split('/')[-1]
-            name = filename + '_' + name # FIXME: should use both name and id as separate attributes
-
+            diagnostics.warn('mxgraph.shape', "Unknown shape, please extend config: {}", mxNode['shape'])
 
         if 'endArrow' in mxNode['style'] and mxNode['style']['endArrow'] != "none":
           length += 1
@@ -124,19 +156,14 @@ class MxGraph(object):
             # formatted text in drawio: splitted in separated svg nodes ....
             length += mxNode['txt'].count("\n")
           if max_elt_for_txt_node and length > max_elt_for_txt_node:
-            print("Fixing length to {} for node {}".format(max_elt_for_txt_node, mxNode['id']))
+            diagnostics.info('mxgraph.length', "Fixing length to {} for node {}", max_elt_for_txt_node, mxNode['id'])
             length = max_elt_for_txt_node
 
         # infos
         # print("Align: #{} {} -- {} ({})".format(svgIndex, svgNode['cmd'], mxNode['id'], length))
 
         # annotate all the corresponding nodes with  
-        cell = {
-          'id': mxNode['id'], 
-          'group': mxNode['parent'], 
-          'name': self.sanitizeTikzName(name),
-          'overlays': mxNode['overlays']
-        }
+        cell = self.getCell(mxNode)
         applied = 0
         while applied < length:
           if svg[svgIndex]['tikz']['draw']: # skip empty nodes
@@ -144,7 +171,7 @@ class MxGraph(object):
             applied += 1
           if applied == length and mxNode['txt']:
             if svg[svgIndex]['tikz']['cmd'] != "node":
-              print("[ERROR] Expected text node here. {}".format(cell['id']))
+              diagnostics.error('mxgraph.alignment', "Expected text node here: {}", cell['id'])
 
           svgIndex += 1
           if svgIndex == len(svg) and applied < length:
@@ -159,9 +186,16 @@ class MxGraph(object):
 
 
 
-  def parseRaw(self, raw, xmlOutput = None ):
-    diag = MxGraph.getEmbeddedDrawDiagram(raw, xmlOutput)
-    self.parseMxDiagram(diag)
+  def parseRaw(self, raw, xmlOutput = None, page = None):
+    # cells are registered while the mxfile is decoded (see mxfile.iterCells), and released right after
+    overlaySpecs = App.config()['OVERLAYS']
+    pages = []
+    with profiling.stage('mxfile decoding & parsing'):
+      for child in mxfile.iterCells(raw, page, xmlOutput, pages):
+        self.parseMxCell(child, overlaySpecs)
+    if len(pages) > 1:
+      selected = mxfile.selectPage(pages, page)
+      print("[INFO] mxfile of {} pages, using page {} ({})".format(len(pages), selected['index'] + 1, selected['name']))
 
 
   @staticmethod
@@ -171,35 +205,20 @@ class MxGraph(object):
     return urllib.parse.unquote(inflated)
 
   @staticmethod
-  def getEmbeddedDrawDiagram(content, xmlOutput=None):
-    unquoted = urllib.parse.unquote(content)
-    mxTree = xml.fromstring(unquoted)
-    # only one child: either encoded diagram or raw diagram
-    # for curious reason some newer versions does not seem to compress the diagram anymore ...?
-
-    if not mxTree[0].text.strip() == '':
-      diag = MxGraph.decodeDrawDiagram(mxTree[0].text)
-      diagRoot = xml.fromstring(diag)
-      mode = 'w'
-    else:
-      diagRoot = mxTree[0][0]
-      diag = xml.tostring(diagRoot)
-      mode = 'wb'
-
-    if xmlOutput:
-      with open(xmlOutput, mode) as f:
-        f.write(diag)
-        
-    return diagRoot[0] # only one <root></root> container at root
+  def getEmbeddedDrawDiagram(content, xmlOutput=None, page=None):
+    # <root> of the selected page, as a whole tree (see parseRaw for the streaming parsing)
+    diagRoot = xml.Element('root')
+    diagRoot.extend(mxfile.iterCells(content, page, xmlOutput))
+    return diagRoot
 
   @staticmethod
   def parseMxArray(mxArray):
     res = []
     for child in mxArray:
       if child.tag != "mxPoint":
-        print("ERROR: Unable to process mxGeometry point: {}".format(child.tag))
-      elif 'x' in child.attrib and 'y' in child.attrib:
-        res.append({'x': child.attrib['x'], 'y':child.attrib['y']})
+        diagnostics.error('mxgraph.geometry', "Unable to process mxGeometry point: {}", child.tag)
+      elif 'x' in child.attrib or 'y' in child.attrib:
+        res.append({'x': child.attrib.get('x', "0"), 'y': child.attrib.get('y', "0")})
 
     return res
 
@@ -208,23 +227,24 @@ class MxGraph(object):
     res = {}
     for child in mxCell:
       if child.tag != "mxGeometry":
-        print("ERROR: Unable to process mxCell geometry: {}".format(child.tag))
+        diagnostics.error('mxgraph.geometry', "Unable to process mxCell geometry: {}", child.tag)
       else:
         if 'width' in child.attrib:
           res['width'] = child.attrib['width']  
         if 'height' in child.attrib:
           res['height'] = child.attrib['height']
-        if 'x' in child.attrib and 'y' in child.attrib:
-          res['pos'] = {'x': child.attrib['x'], 'y': child.attrib['y']}
+        # drawio omits the null coordinates
+        if 'x' in child.attrib or 'y' in child.attrib:
+          res['pos'] = {'x': child.attrib.get('x', "0"), 'y': child.attrib.get('y', "0")}
         for point in child:
           match point.tag:
             case 'mxPoint':
-              if 'x' in point.attrib and 'y' in point.attrib:
-                res[point.attrib['as']] = {'x': point.attrib['x'], 'y': point.attrib['y']}
+              if 'x' in point.attrib or 'y' in point.attrib:
+                res[point.attrib['as']] = {'x': point.attrib.get('x', "0"), 'y': point.attrib.get('y', "0")}
             case 'Array':
               res['control'] = MxGraph.parseMxArray(point)
             case others:
-              print("ERROR: Unable to process mxGeometry point: {}".format(point.tag))
+              diagnostics.error('mxgraph.geometry', "Unable to process mxGeometry point: {}", point.tag)
     return res
 
   # Investigation of mxgraph xml hierarchy
@@ -240,96 +260,101 @@ class MxGraph(object):
   def parseMxDiagram(self, root):
     overlaySpecs = App.config()['OVERLAYS']
     for child in root:
-      if child.tag != "mxCell":
-        print("ERROR: Unable to process diagram element: {}".format(child.tag))
-      elif child.attrib['id'] == "0":
-        # skipping the 1 first root nodes
-        pass
-      else:
-        mxCell = {}
-        mxCell['id'] = child.attrib['id']
-        mxCell['parent'] = child.attrib['parent']
-        # print(child.attrib)
-        style = child.attrib['style'] if 'style' in child.attrib else "" 
-
-        ################### NEW LAYER ###################
-        if child.attrib['parent'] == "0":
-          # this is a custom layer
-          visible = not 'visible' in child.attrib or child.attrib['visible'] != "0"
-          if child.attrib['id'] == "1":
-            # special case for default background layer
-            name = 'default'
-          else:
-            name = child.attrib['value']
-          specs = overlaySpecs[name] if name in overlaySpecs else ""
-          print("Specs for {}: {}".format(name, specs))
-          self.layers[name] = {
-            'id': child.attrib['id'], 
-            'style': style
+      self.parseMxCell(child, overlaySpecs)
+
+  def parseMxCell(self, child, overlaySpecs):
+    if child.tag != "mxCell":
+      diagnostics.error('mxgraph.element', "Unable to process diagram element: {}", child.tag)
+    elif child.attrib['id'] == "0":
+      # skipping the 1 first root nodes
+      pass
+    else:
+      mxCell = {}
+      mxCell['id'] = child.attrib['id']
+      mxCell['parent'] = child.attrib['parent']
+      # print(child.attrib)
+      style = child.attrib['style'] if 'style' in child.attrib else "" 
+
+      ################### NEW LAYER ###################
+      if child.attrib['parent'] == "0":
+        # this is a custom layer
+        visible = not 'visible' in child.attrib or child.attrib['visible'] != "0"
+        if child.attrib['id'] == "1":
+          # special case for default background layer
+          name = 'default'
+        else:
+          name = child.attrib['value']
+        specs = overlaySpecs[name] if name in overlaySpecs else ""
+        diagnostics.debug('mxgraph.overlays', "Specs for {}: {}", name, str(specs))
+        self.layers[name] = {
+          'id': child.attrib['id'], 
+          'style': style
+        }
+        self.groups[child.attrib['id']] = {
+          'name': name,
+          'parent': "0", 
+          'children': [], 
+          'overlays': specs, 
+          'visible': visible, 
+          'isLayer': True
           }
-          self.groups[child.attrib['id']] = {
-            'name': name,
-            'parent': "0", 
-            'children': [], 
-            'overlays': specs, 
-            'visible': visible, 
-            'isLayer': True
-            }
-          mxCell['type'] = "layer"
-          mxCell['overlays'] = specs
-          # print("New layer: {} (visible: {}; style: {})".format(name, visible, style))
+        mxCell['type'] = "layer"
+        mxCell['overlays'] = specs
+        # print("New layer: {} (visible: {}; style: {})".format(name, visible, style))
 
+      else:
+        # register child to its parent
+        if not child.attrib['parent'] in self.groups:
+          diagnostics.error('mxgraph.parent', "Detached leaf, unknown parent: {}", child.attrib['parent'])
+          visible = False
+          parent = self.groups['1'] # default group
         else:
-          # register child to its parent
-          if not child.attrib['parent'] in self.groups:
-            print("Error: detached leaf, unknown parent: {}".format(child.attrib['parent']))
-            visible = False
-            parent = self.groups['1'] # default group
-          else:
-            parent = self.groups[child.attrib['parent']]
-            visible = parent['visible']
-          parent['children'].append({'id': child.attrib['id'], 'nid':len(self.lst)})
-          mxCell['visible'] = visible
-          
-          # inherit overlay specs
-          specs = parent['overlays']
-          if isinstance(specs, dict):
-            if child.attrib['id'] in specs:
-              specs = specs[child.attrib['id']]
-            else:
-              specs = specs['default']
-          mxCell['overlays'] = specs
-          
-          ################### NEW GROUP ###################
-          if child.attrib['style'][0:5] == "group":
-            mxCell['type'] = "group"
-
-            self.groups[child.attrib['id']] = {
-              'parent': child.attrib['parent'], 
-              'children': [], 
-              'overlays': specs, # specs property is inherited from parent
-              'visible': visible # visible property is inherited from parent
-            }
-            style = ""
+          parent = self.groups[child.attrib['parent']]
+          visible = parent['visible']
+        parent['children'].append({'id': child.attrib['id'], 'nid':len(self.lst)})
+        mxCell['visible'] = visible
+        
+        # inherit overlay specs
+        specs = parent['overlays']
+        if isinstance(specs, dict):
+          if child.attrib['id'] in specs:
+            specs = specs[child.attrib['id']]
           else:
-            # print("mxCell {} with parent {}".format(child.attrib['id'], child.attrib['parent']))
-            mxCell['type'] = "leaf"
-            self.leaves[child.attrib['id']] = len(self.lst)
-
-  
-        # for conciseness
-        if 'image=data:image/' in style:
-          mxCell['style'] = {'image': "EMBEDDED IMAGE OMITTED FOR CONCISENESS"}
-        else:
-          styles = DrawHTMLParser.get_styles(style, '=')
-          if 'shape' in styles:
-            mxCell['shape'] = styles['shape']
-          mxCell['style'] = styles
-        mxCell['geometry'] = MxGraph.parseMxGeometry(child)
-        if 'value' in child.attrib and child.attrib['value']: # must not be empty to be valid
-          mxCell['txt'] = child.attrib['value']
+            specs = specs['default']
+        mxCell['overlays'] = specs
+        
+        ################### NEW GROUP ###################
+        if child.attrib['style'][0:5] == "group":
+          mxCell['type'] = "group"
+
+          self.groups[child.attrib['id']] = {
+            'parent': child.attrib['parent'], 
+            'children': [], 
+            'overlays': specs, # specs property is inherited from parent
+            'visible': visible # visible property is inherited from parent
+          }
+          style = ""
         else:
-          mxCell['txt'] = ""
-        self.lst.append(mxCell)
+          # print("mxCell {} with parent {}".format(child.attrib['id'], child.attrib['parent']))
+          mxCell['type'] = "leaf"
+          self.leaves[child.attrib['id']] = len(self.lst)
+
+
+      # for conciseness
+      if 'image=data:image/' in style:
+        mxCell['style'] = {'image': "EMBEDDED IMAGE OMITTED FOR CONCISENESS"}
+      else:
+        styles = DrawHTMLConverter.get_styles(style, '=')
+        if 'shape' in styles:
+          mxCell['shape'] = styles['shape']
+        mxCell['style'] = styles
+      mxCell['geometry'] = MxGraph.parseMxGeometry(child)
+      if child.attrib.get('edge') == "1":
+        mxCell['edge'] = {'source': child.attrib.get('source'), 'target': child.attrib.get('target')}
+      if 'value' in child.attrib and child.attrib['value']: # must not be empty to be valid
+        mxCell['txt'] = child.attrib['value']
+      else:
+        mxCell['txt'] = ""
+      self.lst.append(mxCell)
 
 
@@ -0,0 +1,270 @@
+import math
+from array import array
+
+from .common import *
+from .vector import formatPoints,transformCoords
+
+#################################
+# COMPACT PATH IR: opcodes + flat buffer of coordinates (svg units, y axis downwards)
+#################################
+# Geometry stays numeric until the emission: later stages (transforms, culling, simplification)
+# work on the coordinates, and the tikz text is produced in a single join-based pass (toTikz)
+
+MOVE = 0      # x y
+LINE = 1      # x y
+CUBIC = 2     # cx1 cy1 cx2 cy2 x y
+QUADRATIC = 3 # cx cy x y (single control point curve of tikz)
+CLOSE = 4     #
+OP_SIZE = (2, 2, 6, 4, 0)
+
+def getCubicExtrema(p0, p1, p2, p3):
+  # coordinates of the inner extrema of a cubic bezier along one axis (roots of the derivative within ]0, 1[)
+  a = p1 - p0
+  b = p2 - p1
+  c = p3 - p2
+  (qa, qb, qc) = (a - 2 * b + c, 2 * (b - a), a)
+  if abs(qa) < 1e-12:
+    roots = [-qc / qb] if abs(qb) > 1e-12 else []
+  else:
+    delta = qb * qb - 4 * qa * qc
+    if delta < 0:
+      return []
+    sqrt = math.sqrt(delta)
+    roots = [(-qb + sqrt) / (2 * qa), (-qb - sqrt) / (2 * qa)]
+  res = []
+  for t in roots:
+    if 0 < t < 1:
+      u = 1 - t
+      res.append(u * u * u * p0 + 3 * u * u * t * p1 + 3 * u * t * t * p2 + t * t * t * p3)
+  return res
+
+class PathData(object):
+  __slots__ = ('ops', 'coords')
+
+  def __init__(self):
+    self.ops = bytearray()
+    self.coords = array('d')
+
+  def __len__(self):
+    return len(self.ops)
+
+  def move(self, x, y):
+    self.ops.append(MOVE)
+    self.coords.append(x)
+    self.coords.append(y)
+
+  def line(self, x, y):
+    self.ops.append(LINE)
+    self.coords.append(x)
+    self.coords.append(y)
+
+  def cubic(self, cx1, cy1, cx2, cy2, x, y):
+    self.ops.append(CUBIC)
+    self.coords.extend((cx1, cy1, cx2, cy2, x, y))
+
+  def quadratic(self, cx, cy, x, y):
+    self.ops.append(QUADRATIC)
+    self.coords.extend((cx, cy, x, y))
+
+  def close(self):
+    self.ops.append(CLOSE)
+
+  def segments(self):
+    # (opcode, index of its first coordinate)
+    index = 0
+    for op in self.ops:
+      yield (op, index)
+      index += OP_SIZE[op]
+
+  def points(self):
+    # end points of all the segments (x, y)
+    c = self.coords
+    res = []
+    for (op, index) in self.segments():
+      if op != CLOSE:
+        size = OP_SIZE[op]
+        res.append((c[index + size - 2], c[index + size - 1]))
+    return res
+
+  def translate(self, dx, dy):
+    transformCoords(self.coords, (1, 0, 0, 1, dx, dy))
+
+  def transform(self, a, b, c, d, e, f):
+    # affine transform, svg matrix(a b c d e f) convention
+    transformCoords(self.coords, (a, b, c, d, e, f))
+
+  def bounds(self, matrix=None):
+    """ Exact bounding box (x1, y1, x2, y2) of the path, extrema of the curves included ; None for an empty path
+    matrix: optional affine transform applied first (svg matrix(a b c d e f) convention), the path is left untouched
+    """
+    c = self.coords
+    if not c:
+      return None
+    if matrix is not None:
+      c = array('d', c)
+      transformCoords(c, matrix)
+    # end points, then the extrema of the curves (control points are usually outside of the curve)
+    xs = []
+    ys = []
+    (x0, y0) = start = (c[0], c[1])
+    for (op, index) in self.segments():
+      if op == CLOSE:
+        (x0, y0) = start
+        continue
+      (x, y) = (c[index + OP_SIZE[op] - 2], c[index + OP_SIZE[op] - 1])
+      if op == CUBIC or op == QUADRATIC:
+        # tikz: a single control point is used as both control points of a cubic curve
+        (cx1, cy1) = (c[index], c[index + 1])
+        (cx2, cy2) = (c[index + 2], c[index + 3]) if op == CUBIC else (cx1, cy1)
+        xs.extend(getCubicExtrema(x0, cx1, cx2, x))
+        ys.extend(getCubicExtrema(y0, cy1, cy2, y))
+      elif op == MOVE:
+        start = (x, y)
+      xs.append(x)
+      ys.append(y)
+      (x0, y0) = (x, y)
+    return (min(xs), min(ys), max(xs), max(ys))
+
+  def simplify(self, tolerance):
+    """ Simplifies the chains of lines, removed vertices lie within tolerance (+ RESOLUTION) of the resulting polyline
+    Curves, moves and closes are kept untouched, as well as both ends of each chain. Returns the number of removed vertices.
+    """
+    if self.ops.count(LINE) < 2:
+      return 0
+    c = self.coords
+    ops = bytearray()
+    coords = array('d')
+    removed = 0
+    last = None # end point of the previous segment
+    run = [] # current chain of lines, starting at the end point of the previous segment
+    for (op, index) in self.segments():
+      if op == LINE and last is not None:
+        if not run:
+          run.append(last)
+        last = (c[index], c[index + 1])
+        run.append(last)
+        continue
+      if run:
+        kept = simplifyLine(run, tolerance)
+        removed += len(run) - len(kept)
+        for (x, y) in kept[1:]:
+          ops.append(LINE)
+          coords.append(x)
+          coords.append(y)
+        run = []
+      size = OP_SIZE[op]
+      ops.append(op)
+      coords.extend(c[index:index + size])
+      if size:
+        last = (c[index + size - 2], c[index + size - 1])
+    if run:
+      kept = simplifyLine(run, tolerance)
+      removed += len(run) - len(kept)
+      for (x, y) in kept[1:]:
+        ops.append(LINE)
+        coords.append(x)
+        coords.append(y)
+    self.ops = ops
+    self.coords = coords
+    return removed
+
+  def toTikz(self, points=None):
+    # y axis is inverted in SVG % TikZ (see formatPoints) ; subpaths are emitted on separated lines
+    if points is None:
+      points = formatPoints(self.coords)
+    res = []
+    index = 0
+    for op in self.ops:
+      match op:
+        case 0: # MOVE
+          if res:
+            res.append("\n")
+          res.append(points[index])
+          index += 1
+        case 1: # LINE
+          res.append(" -- " + points[index])
+          index += 1
+        case 2: # CUBIC
+          res.append(" .. controls {} and {} .. {}".format(points[index], points[index + 1], points[index + 2]))
+          index += 3
+        case 3: # QUADRATIC
+          res.append(" .. controls {} .. {}".format(points[index], points[index + 1]))
+          index += 2
+        case 4: # CLOSE
+          res.append(" -- cycle")
+    return ''.join(res)
+
+#################################
+# POLYLINE SIMPLIFICATION (svg units, i.e. pt in the tikzpicture)
+#################################
+RESOLUTION = 0.005 # coordinates are emitted with 2 decimals: closer points are duplicates in the output
+
+def segmentDistance(p, a, b):
+  # distance from p to the segment [a, b] (not the line: back and forth chains are preserved)
+  (dx, dy) = (b[0] - a[0], b[1] - a[1])
+  length = dx * dx + dy * dy
+  t = 0 if length == 0 else max(0, min(1, ((p[0] - a[0]) * dx + (p[1] - a[1]) * dy) / length))
+  return math.hypot(p[0] - a[0] - t * dx, p[1] - a[1] - t * dy)
+
+def simplifyLine(points, tolerance):
+  """ Duplicate points removal, then Ramer-Douglas-Peucker (which merges collinear points)
+  Both ends are always kept.
+  """
+  # steps below the output resolution (compared to the last kept point: no drift)
+  unique = [points[0]]
+  for p in points[1:-1]:
+    if math.hypot(p[0] - unique[-1][0], p[1] - unique[-1][1]) > RESOLUTION:
+      unique.append(p)
+  if len(unique) > 1 and math.hypot(points[-1][0] - unique[-1][0], points[-1][1] - unique[-1][1]) <= RESOLUTION:
+    unique.pop()
+  unique.append(points[-1])
+  if len(unique) < 3:
+    return unique
+
+  # iterative RDP: ranges to split on their farthest point
+  keep = [False] * len(unique)
+  keep[0] = keep[-1] = True
+  stack = [(0, len(unique) - 1)]
+  while stack:
+    (start, stop) = stack.pop()
+    (farthest, index) = (-1, None)
+    for i in range(start + 1, stop):
+      distance = segmentDistance(unique[i], unique[start], unique[stop])
+      if distance > farthest:
+        (farthest, index) = (distance, i)
+    if index is not None and farthest > tolerance:
+      keep[index] = True
+      stack.append((start, index))
+      stack.append((index, stop))
+  return [p for (p, k) in zip(unique, keep) if k]
+
+def simplifyPaths(paths, tolerance):
+  """ Simplifies the given PathData in place, returns the total number of removed vertices
+  """
+  removed = 0
+  for path in paths:
+    removed += path.simplify(tolerance)
+  return removed
+
+def formatPaths(paths):
+  """ tikz paths of a list of PathData, with the points of all the paths formatted at once
+  """
+  coords = array('d')
+  for path in paths:
+    coords.extend(path.coords)
+  points = formatPoints(coords)
+  res = []
+  start = 0
+  for path in paths:
+    stop = start + len(path.coords) // 2
+    res.append(path.toTikz(points[start:stop]))
+    start = stop
+  return res
+
+def pathToTikz(path, formatted=None):
+  # tikz path of an IR node, either already formatted (str) or PathData (possibly formatted by formatPaths)
+  if isinstance(path, str):
+    return path
+  if formatted is not None and id(path) in formatted:
+    return formatted[id(path)]
+  return path.toTikz()
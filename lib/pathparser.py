@@ -0,0 +1,201 @@
+import re
+import math
+
+from . import diagnostics
+
+#################################
+# SVG PATH DATA: single pass scanner for the whole path grammar
+#################################
+# https://www.w3.org/TR/SVG11/paths.html#PathDataBNF
+# Commands are resolved as absolute commands with flat coordinate tuples:
+# - ('M', (x, y)) ; ('L', (x, y)) ; ('Z', ())
+# - ('C', (cx1, cy1, cx2, cy2, x, y)) ; ('Q', (cx, cy, x, y))
+# Relative commands, H/V (lines), S/T (reflected control points) and A (arcs, as cubic curves) are resolved here.
+
+# arguments are split on separators (fast path), or scanned with PATH_NUMBER when numbers are packed
+# without separators: "1.5.5" => 1.5 0.5 ; "1-2" => 1 -2
+PATH_COMMAND = re.compile(r"([MmZzLlHhVvCcSsQqTtAa])")
+PATH_NUMBER = re.compile(r"[-+]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][-+]?[0-9]+)?")
+PATH_ARGS = {'M': 2, 'L': 2, 'H': 1, 'V': 1, 'C': 6, 'S': 4, 'Q': 4, 'T': 2, 'A': 7}
+
+def parseArgs(raw):
+  try:
+    return list(map(float, raw.replace(',', ' ').split()))
+  except ValueError:
+    return [float(t) for t in PATH_NUMBER.findall(raw)]
+
+def parseArcArgs(raw):
+  # flags are single digits which may be packed with the following number: "a5 5 0 0110 10"
+  tokens = PATH_NUMBER.findall(raw)
+  args = []
+  i = 0
+  while i < len(tokens):
+    tok = tokens[i]
+    if (len(args) % 7 == 3 or len(args) % 7 == 4) and len(tok) > 1 and tok[0] in '01':
+      args.append(float(tok[0]))
+      tokens[i] = tok[1:]
+    else:
+      args.append(float(tok))
+      i += 1
+  return args
+
+def arcToCubics(x0, y0, rx, ry, phi, largeArc, sweep, x, y):
+  # endpoint to center parameterization: https://www.w3.org/TR/SVG11/implnote.html#ArcImplementationNotes
+  if (x0 == x and y0 == y):
+    return []
+  rx = abs(rx)
+  ry = abs(ry)
+  if rx == 0 or ry == 0:
+    return [('L', (x, y))]
+
+  cosPhi = math.cos(math.radians(phi))
+  sinPhi = math.sin(math.radians(phi))
+  dx = (x0 - x) / 2.0
+  dy = (y0 - y) / 2.0
+  x1 = cosPhi * dx + sinPhi * dy
+  y1 = -sinPhi * dx + cosPhi * dy
+
+  # out of range radii are scaled up
+  scale = (x1 * x1) / (rx * rx) + (y1 * y1) / (ry * ry)
+  if scale > 1:
+    rx *= math.sqrt(scale)
+    ry *= math.sqrt(scale)
+
+  num = rx * rx * ry * ry - rx * rx * y1 * y1 - ry * ry * x1 * x1
+  den = rx * rx * y1 * y1 + ry * ry * x1 * x1
+  coef = math.sqrt(max(0.0, num / den))
+  if largeArc == sweep:
+    coef = -coef
+  cx1 = coef * rx * y1 / ry
+  cy1 = -coef * ry * x1 / rx
+  cx = cosPhi * cx1 - sinPhi * cy1 + (x0 + x) / 2.0
+  cy = sinPhi * cx1 + cosPhi * cy1 + (y0 + y) / 2.0
+
+  theta = math.atan2((y1 - cy1) / ry, (x1 - cx1) / rx)
+  delta = math.atan2((-y1 - cy1) / ry, (-x1 - cx1) / rx) - theta
+  if sweep and delta < 0:
+    delta += 2 * math.pi
+  elif not sweep and delta > 0:
+    delta -= 2 * math.pi
+
+  # at most a quarter of ellipse per cubic curve
+  count = max(1, int(math.ceil(abs(delta) / (math.pi / 2) - 1e-9)))
+  step = delta / count
+  k = 4.0 / 3.0 * math.tan(step / 4)
+  res = []
+  for index in range(count):
+    a1 = theta + index * step
+    a2 = a1 + step
+    (c1, s1, c2, s2) = (math.cos(a1), math.sin(a1), math.cos(a2), math.sin(a2))
+    # points on the unit circle, then scaled, rotated and translated
+    pts = [(c1 - k * s1, s1 + k * c1), (c2 + k * s2, s2 - k * c2), (c2, s2)]
+    coords = []
+    for (px, py) in pts:
+      px *= rx
+      py *= ry
+      coords.append(cosPhi * px - sinPhi * py + cx)
+      coords.append(sinPhi * px + cosPhi * py + cy)
+    res.append(('C', tuple(coords)))
+  # exact end point
+  (last, coords) = res[-1]
+  res[-1] = (last, coords[0:4] + (x, y))
+  return res
+
+def scanPath(txt):
+  """ Generator of absolute commands (see above) from a svg path data string
+  """
+  parts = PATH_COMMAND.split(txt)
+  if parts[0].strip():
+    diagnostics.warn('svg.path', "Unexpected data before the first path command: {}", parts[0][0:20])
+  x = y = 0.0 # current point
+  sx = sy = 0.0 # start of the current subpath
+  ctrl = None # (kind, x, y) last control point, for S/T reflections
+  closed = False
+  for index in range(1, len(parts), 2):
+    cmd = parts[index]
+    upper = cmd.upper()
+    relative = cmd != upper
+    if upper == 'Z':
+      if parts[index + 1].strip():
+        diagnostics.warn('svg.path', "Unexpected arguments after closing command: {}", parts[index + 1][0:20])
+      yield ('Z', ())
+      (x, y) = (sx, sy)
+      ctrl = None
+      closed = True
+      continue
+    if closed and upper != 'M':
+      # drawing after a close starts a new subpath at the same point
+      yield ('M', (x, y))
+    closed = False
+
+    nargs = PATH_ARGS[upper]
+    try:
+      nums = parseArcArgs(parts[index + 1]) if upper == 'A' else parseArgs(parts[index + 1])
+    except ValueError:
+      nums = []
+    if not nums or len(nums) % nargs:
+      diagnostics.error('svg.path', "Badly formed {} command, got {} numbers while a multiple of {} was expected", cmd, len(nums), nargs)
+
+    # implicit repetitions of the command
+    for start in range(0, len(nums) - nargs + 1, nargs):
+      args = nums if len(nums) == nargs else nums[start:start + nargs]
+      if relative:
+        if upper == 'H':
+          args[0] += x
+        elif upper == 'V':
+          args[0] += y
+        elif upper == 'A':
+          args[5] += x
+          args[6] += y
+        else:
+          for i in range(0, nargs, 2):
+            args[i] += x
+            args[i + 1] += y
+
+      match upper:
+        case 'M':
+          (x, y) = (sx, sy) = (args[0], args[1])
+          ctrl = None
+          yield ('M', (x, y))
+          upper = 'L' # following pairs are implicit lines
+        case 'L':
+          (x, y) = (args[0], args[1])
+          ctrl = None
+          yield ('L', (x, y))
+        case 'H':
+          x = args[0]
+          ctrl = None
+          yield ('L', (x, y))
+        case 'V':
+          y = args[0]
+          ctrl = None
+          yield ('L', (x, y))
+        case 'C':
+          ctrl = ('C', args[2], args[3])
+          (x, y) = (args[4], args[5])
+          yield ('C', tuple(args))
+        case 'S':
+          if ctrl and ctrl[0] == 'C':
+            (cx, cy) = (2 * x - ctrl[1], 2 * y - ctrl[2])
+          else:
+            (cx, cy) = (x, y)
+          ctrl = ('C', args[0], args[1])
+          (x, y) = (args[2], args[3])
+          yield ('C', (cx, cy, args[0], args[1], x, y))
+        case 'Q':
+          ctrl = ('Q', args[0], args[1])
+          (x, y) = (args[2], args[3])
+          yield ('Q', tuple(args))
+        case 'T':
+          if ctrl and ctrl[0] == 'Q':
+            (cx, cy) = (2 * x - ctrl[1], 2 * y - ctrl[2])
+          else:
+            (cx, cy) = (x, y)
+          ctrl = ('Q', cx, cy)
+          (x, y) = (args[0], args[1])
+          yield ('Q', (cx, cy, x, y))
+        case 'A':
+          for segment in arcToCubics(x, y, *args):
+            yield segment
+          (x, y) = (args[5], args[6])
+          ctrl = None
@@ -0,0 +1,200 @@
+import itertools
+import xml.etree.ElementTree as xml
+from concurrent.futures import ThreadPoolExecutor
+
+from . import svgparser,colors,context,emitter,fragments,layers,bounds,profiling,diagnostics
+from .common import *
+from .config import App
+from .defs import *
+from .mxparser import MxGraph
+from .pathdata import PathData,simplifyPaths
+
+#################################
+# CONVERSION of the configured INPUT_FILE
+#################################
+def getFragmentCachePath(conf):
+  return conf['OUTPUT_DEP_DIR'] + '/' + conf['SIDE_FILES_RAW'] + '.fragments'
+
+OUTPUT_BUFFER = 1 << 16
+
+def convert(output=None, cache=None, ctx=None):
+  # output: file object receiving the tex (e.g. stdout), instead of OUTPUT_FILE
+  # cache: fragment cache kept by the caller across conversions (watch mode, daemon)
+  # ctx: context.Context kept by the caller, its registries are warm from the previous conversion of the same
+  # file (watch mode). By default, the conversion runs in a new context with a snapshot of the App config
+  if ctx is None:
+    ctx = context.Context(App.config())
+  with ctx.use():
+    colors.releaseColors() # names of a warm registry are kept, only their usage is reset
+    run(ctx, output, cache)
+
+def run(ctx, output, cache):
+  conf = ctx.conf
+  ctx.diagnostics = diagnostics.Diagnostics(conf['DIAGNOSTICS_LEVEL'])
+  if cache is None and conf['FRAGMENT_CACHE']:
+    cache = fragments.FragmentCache(getFragmentCachePath(conf), conf)
+  ctx.fragments = cache
+
+  # INITIAL PARSING
+  # root format of drawio-generated svgs
+  # {http://www.w3.org/2000/svg}defs    => (empty)
+  # {http://www.w3.org/2000/svg}g       => (main group)
+  # {http://www.w3.org/2000/svg}switch  => (disclaimer for edition without support of foreign object)
+  # the mxfile is decoded in the background, alongside the svg parsing
+  mxgraph = MxGraph()
+  decoding = ThreadPoolExecutor(max_workers=1, thread_name_prefix='svg2tikz-mx')
+  mxParsed = []
+  def parseContent(content):
+    print("[INFO] Attempting to parse original drawio mxfile")
+    xmlOutput = App.outputFile('xml') if conf['DUMP_MXFILE_XML'] else None
+    mxParsed.append(ctx.submit(decoding, mxgraph.parseRaw, content, xmlOutput, conf['PAGE']))
+
+  svgparser.startImageJobs()
+  print("[INFO] Parsing SVG file")
+  if conf['STREAM_INPUT']:
+    # MAIN PROCESSING (done while reading the file)
+    with profiling.stage('svg parsing'):
+      (IR, content, rootAttrib) = svgparser.streamSVG(conf['INPUT_FILE'], parseContent)
+  else:
+    with profiling.stage('svg reading'):
+      tree = xml.parse(conf['INPUT_FILE'])
+    root = tree.getroot()
+    main = root[1] # select the first group
+    rootAttrib = {k: v for k, v in root.attrib.items() if k != 'content'}
+    if 'content' in root.attrib:
+      parseContent(root.attrib['content'])
+
+    # MAIN PROCESSING
+    with profiling.stage('svg parsing'):
+      IR = svgparser.processGroup(main)
+  profiling.count('ir nodes', len(IR))
+
+  # Re-integrate infos from mxgraph if available
+  # TODO: make this part useful
+  if mxParsed:
+    with profiling.stage('mxgraph wait'):
+      mxParsed[0].result()
+    # align & annotate mxgraph with tikz/svg nodes
+    # (WIP)
+    with profiling.stage('annotation'):
+      mxgraph.annotate(IR)
+  else:
+    print("[WARN] Cannot retrieve original drawio diagram source, overlay specs won't be matched.")
+  decoding.shutdown()
+
+  # optional simplification of the chains of lines
+  if conf['SIMPLIFY_TOLERANCE_PT'] > 0:
+    paths = [node['tikz']['path'] for node in IR if isinstance(node['tikz'].get('path'), PathData)]
+    with profiling.stage('simplification'):
+      removed = simplifyPaths(paths, conf['SIMPLIFY_TOLERANCE_PT'])
+    print("[INFO] Path simplification removed {} vertices (tolerance: {}pt)".format(removed, conf['SIMPLIFY_TOLERANCE_PT']))
+
+  # optional cropping: the nodes outside of the region are not emitted
+  region = getCropRegion(conf, IR, bool(mxParsed))
+  if region is not None:
+    with profiling.stage('cropping'):
+      kept = bounds.crop(IR, region)
+    profiling.count('cropped nodes', len(IR) - len(kept))
+    print("[INFO] Cropped to {}: {} nodes dropped, {} kept".format(
+      ', '.join(f(v) for v in (region[0], region[1], region[2] - region[0], region[3] - region[1])), len(IR) - len(kept), len(kept)))
+    IR = kept
+    bbox = bounds.getBoundingBox(region, clip=True)
+  elif conf['BOUNDING_BOX']:
+    box = bounds.getViewBox(rootAttrib) or bounds.getFigureBox(IR)
+    bbox = bounds.getBoundingBox(box) if box is not None else None
+  else:
+    bbox = None
+
+  # external conversions must be completed before the emission
+  with profiling.stage('image jobs wait'):
+    svgparser.waitImageJobs()
+  with profiling.stage('image eviction'):
+    svgparser.evictEmbeddedImages()
+
+  print("[INFO] Starting tikz emission")
+  styles = []
+  if conf['DEDUP_STYLES']:
+    with profiling.stage('styles'):
+      styles = emitter.internStyles(IR)
+    print("[INFO] {} shared option sets defined as styles".format(len(styles)))
+
+  # WRITE RESULT: lines are written as they are emitted
+  with profiling.stage('emission'):
+    if conf['LAYER_OUTPUT']:
+      # layers are written separately, the main output only stacks them
+      tex = layers.writeLayers(IR, mxgraph if mxParsed else None, rootAttrib, styles, cache, conf, bbox)
+      tex = getHeader(conf) + tex + getFooter(conf)
+      profiling.count('bytes emitted', len(tex.encode()))
+      if output is not None:
+        output.write(tex)
+        output.flush()
+      else:
+        writeIfChanged(conf['OUTPUT_FILE'], tex)
+    elif output is not None:
+      writeTex(profiling.counted(output), conf, styles, getLines(IR, cache, conf, bbox))
+      output.flush()
+    else:
+      with openAtomic(conf['OUTPUT_FILE'], buffering=OUTPUT_BUFFER) as file:
+        writeTex(profiling.counted(file), conf, styles, getLines(IR, cache, conf, bbox))
+
+  if cache is not None:
+    profiling.count('fragment cache hits', cache.hits)
+    profiling.count('fragment cache misses', cache.misses)
+    profiling.count('fragment lines reused', cache.lineHits)
+    cache.save()
+    cache.report()
+
+  ctx.diagnostics.printSummary()
+
+def getCropRegion(conf, IR, annotated):
+  """ Region kept by CROP or CROP_LAYER (svg units), None to keep the whole figure
+  annotated: True if the IR was aligned with the mxgraph (required to find the nodes of a layer)
+  """
+  if conf['CROP']:
+    return bounds.parseRegion(conf['CROP'])
+  if conf['CROP_LAYER']:
+    if not annotated:
+      print("[ERROR] Cropping to layer {} requires the drawio diagram, figure not cropped".format(conf['CROP_LAYER']))
+      return None
+    box = layers.getLayerBox(IR, conf['CROP_LAYER'])
+    if box is None:
+      print("[ERROR] Unknown or empty layer {}, figure not cropped".format(conf['CROP_LAYER']))
+    return box
+  return None
+
+def getLines(IR, cache, conf, bbox=None):
+  # tikz lines of the picture, after its explicit bounding box
+  lines = emitter.iterTikz(IR, cache, conf['PIC_INSTANCING'])
+  return itertools.chain([bbox], lines) if bbox else lines
+
+def getHeader(conf):
+  if not conf['STANDALONE_TEX']:
+    return ''
+  if conf['STANDALONE_IS_BEAMER']:
+    return '\documentclass{beamer}\n' + PREAMBLE + '\n\\begin{frame}\n'
+  return '\documentclass{standalone}\n' + PREAMBLE + '\n'
+
+def getFooter(conf):
+  if not conf['STANDALONE_TEX']:
+    return ''
+  if conf['STANDALONE_IS_BEAMER']:
+    return '\n\end{frame}\n' + FOOTER
+  return '\n' + FOOTER
+
+def writeTex(out, conf, styles, lines):
+  # colors are all known before the emission (collected while parsing, or replayed from the fragment cache)
+  out.write(getHeader(conf))
+  if not conf['NO_COLOR_DEFS']:
+    out.write('\n'.join(colors.getColorDefs()) + '\n')
+  if styles:
+    out.write('\n'.join(styles) + '\n')
+
+  out.write(TIKZ_START() + '\n')
+  empty = True
+  for line in lines:
+    if not empty:
+      out.write('\n')
+    out.write(line)
+    empty = False
+  out.write('\n' + TIKZ_END)
+  out.write(getFooter(conf))
@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import cProfile
+import threading
+import contextlib
+import tracemalloc
+
+from . import context
+
+#################################
+# PROFILING: time per stage and per element, counters and peak memory of a conversion
+#################################
+# Enabled by setting a Profile on the context of the conversion (see svg2tikz.py --profile), the helpers of this
+# module are no-ops otherwise. Stages can be recorded from any thread of the conversion (mxfile decoding, image
+# jobs): they are stored as complete events of a Chrome trace (chrome://tracing, https://ui.perfetto.dev).
+
+NO_STAGE = contextlib.nullcontext()
+
+class Profile(object):
+
+  def __init__(self, traceMemory=True):
+    self.origin = time.perf_counter()
+    self.lock = threading.Lock()
+    self.stages = {}   # name => [calls, seconds]
+    self.elements = {} # svg tag => [count, seconds] (groups excluded: only the elements themselves)
+    self.counters = {}
+    self.events = []
+    self.threads = {}  # thread id => name, for the trace
+    self.duration = None
+    self.peak = None
+    self.traceMemory = traceMemory and not tracemalloc.is_tracing()
+    if self.traceMemory:
+      tracemalloc.start()
+
+  @contextlib.contextmanager
+  def stage(self, name):
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      end = time.perf_counter()
+      thread = threading.current_thread()
+      with self.lock:
+        self.threads[thread.ident] = thread.name
+        entry = self.stages.setdefault(name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += end - start
+        self.events.append({'name': name, 'ph': 'X', 'pid': os.getpid(), 'tid': thread.ident,
+          'ts': (start - self.origin) * 1e6, 'dur': (end - start) * 1e6})
+
+  @contextlib.contextmanager
+  def element(self, tag):
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      elapsed = time.perf_counter() - start
+      with self.lock:
+        entry = self.elements.setdefault(tag, [0, 0.0])
+        entry[0] += 1
+        entry[1] += elapsed
+
+  def count(self, name, value=1):
+    with self.lock:
+      self.counters[name] = self.counters.get(name, 0) + value
+
+  def finish(self):
+    self.duration = time.perf_counter() - self.origin
+    if self.traceMemory:
+      self.peak = tracemalloc.get_traced_memory()[1]
+      tracemalloc.stop()
+
+  def getReport(self):
+    return {
+      'seconds': self.duration,
+      'stages': {name: {'calls': calls, 'seconds': seconds} for (name, (calls, seconds)) in self.stages.items()},
+      'elements': {tag: {'count': count, 'seconds': seconds} for (tag, (count, seconds)) in self.elements.items()},
+      'counters': self.counters,
+      'peak_memory_mb': self.peak / (1024.0 * 1024.0) if self.peak is not None else None
+    }
+
+  def writeReport(self, path):
+    with open(path, 'w') as file:
+      json.dump(self.getReport(), file, indent=2)
+
+  def writeTrace(self, path):
+    metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid, 'args': {'name': name}}
+      for (tid, name) in self.threads.items()]
+    with open(path, 'w') as file:
+      json.dump({'traceEvents': metadata + self.events, 'displayTimeUnit': 'ms'}, file)
+
+  def summary(self):
+    lines = ["[INFO] Profile: {:.3f}s".format(self.duration)]
+    for (name, (calls, seconds)) in self.stages.items():
+      lines.append("  {:<24} {:>9.3f}s {:>8}".format(name, seconds, "x{}".format(calls) if calls > 1 else ""))
+    for (tag, (count, seconds)) in sorted(self.elements.items(), key=lambda item: -item[1][1]):
+      lines.append("  <{}> {:<{}} {:>9.3f}s {:>8}".format(tag, '', 21 - len(tag), seconds, count))
+    for (name, value) in self.counters.items():
+      lines.append("  {:<24} {:>10}".format(name, "{:.3f}".format(value) if isinstance(value, float) else value))
+    if self.peak is not None:
+      lines.append("  {:<24} {:>9.1f}MB".format('peak memory', self.peak / (1024.0 * 1024.0)))
+    return '\n'.join(lines)
+
+def stage(name):
+  profile = context.get().profile
+  return profile.stage(name) if profile is not None else NO_STAGE
+
+def count(name, value=1):
+  profile = context.get().profile
+  if profile is not None:
+    profile.count(name, value)
+
+class CountingWriter(object):
+  # counts the bytes written to a text file object (utf-8)
+  def __init__(self, out, profile):
+    self.out = out
+    self.profile = profile
+
+  def write(self, txt):
+    self.profile.count('bytes emitted', len(txt.encode()))
+    return self.out.write(txt)
+
+  def flush(self):
+    self.out.flush()
+
+def counted(out):
+  profile = context.get().profile
+  return CountingWriter(out, profile) if profile is not None else out
+
+def runProfiled(run, statsFile=None):
+  """ Runs run(), under cProfile if statsFile is given (pstats format, only the calling thread is profiled)
+  """
+  if not statsFile:
+    return run()
+  profiler = cProfile.Profile()
+  try:
+    return profiler.runcall(run)
+  finally:
+    profiler.dump_stats(statsFile)
+    print("[INFO] cProfile stats written to {} (python3 -m pstats {})".format(statsFile, statsFile))
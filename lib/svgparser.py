@@ -2,20 +2,26 @@
 import re
 import os
 import base64
+import hashlib
+import xml.etree.ElementTree as xml
 from .common import *
 from .font import *
 from .colors import *
 from .config import App
 from .htmlparser import *
+from .pathparser import scanPath
+from .pathdata import PathData
 
-# subprocess required for external file extractions (asar to svg ; svg to pdf)
+# subprocess required for external file conversions (svg to pdf)
 import subprocess
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from . import asar,context,profiling,diagnostics
 # external binary dependencies (must be available in path): 
 # - svg2pdf
 # port provides `which svg2pdf` => svg2pdf is provided by: librsvg
 # can also be installed with brew install svg2pdf (based on cairo in both cases)
-# - npx (Node CLI environment: <package_manager:brew|apt|...> install npm)
-# NB: npx will automatically install locally asar (and its dependencies) in ~/.npm/_npx/ 
+# NB: asar archives (drawio resources) are read directly, see asar.py
 
 # TODO: check if those external binaries could be replaced with equivalent python packages?
 
@@ -31,10 +37,11 @@ def processRect(rect):
     radius = getNiceNumber(rect.attrib['rx'])
     tikz['opts']["rounded corners"] = "{}\pt".format(radius)
     if 'ry' in rect.attrib and rect.attrib['ry'] != rect.attrib['rx']:
-      print("Got uneven radius for rectangle, using rx ({}), discarding ry ({})".format(rect.attrib['rx'], rect.attrib['ry']))
+      diagnostics.warn('svg.radius', "Got uneven radius for rectangle, using rx ({}), discarding ry ({})", rect.attrib['rx'], rect.attrib['ry'])
   
   # Y axis is inverted in SVG % TikZ
   tikz['path'] = "({}, -{}) rectangle ({}, -{})".format(f(startX), f(startY), f(stopX), f(stopY))
+  tikz['geometry'] = ('rect', startX, startY, stopX, stopY)
   tikz['content'] = {}
   return tikz
 
@@ -43,226 +50,116 @@ def processRect(rect):
 def processSwitch(switch):
   # {'pointer-events': 'none', 'width': '100%', 'height': '100%', 'requiredFeatures': 'http://www.w3.org/TR/SVG11/feature#Extensibility', 'style': 'overflow: visible; text-align: left;'}
   if switch[0].tag != '{http://www.w3.org/2000/svg}foreignObject':
-    print("Unable to process switch first child, with tag: {}".format(switch[0].tag))
+    diagnostics.error('svg.switch', "Unable to process switch first child, with tag: {}", switch[0].tag)
 
   tikz = processHTML(switch[0][0], [switch[0].attrib])
   svg = {'tag': 'switch/' + switch[0].tag, 'attrib': switch[0].attrib }
   return {'tikz': tikz, 'svg': svg}
 
 
-def parseBuffer(buffer):
-  # the only expected string for buffer is a valid number or a couple of valid numbers 
-  splitted = buffer.split(',')
-  res = []
-  for e in splitted:
-    res.append({'type': 'number', 'value':getNiceNumber(e)})
-  return res
-
-
-def tokenizePathString(txt):
-  """ Goal of this function is to return a list of tokens from a path string
-  """
-  tokens = []
-  buffer = ''
-  for char in txt:
-    if char.isspace():
-      # only processing buffer after a space or at the end
-      if buffer:
-        tokens += parseBuffer(buffer)
-        buffer = ''
-    elif char.isalpha():
-      tokens.append({'type': 'cmd', 'value': char})
-    else:
-      # expecting a number
-      buffer += char
-
-  if buffer:
-    tokens += parseBuffer(buffer)
-  
-  return tokens
-
-
-def getPathCmd(txt):
-  tokens = tokenizePathString(txt)
-  res = []
-  index = 0
-  while index < len(tokens):
-    tok = tokens[index]
-    match tok['type']:
-      case 'cmd':
-        # first retrieve points
-        points = []
-        index += 1
-        while index < len(tokens) and tokens[index]['type'] == 'number':
-          points.append(tokens[index]['value'])
-          index += 1
-        
-        # then match command against supported types
-        match tok['value']:
-          case 'M':
-            # Move to given (x,y) position (no draw from current)
-            if len(points) == 2:
-              res.append({'action': 'move', 'x': points[0], 'y': points[1]})
-            else:
-              print("Badly formed move command, got {} points while 2 were expected".format(len(points)))
-          case 'L':
-            # Draw line to given (x,y) position
-            if len(points) == 2:
-              res.append({'action': 'line', 'x': points[0], 'y': points[1]})
-            else:
-              print("Badly formed line draw command, got {} points while 2 were expected".format(len(points)))
-          
-          case 'C':
-            # Draw double control points bezier curve to given (x,y) position
-            if len(points) == 6:
-              cubic = { 'action': 'cubic', 'x': points[4], 'y': points[5]}
-              cubic['cx1'] = points[0]
-              cubic['cy1'] = points[1]
-              cubic['cx2'] = points[2]
-              cubic['cy2'] = points[3]
-              res.append(cubic)
-            else:
-              print("Badly formed cubic curve command, got {} points while 6 were expected".format(len(points)))
-          
-          case 'Q':
-            # Draw single control point bezier curve to given (x,y) position
-            if len(points) == 4:
-              quadratic = { 'action': 'quadratic', 'x': points[2], 'y': points[3]}
-              quadratic['cx'] = points[0]
-              quadratic['cy'] = points[1]
-              res.append(quadratic)
-            else:
-              print("Badly formed quadratic curve command, got {} points while 4 were expected".format(len(points)))
-          case 'Z':
-            # Close current draw, returning to first point of the path
-            if len(points) == 0:
-              res.append({'action': 'close'})
-            else:
-              print("Unexpected arguments after closing command, got {} points while none were expected".format(len(points)))
-
-          case others:
-            print("Unexpected svg command: " + tok['value'])
-        #TODO: there is still a lot of work here 
-
-      case others:
-        print("Unexpected token type: " + tok['type'])
-  return res
-
-def joinQuadraticPaths(lst, preQuadraticCmd, strengthX, strengthY):
-  # join 2 quadratic paths as a single cubic path
-  q1 = lst[0]
-  q2 = lst[1]
+def joinQuadraticPaths(q1, q2, pre, strengthX, strengthY):
+  # join 2 quadratic paths (cx, cy, x, y) as a single cubic path (cx1, cy1, cx2, cy2, x, y)
+  (cx1, cy1) = (q1[0], q1[1])
+  (cx2, cy2, x, y) = q2
   if strengthX != 100 or strengthY != 100:
-    prevX = preQuadraticCmd['x']
-    prevY = preQuadraticCmd['y']
-    q1['cx'] = prevX + (q1['cx']-prevX)*strengthX/100.0
-    q1['cy'] = prevY + (q1['cy']-prevY)*strengthY/100.0
+    (prevX, prevY) = pre
+    cx1 = prevX + (cx1-prevX)*strengthX/100.0
+    cy1 = prevY + (cy1-prevY)*strengthY/100.0
 
-    q2['cx'] = q2['x'] + (q2['cx']-q2['x'])*strengthX/100.0
-    q2['cy'] = q2['y'] + (q2['cy']-q2['y'])*strengthY/100.0
+    cx2 = x + (cx2-x)*strengthX/100.0
+    cy2 = y + (cy2-y)*strengthY/100.0
 
-  return  " .. controls ({},-{}) and ({},-{}) .. ({},-{})".format(f(q1['cx']), f(q1['cy']), f(q2['cx']), f(q2['cy']), f(q2['x']), f(q2['y']))
+  return (cx1, cy1, cx2, cy2, x, y)
 
-def clearQuadraticBuffer(lst, preQuadraticCmd):
+def clearQuadraticBuffer(lst, pre, conf, path):
   if not lst:
     # nothing to do
-    return ""
-  conf = App.config()
+    return
+  (cx, cy, x, y) = lst[0]
+  lst.clear()
   if conf['FORCE_Q_AS_C']:
     # this is the only place where the Q_STRENGTH modulation makes sense
-    if conf['Q_AS_C_STRENGTH_PERCENT'] != 100 or conf['Q_AS_C_STRENGTH_PERCENT'] != 100:
-      prevX = preQuadraticCmd['x']
-      prevY = preQuadraticCmd['y']
-      cx1 = prevX + (lst[0]['cx']-prevX)*conf['Q_AS_C_STRENGTH_PERCENT']/100.0
-      cy1 = prevY + (lst[0]['cy']-prevY)*conf['Q_AS_C_STRENGTH_PERCENT']/100.0
-      x = lst[0]['x']
-      y = lst[0]['y']
-      cx2 = x + (lst[0]['cx']-x)*conf['Q_AS_C_STRENGTH_PERCENT']/100.0
-      cy2 = y + (lst[0]['cy']-y)*conf['Q_AS_C_STRENGTH_PERCENT']/100.0
-
-      res = joinQuadraticPaths([{'cx':cx1, 'cy':cy1}, {'cx':cx2, 'cy':cy2, 'x': x, 'y': y}], preQuadraticCmd, 100, 100)
+    strength = conf['Q_AS_C_STRENGTH_PERCENT']
+    if strength != 100:
+      (prevX, prevY) = pre
+      cx1 = prevX + (cx-prevX)*strength/100.0
+      cy1 = prevY + (cy-prevY)*strength/100.0
+      cx2 = x + (cx-x)*strength/100.0
+      cy2 = y + (cy-y)*strength/100.0
+      path.cubic(cx1, cy1, cx2, cy2, x, y)
     else:
-      res = joinQuadraticPaths(lst + lst, preQuadraticCmd, 100, 100)
-    lst.clear()
-    return res
+      path.cubic(cx, cy, cx, cy, x, y)
   else:
-    cmd = lst[0]
-    lst.clear()
-    return " .. controls ({},-{}) .. ({},-{})".format(f(cmd['cx']), f(cmd['cy']), f(cmd['x']), f(cmd['y']))
+    path.quadratic(cx, cy, x, y)
 
-def cmdToPath(commands):
+def cmdToPath(commands, conf):
+  # commands: absolute commands from pathparser.scanPath
   # current expectations: must start with a move and continue with lines until a close (or not)
-  paths = []
+  path = PathData()
   points = [] # for tracing controls points
-  current = ''
   started = False
-  preQuadraticCmd = {}
+  current = (0, 0) # current point
+  preQuadratic = (0, 0) # current point before the buffered quadratic curve
   quadraticBuffer = []
-  lastCmd = {}
-
-  for cmd in commands:
-    match cmd['action']:
-      case 'move':
-        if started:
-          current += clearQuadraticBuffer(quadraticBuffer, preQuadraticCmd)
-          paths.append(current)
-          current = ''
-        else:
-          started = True
-        current = "({},-{})".format(f(cmd['x']), f(cmd['y']))
-
-      case 'line':
-        if not started:
-          print("Draw commands requires a first move to initialize the path")
-        current += clearQuadraticBuffer(quadraticBuffer, preQuadraticCmd)
-        current += " -- ({},-{})".format(f(cmd['x']), f(cmd['y']))
-
-      case 'quadratic':
-        if not started:
-          print("Draw commands requires a first move to initialize the path")
-        if App.config()['JOIN_QQ_AS_C']:
-          quadraticBuffer.append(cmd)
+  joinQQ = conf['JOIN_QQ_AS_C']
+  displayControlPoints = conf['DISPLAY_CONTROL_POINTS']
+
+  for (cmd, p) in commands:
+    if cmd == 'M':
+      clearQuadraticBuffer(quadraticBuffer, preQuadratic, conf, path)
+      started = True
+      path.move(p[0], p[1])
+      current = p
+      continue
+
+    if not started:
+      if cmd == 'Z':
+        diagnostics.warn('svg.path', "Attempting to close a path without previous points")
+      else:
+        diagnostics.error('svg.path', "Draw commands requires a first move to initialize the path")
+      continue
+
+    match cmd:
+      case 'L':
+        clearQuadraticBuffer(quadraticBuffer, preQuadratic, conf, path)
+        path.line(p[0], p[1])
+
+      case 'Q':
+        (cx, cy) = (p[0], p[1])
+        if joinQQ:
+          quadraticBuffer.append(p)
           if len(quadraticBuffer) == 2:
-            strengthX = App.config()['QQ_AS_C_STRENGTH_PERCENT_X']
-            strengthY = App.config()['QQ_AS_C_STRENGTH_PERCENT_Y']
-            current += joinQuadraticPaths(quadraticBuffer, preQuadraticCmd, strengthX, strengthY)
+            cubic = joinQuadraticPaths(quadraticBuffer[0], quadraticBuffer[1], preQuadratic, 
+              conf['QQ_AS_C_STRENGTH_PERCENT_X'], conf['QQ_AS_C_STRENGTH_PERCENT_Y'])
+            path.cubic(*cubic)
             quadraticBuffer.clear()
+            (cx, cy) = (cubic[2], cubic[3])
           else:
-            preQuadraticCmd = lastCmd
+            preQuadratic = current
         else:
-          current += " .. controls ({},-{}) .. ({},-{})".format(f(cmd['cx']), f(cmd['cy']), f(cmd['x']), f(cmd['y']))
-
-        if App.config()['DISPLAY_CONTROL_POINTS']:
-          points.append("\\node[shape=circle, draw=green, fill=green] at ({},-{}) {{}};".format( f(cmd['cx']), f(cmd['cy'])))
-
-      case 'cubic':
-        if not started:
-          print("Draw commands requires a first move to initialize the path")
-        current += clearQuadraticBuffer(quadraticBuffer, preQuadraticCmd)
-        current += " .. controls ({},-{}) and ({},-{}) .. ({},-{})".format(f(cmd['cx1']), f(cmd['cy1']), f(cmd['cx2']), f(cmd['cy2']), f(cmd['x']), f(cmd['y']))
-        if App.config()['DISPLAY_CONTROL_POINTS']:
-          points.append("\\node[shape=circle, draw=orange, fill=orange] at ({},-{}) {{}};".format( f(cmd['cx1']), f(cmd['cy1'])))          
-          points.append("\\node[shape=circle, draw=orange, fill=orange] at ({},-{}) {{}};".format( f(cmd['cx2']), f(cmd['cy2'])))
-
-      case 'close':
-        if not started:
-          print("Warning: attempting to close a path without previous points")
-        current += clearQuadraticBuffer(quadraticBuffer, preQuadraticCmd)
+          path.quadratic(*p)
+
+        if displayControlPoints:
+          points.append("\\node[shape=circle, draw=green, fill=green] at ({},-{}) {{}};".format( f(cx), f(cy)))
+
+      case 'C':
+        clearQuadraticBuffer(quadraticBuffer, preQuadratic, conf, path)
+        path.cubic(*p)
+        if displayControlPoints:
+          points.append("\\node[shape=circle, draw=orange, fill=orange] at ({},-{}) {{}};".format( f(p[0]), f(p[1])))          
+          points.append("\\node[shape=circle, draw=orange, fill=orange] at ({},-{}) {{}};".format( f(p[2]), f(p[3])))
+
+      case 'Z':
+        clearQuadraticBuffer(quadraticBuffer, preQuadratic, conf, path)
         started = False
-        current += ' -- cycle'
-        paths.append(current)
-        current = ''
+        path.close()
 
-      case others:
-        current += clearQuadraticBuffer(quadraticBuffer, preQuadraticCmd)
-        print("TODO: {}".format(cmd['action']))
-    lastCmd = cmd
+    if cmd != 'Z':
+      current = (p[-2], p[-1])
   
-  current += clearQuadraticBuffer(quadraticBuffer, preQuadraticCmd)
-  if started:
-    paths.append(current)
+  clearQuadraticBuffer(quadraticBuffer, preQuadratic, conf, path)
 
-  return (paths, points)
+  return (path, points)
 
 def getColoredDrawCommand(attrib):
   tikz = {
@@ -295,7 +192,7 @@ def getColoredDrawCommand(attrib):
     if m:
       opts['dash pattern'] = 'on {}\\pt off {}\\pt'.format(m.group(1), m.group(2))
     else:
-      print("Unable to parse dash pattern: {}".format())
+      diagnostics.warn('svg.dash', "Unable to parse dash pattern: {}", dashpattern)
 
   if attrib['stroke'] != 'none' and attrib['fill'] == 'none':
     opts['color'] =  getColor(attrib['stroke'])
@@ -338,6 +235,7 @@ def getTransforms(transform):
       y = getNiceNumber(rotate.group(3)) * -1
       transforms["rotate around"] = "{{{}:(({},{}))}}".format(angle, x, y)
       transforms["rotate"] = angle
+      transforms["rotation"] = (angle, x, 0 - y) # numeric rotate around (center in svg units), not emitted
     else:
       translate = PARSE_TRANSLATE.match(tf)
       if translate:
@@ -345,58 +243,35 @@ def getTransforms(transform):
         y = getNiceNumber(translate.group(2)) * -1
         transforms["shift"] = "{{({},{})}}".format(x, y)
       else:
-        print("[WARN] Ignored transform: {}".format(tf))
+        diagnostics.warn('svg.transform', "Ignored transform: {}", tf)
   
   if not transforms:
-    print("Unable to parse transform: {}".format(transform))
+    diagnostics.warn('svg.transform', "Unable to parse transform: {}", transform)
 
   return transforms
 
-def getRawPath(commands):
-  path = []
-  for cmd in commands:
-    match cmd['action']:
-      case 'move':
-        path.append((cmd['x'], cmd['y']))
-
-      case 'line':
-        path.append((cmd['x'], cmd['y']))
-
-      case 'close':
-        path.append(path[0])
-
-      case others:
-        print("TODO: {}".format(cmd['action']))
-  
-  return path
-
 def processPath(path):
 
-  commands = getPathCmd(path.attrib['d'])
-
-  # Here we can add additional parsing of commands
-  rawPath = getRawPath(commands)
-
   # potentially multiple traces per paths 
-  (traces, points) = cmdToPath(commands)
+  conf = App.config()
+  (data, points) = cmdToPath(scanPath(path.attrib['d']), conf)
   tikz = getColoredDrawCommand(path.attrib)
 
   if not tikz['draw']:
-    print("Unexpected transparent path, drawn as black path")
+    diagnostics.warn('svg.transparent', "Unexpected transparent {}, drawn as black path", 'path')
   
   # https://texample.net/tikz/examples/set-operations-illustrated-with-venn-diagrams/
   # FINAL explanation: tikz works exactly as SVG :D
   # both XOR path fill by default within the same command
-  tikz['path'] = '\n'.join(traces)
+  tikz['path'] = data # formatted at emission
 
-  if App.config()['DISPLAY_CONTROL_POINTS']:
+  if conf['DISPLAY_CONTROL_POINTS']:
     tikz['extra'] = points
 
   if 'transform' in path.attrib:
     tikz['transforms'] = getTransforms(path.attrib['transform'])
 
   tikz['content'] = {}
-  tikz['points'] = rawPath
 
   return tikz
 
@@ -407,7 +282,7 @@ def processEllipse(ellipse):
 
   tikz = getColoredDrawCommand(ellipse.attrib)
   if not tikz['draw']:
-    print("Note: transparent ellipse drawn as black path")
+    diagnostics.info('svg.transparent', "Transparent {} drawn as black path", 'ellipse')
   
   x = getNiceNumber(ellipse.attrib['cx'])
   y = getNiceNumber(ellipse.attrib['cy'])
@@ -415,6 +290,7 @@ def processEllipse(ellipse):
   ry = getNiceNumber(ellipse.attrib['ry'])
   # NB: \pt are not required here because the node will be scaled automatically
   tikz['path'] = "({},-{}) ellipse ({}pt and {}pt)".format(f(x), f(y), f(rx), f(ry))
+  tikz['geometry'] = ('ellipse', x, y, rx, ry)
   if 'transform' in ellipse.attrib:
     tikz['transform'] = getTransforms(ellipse.attrib['transform'])
   return tikz
@@ -427,24 +303,68 @@ def retrieveSVGfromASAR(path):
   fileName = targetFile.split('/')[-1]
   filePath = App.config()['OUTPUT_DEP_DIR'] + "/" + fileName
 
-  print("Extracting {} from local asar archive".format(fileName))
+  diagnostics.info('image.extraction', "Extracting {} from local asar archive", fileName)
 
-  proc = subprocess.run(["npx", "--yes", "asar", "ef", asarFile, targetFile], 
-    stdout=subprocess.DEVNULL, cwd = App.config()['OUTPUT_DEP_DIR'])
-  code = proc.returncode
-  if code != 0:
-    print("Unexpected error {} with asar file extraction, is npm installed and visible in path?".format(code))
+  try:
+    with profiling.stage('asar extraction'):
+      asar.getArchive(asarFile).extract(targetFile, filePath)
+  except (OSError, KeyError, ValueError) as e:
+    diagnostics.error('image.asar', "Unexpected error with asar file extraction of {}: {}", targetFile, e)
 
   return filePath
 
 def svg2pdf(svg, pdf):
-  print("Converting {} to pdf".format(svg))
-  proc = subprocess.run(["svg2pdf", svg, pdf], stdout=subprocess.DEVNULL)
+  diagnostics.info('image.conversion', "Converting {} to pdf", svg)
+  tmp = tmpPath(pdf)
+  with profiling.stage('svg2pdf'): # subprocess
+    proc = subprocess.run(["svg2pdf", svg, tmp], stdout=subprocess.DEVNULL)
   code = proc.returncode
   if code != 0:
-    print("Unexpected error {} with svg2pdf conversion, is svg2pdf installed and visible in path?".format(code))
-
-def getIncludeGraphics(path):
+    diagnostics.error('image.svg2pdf', "Unexpected error {} with svg2pdf conversion, is svg2pdf installed and visible in path?", code)
+  else:
+    os.replace(tmp, pdf)
+
+# external conversions (asar extraction, svg2pdf) are queued as soon as an image is found
+# and run in a pool of threads: results are only required before the emission (see waitImageJobs)
+# the pool is owned by the current conversion (see context.Context), None to run the conversions immediately
+def startImageJobs():
+  ctx = context.get()
+  count = App.config()['MAX_IMAGE_JOBS']
+  ctx.imageJobs = ThreadPoolExecutor(max_workers=count, thread_name_prefix='svg2tikz-img') if count > 0 else None
+
+def queueImageJob(job, *args):
+  ctx = context.get()
+  if ctx.imageJobs is None:
+    # same reporting as the pooled jobs (see waitImageJobs): a failed conversion does not abort the figure
+    try:
+      job(*args)
+    except Exception as e:
+      diagnostics.error('image.job', "Unexpected error with image conversion: {}", str(e))
+  else:
+    ctx.pendingJobs.append(ctx.submit(ctx.imageJobs, job, *args))
+
+def waitImageJobs():
+  ctx = context.get()
+  if ctx.pendingJobs:
+    print("[INFO] Waiting for {} image conversions".format(len(ctx.pendingJobs)))
+  for job in ctx.pendingJobs:
+    try:
+      job.result()
+    except Exception as e:
+      diagnostics.error('image.job', "Unexpected error with image conversion: {}", str(e))
+  ctx.pendingJobs.clear()
+  if ctx.imageJobs is not None:
+    ctx.imageJobs.shutdown()
+    ctx.imageJobs = None
+
+def convertImage(extract, svg, pdf):
+  if extract:
+    extract()
+  if svg:
+    svg2pdf(svg, pdf)
+
+def getIncludeGraphics(path, extract=None):
+  # extract: optional job producing the file at path (run before the conversion)
   ext = path.split('.')[-1]
   filename = path.split('/')[-1]
   rawfilename = filename[0:-(len(ext)+1)]
@@ -452,18 +372,73 @@ def getIncludeGraphics(path):
     case 'svg':
       pdfFile =  rawfilename + '.pdf'
       pdfPath = App.config()['OUTPUT_DEP_DIR'] + '/' + pdfFile
-      svg2pdf(path, pdfPath)
+      queueImageJob(convertImage, extract, path, pdfPath)
       return App.config()['DEP_DIR'] + '/' + pdfFile
 
     case 'png':
+      if extract:
+        queueImageJob(convertImage, extract, None, None)
       return App.config()['DEP_DIR'] + '/' + filename
 
     case others:
-      print("Unable to provide valid format for given embedded image: {}".format(path))
+      diagnostics.error('image.format', "Unable to provide valid format for given embedded image: {}", path)
       return "INVALID EMBEDDED IMAGE"
 
-RESOURCE_CACHE = {}
-EMBEDDED_COUNT = []
+# embedded images are stored in OUTPUT_DEP_DIR by digest of their decoded content:
+# identical images (across figures and runs) share the same files and are converted only once
+# (the digests used by the current conversion are never evicted, see context.Context)
+EMBEDDED_PREFIX = 'embedded_'
+
+def getEmbeddedImage(raw, ext):
+  data = base64.b64decode( raw )
+  digest = hashlib.sha1(data).hexdigest()
+  context.get().embedded.add(digest)
+  conf = App.config()
+  path = '{}/{}{}.{}'.format(conf['OUTPUT_DEP_DIR'], EMBEDDED_PREFIX, digest, ext)
+  target = path[0:-len(ext)] + 'pdf' if ext == 'svg' else path
+  if not conf['FORCE_NEW_EXTRACTION'] and os.path.exists(target):
+    # refresh access time for the LRU eviction
+    for cached in set([path, target]):
+      if os.path.exists(cached):
+        os.utime(cached)
+    profiling.count('embedded image hits')
+    return conf['DEP_DIR'] + '/' + target.split('/')[-1]
+
+  writeAtomic(path, data, 'wb')
+  return getIncludeGraphics(path)
+
+def evictEmbeddedImages():
+  # LRU eviction of the embedded images stored in OUTPUT_DEP_DIR (last access = mtime), based on IMAGE_CACHE_MAX_MB
+  conf = App.config()
+  budget = conf['IMAGE_CACHE_MAX_MB'] * 1024 * 1024
+  entries = {} # digest => [mtime, size, paths]
+  for entry in os.scandir(conf['OUTPUT_DEP_DIR']):
+    if entry.is_file() and entry.name.startswith(EMBEDDED_PREFIX):
+      digest = entry.name[len(EMBEDDED_PREFIX):].split('.')[0]
+      stat = entry.stat()
+      if not digest in entries:
+        entries[digest] = [0, 0, []]
+      entries[digest][0] = max(entries[digest][0], stat.st_mtime)
+      entries[digest][1] += stat.st_size
+      entries[digest][2].append(entry.path)
+
+  total = sum(e[1] for e in entries.values())
+  evicted = 0
+  for digest in sorted(entries, key=lambda d: entries[d][0]):
+    if total <= budget:
+      break
+    if digest in context.get().embedded:
+      continue
+    for path in entries[digest][2]:
+      try:
+        os.remove(path)
+      except FileNotFoundError:
+        pass # concurrently evicted
+    total -= entries[digest][1]
+    evicted += 1
+  if evicted:
+    print("[INFO] Evicted {} cached images from {} ({:.1f} MB kept)".format(evicted, conf['OUTPUT_DEP_DIR'], total / (1024.0 * 1024.0)))
+
 HREF='{http://www.w3.org/1999/xlink}href'
 def processImage(img):
   # 'x': '569.5', 'y': '208.5', 'width': '50', 'height': '50', '{http://www.w3.org/1999/xlink}href':
@@ -479,64 +454,52 @@ def processImage(img):
     'transforms': {}
   }
   if not HREF in img.attrib:
-    print("Expected resource link for image")
+    diagnostics.error('image.link', "Expected resource link for image")
     return tikz
 
+  # links can be huge data uris: resources are cached by sha1 of the link
+  resources = context.get().resources
   rsc = img.attrib[HREF]
-  if rsc in RESOURCE_CACHE:
-    includePath = RESOURCE_CACHE[rsc]
+  rscKey = hashlib.sha1(rsc.encode()).digest()
+  if rscKey in resources:
+    includePath = resources[rscKey]
+    profiling.count('image resource hits')
 
   elif len(rsc) > 8 and rsc[0:8] == 'file:///':
     # local file, need the first / => absolute path
     path = rsc[7:]
     filename = path.split('/')[-1]
     expected = App.config()['OUTPUT_DEP_DIR'] + '/' + filename
+    extract = None
     if not App.config()['FORCE_NEW_EXTRACTION'] and os.path.exists(expected):
       # check if image is present by name
-      print("INFO: skipping extraction of {}".format(expected))
-      extracted = expected
+      diagnostics.info('image.extraction', "Skipping extraction of {}", expected)
     elif '.asar/' in path:
-      extracted = retrieveSVGfromASAR(path)
+      # extracted to the expected path
+      extract = functools.partial(retrieveSVGfromASAR, path)
     else:
       # must at least copy the file locally, or directly convert to pdf if required ?
-      print("TODO: not within asar file - need to copy file")
-      extracted = expected
+      diagnostics.warn('image.copy', "Not within asar file, the file must be copied: {}", path)
     
-    includePath = getIncludeGraphics(extracted)
-    RESOURCE_CACHE[rsc] = includePath
+    includePath = getIncludeGraphics(expected, extract)
+    resources[rscKey] = includePath
 
 
   elif len(rsc) > 10 and rsc[0:10] == 'data:image':
     data = rsc[10:]
     if len(data) > 15 and data[0:15] == '/svg+xml;base64':
-      raw = data[15:]
       # goal: decode base 64, store to file and convert to pdf for includegraphics
-      
-      svgFile = '{}_embedded_{}.svg'.format(App.config()['INPUT_FILENAME_RAW'], len(EMBEDDED_COUNT))
-      svgPath = App.config()['OUTPUT_DEP_DIR'] + '/' + svgFile
-      with open(svgPath, 'wb') as svg:
-        svg.write(base64.b64decode( raw ))
-      
-      includePath = getIncludeGraphics(svgPath)
-      EMBEDDED_COUNT.append(includePath)
-      RESOURCE_CACHE[rsc] = includePath
+      includePath = getEmbeddedImage(data[15:], 'svg')
+      resources[rscKey] = includePath
 
     elif len(data) > 11 and data[0:11] == '/png;base64':
-      raw = data[11:]
-      pngFile = '{}_embedded_{}.png'.format(App.config()['INPUT_FILENAME_RAW'], len(EMBEDDED_COUNT))
-      pngPath = App.config()['OUTPUT_DEP_DIR'] + '/' + pngFile
-      with open(pngPath, 'wb') as png:
-        png.write(base64.b64decode( raw ))
-      
-      includePath = getIncludeGraphics(pngPath)
-      EMBEDDED_COUNT.append(includePath)
-      RESOURCE_CACHE[rsc] = includePath
-      pass
+      includePath = getEmbeddedImage(data[11:], 'png')
+      resources[rscKey] = includePath
     else: 
-      print('Unable to parse image {}'.format(rsc[0:100]))
+      diagnostics.error('image.format', "Unable to parse image {}", rsc[0:100])
       return tikz
   else:
-    print("Unable to parse image format: {}".format(rsc[0:100]))
+    diagnostics.error('image.format', "Unable to parse image format: {}", rsc[0:100])
     return tikz
 
   # based on the resulting includePath + img.attrib, draw the full node
@@ -550,6 +513,7 @@ def processImage(img):
   # \pt are not required here: the node will be scaled automatically
   tikz['content']['value'] = "\\includegraphics[width={}pt, height={}pt]{{{}}}".format(f(w),f(h),includePath)
   tikz['path'] = "at ({},-{})".format(f(x), f(y))
+  tikz['geometry'] = ('image', x, y, w, h)
   tikz['draw'] = True
   if 'opacity' in img.attrib:
     tikz['opts']['opacity'] = img.attrib['opacity']
@@ -583,7 +547,7 @@ def processSVGText(txt, attrib):
       case 'middle': 
         anchor = 'center'
       case others:
-        print("WARN: unsupported text-anchor {}".format(others))
+        diagnostics.warn('svg.text-anchor', "Unsupported text-anchor {}", others)
         anchor = others 
     opts["anchor"] = anchor
 
@@ -602,40 +566,62 @@ def processSVGText(txt, attrib):
     opts["font"] = ''.join(font)
 
   tikz['path'] = "at ({},-{})".format(f(xAnchor), f(yAnchor))
+  tikz['geometry'] = ('anchor', xAnchor, yAnchor)
   tikz['opts'] = opts
   return tikz
 
-def processGroup(group):
-  res = []
-
-  for child in group:
-    svg = {'tag': child.tag[28:], 'attrib': child.attrib}
-    match child.tag:
-      # does not seem very resilient ? is this particular xmlns required? 
-      case '{http://www.w3.org/2000/svg}g': 
-        res += processGroup(child)
-
-      case '{http://www.w3.org/2000/svg}rect':
-        res.append({'tikz': processRect(child), 'svg': svg})
-
-      case '{http://www.w3.org/2000/svg}path':
-        res.append({'tikz': processPath(child), 'svg': svg})
-
-      case '{http://www.w3.org/2000/svg}switch':
-        res.append(processSwitch(child))
-
-      case '{http://www.w3.org/2000/svg}ellipse':
-        res.append({'tikz': processEllipse(child), 'svg': svg})
-
-      case '{http://www.w3.org/2000/svg}image':
-        res.append({'tikz': processImage(child), 'svg': svg})
-
-      case '{http://www.w3.org/2000/svg}text':
-        res.append({'tikz': processSVGText(child, group.attrib), 'svg': svg})
-
-      case other:
-        print("Cannot process :" + child.tag)
-  
+FRAGMENT_TAGS = [
+  '{http://www.w3.org/2000/svg}rect',
+  '{http://www.w3.org/2000/svg}path',
+  '{http://www.w3.org/2000/svg}switch',
+  '{http://www.w3.org/2000/svg}ellipse',
+  '{http://www.w3.org/2000/svg}text'
+] # images are excluded: their conversion has side effects on the dependency directory
+
+def processElement(child, group):
+  ctx = context.get()
+  if ctx.profile is not None and child.tag != SVG_GROUP:
+    # time per tag (groups are only the sum of their elements)
+    with ctx.profile.element(child.tag[28:]):
+      return convertCachedElement(ctx, child, group)
+  return convertCachedElement(ctx, child, group)
+
+def convertCachedElement(ctx, child, group):
+  # optional fragments.FragmentCache of the current conversion, set by the pipeline
+  if ctx.fragments is not None and child.tag in FRAGMENT_TAGS:
+    return ctx.fragments.process(child, group, convertElement)
+  return convertElement(child, group)
+
+def convertElement(child, group):
+  svg = {'tag': child.tag[28:], 'attrib': child.attrib}
+  match child.tag:
+    # does not seem very resilient ? is this particular xmlns required? 
+    case '{http://www.w3.org/2000/svg}g': 
+      return processGroup(child)
+
+    case '{http://www.w3.org/2000/svg}rect':
+      return [{'tikz': processRect(child), 'svg': svg}]
+
+    case '{http://www.w3.org/2000/svg}path':
+      return [{'tikz': processPath(child), 'svg': svg}]
+
+    case '{http://www.w3.org/2000/svg}switch':
+      return [processSwitch(child)]
+
+    case '{http://www.w3.org/2000/svg}ellipse':
+      return [{'tikz': processEllipse(child), 'svg': svg}]
+
+    case '{http://www.w3.org/2000/svg}image':
+      return [{'tikz': processImage(child), 'svg': svg}]
+
+    case '{http://www.w3.org/2000/svg}text':
+      return [{'tikz': processSVGText(child, group.attrib), 'svg': svg}]
+
+    case other:
+      diagnostics.warn('svg.element', "Cannot process: {}", child.tag)
+      return []
+
+def applyGroupAttributes(group, res):
   if 'transform' in group.attrib:
     # print("Found some transform for current group: {}".format(group.attrib['transform']))
     for r in res:
@@ -645,4 +631,75 @@ def processGroup(group):
     for r in res:
       r['tikz']['opts']['opacity'] = group.attrib['opacity']
 
+def processGroup(group):
+  res = []
+
+  for child in group:
+    res += processElement(child, group)
+  
+  applyGroupAttributes(group, res)
   return res
+
+def iterChunks(txt, size=1 << 16):
+  for start in range(0, len(txt), size):
+    yield txt[start:start + size]
+
+SVG_GROUP='{http://www.w3.org/2000/svg}g'
+def streamSVG(source, onContent=None):
+  """ Incremental equivalent of processGroup(root[1]) based on iterparse
+  Each element of the main group is converted as soon as it is closed, and then released from the tree
+  (the tree of the document is never kept in memory). The drawio `content` attribute is removed from the root
+  and returned as a stream of chunks (or None if missing), with the other root attributes
+  onContent is called with this stream as soon as the root is opened, to consume it during the parsing
+  NB: iterparse builds the whole attribute value before the root is opened: the quoted content is held in
+  memory once (and released with the stream), only its decoding is incremental (see mxfile.iterCells)
+  """
+  content = None
+  rootAttrib = {}
+  stack = []  # currently opened elements
+  frames = [] # (group, res) for each opened group of the main group
+  res = []
+  rootIndex = 0
+  for event, elem in xml.iterparse(source, events=('start', 'end')):
+    if event == 'start':
+      if not stack:
+        # root format of drawio-generated svgs: see svg2tikz.main
+        if 'content' in elem.attrib:
+          content = iterChunks(elem.attrib.pop('content'))
+          if onContent:
+            onContent(content)
+        rootAttrib = dict(elem.attrib)
+      elif len(stack) == 1:
+        rootIndex += 1
+        if rootIndex == 2 and elem.tag == SVG_GROUP: # select the first group
+          frames.append((elem, []))
+      elif elem.tag == SVG_GROUP and frames and stack[-1] is frames[-1][0]:
+        frames.append((elem, []))
+      stack.append(elem)
+      continue
+
+    stack.pop()
+    if not stack:
+      break
+    parent = stack[-1]
+    if frames and frames[-1][0] is elem:
+      (group, groupRes) = frames.pop()
+      applyGroupAttributes(group, groupRes)
+      if frames:
+        frames[-1][1].extend(groupRes)
+      else:
+        res = groupRes
+    elif frames and frames[-1][0] is parent:
+      entries = processElement(elem, parent)
+      for entry in entries:
+        # keep a detached copy of the attributes (the element is cleared below), without the embedded data
+        entry['svg']['attrib'] = {k: v for k, v in entry['svg']['attrib'].items() if k != HREF}
+      frames[-1][1].extend(entries)
+    elif len(stack) > 1:
+      # nested in an element processed as a whole (switch, defs...)
+      continue
+    # release the processed subtree
+    elem.clear()
+    parent.remove(elem)
+
+  return (res, content, rootAttrib)
@@ -0,0 +1,82 @@
+from .common import *
+from .config import App
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+#################################
+# VECTORIZED COORDINATES (optional numpy)
+#################################
+# Whole coordinate buffers are transformed and formatted at once when numpy is installed.
+# The result is strictly identical to the scalar functions of common (f, "({},-{})"), which remain the fallback:
+# numbers are rounded on integers (x100) by numpy, then assembled from their integer part and a table of fractions.
+# The few values too close to a rounding tie for the product to be trusted (or not finite, or huge) are formatted by f().
+
+ENABLED = numpy is not None # and VECTORIZE for each conversion
+MIN_SIZE = 64 # below, the overhead of numpy exceeds the gain
+
+# decimal part of f() for each number of hundredths: '', '.01', ... '.1', '.11', ...
+FRACTIONS = [''] + ['.' + '{:02d}'.format(i).rstrip('0') for i in range(1, 100)]
+
+def useNumpy(size):
+  return ENABLED and size >= MIN_SIZE and App.config()['VECTORIZE']
+
+def splitNumbers(values):
+  # f(x) == str(integer) + fraction, except for the returned doubtful indices
+  x = numpy.asarray(values, dtype=numpy.float64)
+  with numpy.errstate(all='ignore'):
+    y = numpy.abs(x) * 100
+    hundredths = numpy.rint(y)
+    doubtful = ~((numpy.abs(y - numpy.floor(y) - 0.5) > y * 1e-15 + 1e-12) & (y < 2.0 ** 52))
+  hundredths = numpy.where(doubtful, 0, hundredths).astype(numpy.int64)
+  (integers, fractions) = numpy.divmod(hundredths, 100)
+  # the sign is carried by the integer part, except below 1 ('%.2f' keeps it even when rounded to zero: f(-0.001) == '-0')
+  negative = numpy.signbit(x)
+  doubtful |= negative & (integers == 0)
+  integers = numpy.where(negative, -integers, integers)
+  return (integers.tolist(), list(map(FRACTIONS.__getitem__, fractions.tolist())), numpy.flatnonzero(doubtful).tolist())
+
+def formatNumbers(values):
+  """ [f(x) for x in values]
+  """
+  if not useNumpy(len(values)):
+    return [f(x) for x in values]
+  (integers, fractions, doubtful) = splitNumbers(values)
+  res = list(map('{}{}'.format, integers, fractions))
+  for i in doubtful:
+    res[i] = f(values[i])
+  return res
+
+def formatPoints(coords):
+  """ tikz points "(x,-y)" of a flat buffer of svg coordinates (y axis inverted)
+  """
+  if not useNumpy(len(coords)):
+    return ["({},-{})".format(f(coords[i]), f(coords[i + 1])) for i in range(0, len(coords) - 1, 2)]
+  (integers, fractions, doubtful) = splitNumbers(coords)
+  res = list(map('({}{},-{}{})'.format, integers[0::2], fractions[0::2], integers[1::2], fractions[1::2]))
+  for i in doubtful:
+    i -= i % 2
+    if i // 2 < len(res):
+      res[i // 2] = "({},-{})".format(f(coords[i]), f(coords[i + 1]))
+  return res
+
+def transformCoords(coords, matrix):
+  """ in place affine transform of a flat buffer array('d') of coordinates, svg matrix(a b c d e f) convention
+  """
+  # m0..m5: a b c d e f (f would shadow the number formatter of common)
+  (m0, m1, m2, m3, m4, m5) = matrix
+  if not useNumpy(len(coords)):
+    for index in range(0, len(coords), 2):
+      x = coords[index]
+      y = coords[index + 1]
+      coords[index] = m0 * x + m2 * y + m4
+      coords[index + 1] = m1 * x + m3 * y + m5
+    return
+  # view on the buffer itself (released on return: the array must stay resizable)
+  view = numpy.frombuffer(coords, dtype=numpy.float64)
+  xs = view[0::2].copy()
+  ys = view[1::2].copy()
+  view[0::2] = m0 * xs + m2 * ys + m4
+  view[1::2] = m1 * xs + m3 * ys + m5
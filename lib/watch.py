@@ -0,0 +1,87 @@
+import io
+import os
+import time
+
+from . import pipeline,fragments,context
+from .common import *
+from .config import App
+
+#################################
+# WATCH MODE: reconversion on save, with warm caches
+#################################
+# The input svg and the config file are polled. On change, the conversion is run again in the same process:
+# config (reloaded only if its file changed), color names, resources and the fragment cache (in memory, persisted
+# if FRAGMENT_CACHE is set) are kept from one conversion to the next. The output is only rewritten when it changed.
+
+def getStamp(path):
+  try:
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+  except OSError:
+    return None
+
+class Watcher(object):
+
+  def __init__(self, configFile, outputFile=None, overrides=None):
+    self.configFile = configFile
+    self.outputFile = outputFile
+    self.overrides = overrides # applied on each reload (e.g. CROP, PAGE of the command line)
+    self.cache = None
+    self.ctx = None
+    self.stamps = None
+
+  def loadConf(self):
+    App.reset()
+    App.loadConf(self.configFile, self.overrides)
+    conf = App.config()
+    if self.outputFile:
+      conf['OUTPUT_FILE'] = self.outputFile
+    # the cache is salted with the config: renewed with it
+    path = pipeline.getFragmentCachePath(conf) if conf['FRAGMENT_CACHE'] else None
+    self.cache = fragments.FragmentCache(path, conf)
+    self.ctx = context.Context(conf)
+
+  def getStamps(self):
+    return (getStamp(self.configFile) if self.configFile else None, getStamp(App.config()['INPUT_FILE']))
+
+  def convert(self):
+    conf = App.config()
+    self.cache.nextRun()
+    output = io.StringIO()
+    pipeline.convert(output, self.cache, self.ctx)
+    if writeIfChanged(conf['OUTPUT_FILE'], output.getvalue()):
+      print("[INFO] Updated {}".format(conf['OUTPUT_FILE']))
+    else:
+      print("[INFO] Unchanged {}".format(conf['OUTPUT_FILE']))
+
+  def step(self):
+    """ Converts again if the input or the config changed since the last conversion, returns True if converted
+    """
+    stamps = self.getStamps()
+    if stamps == self.stamps:
+      return False
+    if self.stamps is None or stamps[0] != self.stamps[0]:
+      self.loadConf()
+      stamps = self.getStamps()
+    self.stamps = stamps
+    if stamps[1] is None:
+      print("[WARN] Waiting for input file {}".format(App.config()['INPUT_FILE']))
+      return False
+    start = time.monotonic()
+    try:
+      self.convert()
+      print("[INFO] Conversion done in {:.2f}s".format(time.monotonic() - start))
+    except Exception as e:
+      # typically a file saved while being read: converted again on the next save
+      print("[ERROR] Conversion failed: {}".format(e))
+    return True
+
+  def run(self, interval):
+    try:
+      self.step()
+      print("[INFO] Watching {} (every {}s, Ctrl-C to stop)".format(App.config()['INPUT_FILE'], interval))
+      while True:
+        time.sleep(interval)
+        self.step()
+    except KeyboardInterrupt:
+      print("[INFO] Stopped watching")
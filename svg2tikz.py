@@ -1,12 +1,11 @@
 #!/usr/bin/env python3
 
-import pprint
-import xml.etree.ElementTree as xml
+import os
+import sys
 import argparse
+import contextlib
 
-from lib import config,svgparser,colors,emitter
-from lib.defs import *
-from lib.mxparser import MxGraph
+from lib import config,context,pipeline,profiling,diagnostics,bounds,batch,watch,daemon,client
 
 #################################
 # MAIN: file processing
@@ -18,61 +17,122 @@ def main():
     description='Convert Drawio-generated SVG files to Tikz Tex'
   )
   parser.add_argument('-c', '--config', required=False)
+  parser.add_argument('-b', '--batch', required=False, metavar='DIR|GLOB',
+    help='convert all the matching svg files with a pool of processes (outputs in OUTPUT_DIR, --crop, --crop-layer and --page apply to all of them)')
+  parser.add_argument('-j', '--jobs', required=False, type=int, default=None,
+    help='number of worker processes in batch mode (default: cpu count)')
+  parser.add_argument('-w', '--watch', required=False, type=float, nargs='?', const=0.5, default=None, metavar='SECONDS',
+    help='convert again whenever the input svg or the config file is saved (polling period, default: 0.5)')
+  parser.add_argument('-d', '--daemon', required=False, nargs='?', const=client.getDefaultSocket(), default=None, metavar='SOCKET',
+    help='serve conversion jobs on a unix socket with a pool of warm workers (see svg2tikzc.py), -j sets the pool size')
+  parser.add_argument('-o', '--output', required=False, metavar='FILE|-',
+    help='output tex file instead of OUTPUT_DIR/OUTPUT_FILENAME, "-" for stdout (messages are then printed on stderr)')
+  parser.add_argument('--crop', required=False, metavar='X,Y,W,H',
+    help='only convert the given region of the figure (svg units): elements outside of it are dropped, the picture is clipped')
+  parser.add_argument('--crop-layer', required=False, metavar='NAME',
+    help='only convert the region covered by the given drawio layer (elements of all the layers are kept)')
+  parser.add_argument('--page', required=False, metavar='NAME|INDEX|all',
+    help='page of the drawio diagram matching the svg (index 1 for the first page), "all" for one output per page')
+  parser.add_argument('-q', '--quiet', action='store_true',
+    help='no messages during the conversion, only the summary of the errors (on stderr)')
+  parser.add_argument('--json', required=False, metavar='FILE',
+    help='write the diagnostics of the conversion (messages aggregated by category) as JSON')
+  parser.add_argument('--profile', required=False, metavar='FILE',
+    help='write a JSON report of the conversion: time per stage and per svg element, counters, peak memory (tracemalloc)')
+  parser.add_argument('--profile-trace', required=False, metavar='FILE',
+    help='with --profile, also write the stages as a Chrome trace (chrome://tracing, ui.perfetto.dev)')
+  parser.add_argument('--cprofile', required=False, metavar='FILE',
+    help='run the conversion under cProfile, stats written to FILE (python3 -m pstats FILE)')
   # FIXME: add options properly to allow a simple "./svg2tikz input [output]" usage
   
   args = parser.parse_args()
-
-  # config load FIXME: should use argparse
-  if args.config:
-    config.App.loadConf(args.config)
-  else:
-    print("Warning: using default config, including path to source and destination")
-
-  conf = config.App.config()
-
-
-  # INITIAL PARSING
-  tree = xml.parse(conf['INPUT_FILE'])
-  root = tree.getroot()
-  # root format of drawio-generated svgs
-  # {http://www.w3.org/2000/svg}defs    => (empty)
-  # {http://www.w3.org/2000/svg}g       => (main group)
-  # {http://www.w3.org/2000/svg}switch  => (disclaimer for edition without support of foreign object)
-  main = root[1] # select the first group
-
-  # MAIN PROCESSING
-  print("[INFO] Parsing SVG file")
-  IR = svgparser.processGroup(main)
-
-  # Re-integrate infos from mxgraph if available
-  # TODO: make this part useful
-  if 'content' in root.attrib:
-    print("[INFO] Attempting to parse original drawio mxfile")
-    mxgraph = MxGraph()
-    mxgraph.parseRaw(root.attrib['content'], App.outputFile('xml'))
-    # align & annotate mxgraph with tikz/svg nodes
-    # (WIP)
-    mxgraph.annotate(IR)
-  else:
-    print("[WARN] Cannot retrieve original drawio diagram source, overlay specs won't be matched.")
-
-  print("[INFO] Starting tikz emission")
-  tikz = emitter.emitTikz(IR)
-
-  # OUTPUT FORMATTING
-  tex = TIKZ_START() + '\n' + tikz + '\n' + TIKZ_END 
-
-  if not conf['NO_COLOR_DEFS']:
-    tex = '\n'.join(colors.getColorDefs()) + '\n' + tex
-  if conf['STANDALONE_TEX']:
-    if conf['STANDALONE_IS_BEAMER']:
-      tex = '\documentclass{beamer}\n' + PREAMBLE + '\n\\begin{frame}\n' + tex + '\n\end{frame}\n' + FOOTER
-    else:  
-      tex = '\documentclass{standalone}\n' + PREAMBLE + '\n' + tex + '\n' + FOOTER
-
-  # WRITE RESULT TO FILE
-  with open(conf['OUTPUT_FILE'], 'w') as tikz:
-    tikz.write(tex)
+  if args.profile_trace and not args.profile:
+    parser.error("--profile-trace requires --profile")
+  if args.crop:
+    try:
+      bounds.parseRegion(args.crop)
+    except ValueError as e:
+      parser.error("--crop: {}".format(e))
+
+  overrides = {}
+  if args.crop:
+    overrides['CROP'] = args.crop
+  if args.crop_layer:
+    overrides['CROP_LAYER'] = args.crop_layer
+  if args.page:
+    overrides['PAGE'] = args.page
+
+  # options reporting on a single conversion
+  reporting = [name for (name, value) in (('--quiet', args.quiet), ('--json', args.json), ('--profile', args.profile),
+    ('--cprofile', args.cprofile)) if value]
+
+  if args.page == 'all' and (args.output or args.batch or args.watch is not None or args.daemon):
+    parser.error("one output per page: --page all cannot be combined with --output, --batch, --watch or --daemon")
+
+  if args.batch:
+    if reporting:
+      parser.error("{} cannot be combined with --batch".format(', '.join(reporting)))
+    failures = batch.runBatch(args.batch, args.config, args.jobs, overrides)
+    sys.exit(1 if failures else 0)
+
+  if args.daemon:
+    # jobs carry their own overrides (svg2tikzc.py -D) and report through their responses
+    ignored = [name for (name, value) in (('--crop', args.crop), ('--crop-layer', args.crop_layer), ('--page', args.page),
+      ('--output', args.output)) if value] + reporting
+    if ignored:
+      parser.error("{} cannot be combined with --daemon".format(', '.join(ignored)))
+    sys.exit(0 if daemon.serve(args.daemon, args.config, args.jobs) else 1)
+
+  if args.watch is not None:
+    if args.output == '-':
+      parser.error("--watch requires an output file")
+    if reporting:
+      parser.error("{} cannot be combined with --watch".format(', '.join(reporting)))
+    watch.Watcher(args.config, args.output, overrides).run(args.watch)
+    return
+
+  # with "-o -", stdout only carries the tex output: messages are printed on stderr
+  output = sys.stdout if args.output == '-' else None
+  quiet = open(os.devnull, 'w') if args.quiet else None
+  with contextlib.redirect_stdout(quiet or (sys.stderr if output else sys.stdout)):
+    profile = profiling.Profile() if args.profile else None
+    # config load FIXME: should use argparse
+    with profile.stage('config') if profile else profiling.NO_STAGE:
+      if args.config:
+        config.App.loadConf(args.config)
+      else:
+        print("Warning: using default config, including path to source and destination")
+    config.App.config().update(overrides)
+    conf = config.App.config()
+    if conf['PAGE'] == 'all':
+      # one output per page (--page all, or PAGE of the config)
+      if args.output:
+        parser.error("one output per page: PAGE all cannot be combined with --output")
+      failures = batch.runPages(args.config, args.jobs, overrides, conf)
+      sys.exit(1 if failures else 0)
+    if conf['PAGE'] and not batch.checkPage(conf['INPUT_FILE'], conf['PAGE']):
+      sys.exit(1)
+    if args.output and not output:
+      conf['OUTPUT_FILE'] = args.output
+
+    ctx = context.Context(config.App.config())
+    ctx.profile = profile
+    profiling.runProfiled(lambda: pipeline.convert(output, ctx=ctx), args.cprofile)
+
+    if args.quiet:
+      ctx.diagnostics.printSummary(diagnostics.ERROR, file=sys.stderr)
+    if args.json:
+      ctx.diagnostics.writeReport(args.json)
+      print("[INFO] Diagnostics written to {}".format(args.json))
+
+    if profile:
+      profile.finish()
+      print(profile.summary())
+      profile.writeReport(args.profile)
+      print("[INFO] Profile written to {}".format(args.profile))
+      if args.profile_trace:
+        profile.writeTrace(args.profile_trace)
+        print("[INFO] Chrome trace written to {}".format(args.profile_trace))
 
 
 if __name__ == "__main__":
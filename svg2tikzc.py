@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+import sys
+import argparse
+
+from lib import client
+
+#################################
+# MAIN: thin client of the conversion daemon (svg2tikz.py --daemon)
+#################################
+def main():
+
+  parser = argparse.ArgumentParser(
+    prog='svg2tikzc',
+    description='Convert a Drawio-generated SVG file with a running svg2tikz daemon'
+  )
+  parser.add_argument('input', nargs='?')
+  parser.add_argument('-s', '--socket', required=False, default=client.getDefaultSocket())
+  parser.add_argument('-c', '--config', required=False,
+    help='config file of the job (default: config of the daemon)')
+  parser.add_argument('-o', '--output', required=False, metavar='FILE|-',
+    help='output tex file, "-" for stdout (default: OUTPUT_DIR of the config, named after the input)')
+  parser.add_argument('-D', '--set', required=False, action='append', default=[], metavar='KEY=VALUE',
+    help='config override (value parsed as JSON when possible), can be repeated')
+  parser.add_argument('-v', '--verbose', action='store_true',
+    help='print the conversion messages on stderr')
+  parser.add_argument('--ping', action='store_true')
+  parser.add_argument('--shutdown', action='store_true')
+
+  args = parser.parse_args()
+
+  try:
+    if args.ping or args.shutdown:
+      res = client.request(args.socket, {'cmd': 'shutdown' if args.shutdown else 'ping'})
+      sys.exit(0 if res['ok'] else 1)
+    if not args.input:
+      parser.error("an input file is required")
+
+    overrides = dict(client.parseOverride(d) for d in args.set)
+    output = None if args.output == '-' else args.output
+    res = client.request(args.socket, client.getJob(args.input, args.config, overrides, output, args.output == '-'))
+  except OSError as e:
+    print("[ERROR] Unable to reach the daemon on {}: {}".format(args.socket, e), file=sys.stderr)
+    sys.exit(2)
+
+  if args.verbose or not res['ok']:
+    sys.stderr.write(res['log'])
+  if not res['ok']:
+    print("[ERROR] {}".format(res['error']), file=sys.stderr)
+    sys.exit(1)
+  if res['tex'] is not None:
+    sys.stdout.write(res['tex'])
+  elif args.verbose:
+    print("[INFO] Output written to {}".format(res['output']), file=sys.stderr)
+
+
+if __name__ == "__main__":
+  main()
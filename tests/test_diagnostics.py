@@ -0,0 +1,30 @@
+import io
+
+from lib import diagnostics
+
+def test_messages_sharing_category_and_args():
+  # a warning and an error of the same category, without args: two entries, the error is kept in the summary
+  collector = diagnostics.Diagnostics('debug')
+  collector.add(diagnostics.WARN, 'svg.path', "Attempting to close a path without previous points", ())
+  collector.add(diagnostics.ERROR, 'svg.path', "Draw commands requires a first move to initialize the path", ())
+  collector.add(diagnostics.ERROR, 'svg.path', "Draw commands requires a first move to initialize the path", ())
+
+  report = collector.getReport()['svg.path']
+  assert report['level'] == 'error'
+  assert report['distinct'] == 2
+  assert report['count'] == 3
+  levels = {item['message']: (item['level'], item['count']) for item in report['messages']}
+  assert levels["Attempting to close a path without previous points"] == ('warn', 1)
+  assert levels["Draw commands requires a first move to initialize the path"] == ('error', 2)
+
+  out = io.StringIO()
+  collector.printSummary(diagnostics.ERROR, file=out)
+  assert "Draw commands requires a first move" in out.getvalue()
+
+def test_highest_level_of_an_entry():
+  collector = diagnostics.Diagnostics('debug')
+  collector.add(diagnostics.WARN, 'svg.transform', "Ignored transform: {}", ('skewX(3)',))
+  collector.add(diagnostics.ERROR, 'svg.transform', "Ignored transform: {}", ('skewX(3)',))
+  report = collector.getReport()['svg.transform']
+  assert report['level'] == 'error'
+  assert report['messages'] == [{'level': 'error', 'message': "Ignored transform: skewX(3)", 'count': 2}]